@@ -150,7 +150,12 @@ def delete_mission(req: gr.Request, mission):
     
     # 检查running列表中的任务
     for running_mission in manager.running[:]:  # 使用副本避免修改迭代中的列表
-        if running_mission.mission_dir == str(mission_dir):
+        if str(mission_dir) in running_mission.batch_mission_dirs and manager.cancel_batch_member(running_mission, str(mission_dir)):
+            # 批量任务中只取消这个任务，其余任务继续执行
+            mission_terminated = True
+            print(f"已取消批量任务中的任务: {mission}")
+            continue
+        if running_mission.mission_dir == str(mission_dir) or str(mission_dir) in running_mission.batch_mission_dirs:
             # 找到正在运行的任务，强制终止
             if running_mission.executor and running_mission.executor.process:
                 try:
@@ -159,16 +164,17 @@ def delete_mission(req: gr.Request, mission):
                 except Exception as e:
                     print(f"终止任务进程时出错: {e}")
             
-            # 更新任务状态
-            running_mission.running = False
-            running_mission.state = 'terminated'
-            try:
-                running_mission.write()
-            except:
-                pass  # 如果任务目录已删除，写入可能失败
+            # 更新任务状态（批量任务的所有成员一起终止）
+            for terminated_mission in running_mission.batch_members or [running_mission]:
+                terminated_mission.running = False
+                terminated_mission.state = 'terminated'
+                try:
+                    terminated_mission.write()
+                except:
+                    pass  # 如果任务目录已删除，写入可能失败
             
             # 从running列表中移除
-            manager.running.remove(running_mission)
+            manager.remove_running(running_mission)
             mission_terminated = True
             print(f"已从运行队列中移除任务: {mission}")
     
@@ -6,12 +6,13 @@ class CommandExecutor:
     def __init__(self):
         self.process = None
 
-    def execute_command(self, run_cmd, stdout=None):
+    def execute_command(self, run_cmd, stdout=None, env=None):
         if self.process and self.process.poll() is None:
             print("The command is already running. Please wait for it to finish.")
         else:
             self.process = subprocess.Popen(run_cmd,
                                             stdout=stdout,
+                                            env=env,
                                             shell=True)
 
     def kill_command(self):
@@ -2,11 +2,13 @@ import _thread
 import time
 import os
 import json
-import scripts.preset_infer_cli as cli
 from utils.constant import *
 from pathlib import Path
 from clientui.class_command_executor import CommandExecutor
 from clientui.task_progress import task_progress
+from clientui.progress_events import start_aggregator
+from clientui.scheduler import MissionScheduler
+from clientui.worker_pool import WorkerPool
 
 try:
     import psutil
@@ -36,6 +38,7 @@ class Mission:
         self.input_dir = ''
         self.input_dirs = []  # 批量处理时的输入目录列表
         self.batch_mission_dirs = []  # 批量处理时对应的任务目录列表（用于删除/终止定位）
+        self.batch_members = []  # 批量处理时合并进来的原始任务，各自维护进度和状态
         self.output_dir = ''
         self.preset_name = ''
         self.output_format = 'wav'
@@ -149,6 +152,12 @@ class Manager:
         self.thread_count = read_thread_count()
         self.batch_mode = False  # 默认关闭批量处理模式，启用真正的多线程
         self.force_batch_mode = False  # 添加强制批量模式选项
+        # 推理进程通过进度事件上报进度，启动失败时回退到扫描目录
+        self.progress_events = start_aggregator(task_progress)
+        # 按每个预设的模型和峰值内存把任务放到GPU/CPU槽位上，thread_count 只作为并发上限
+        self.scheduler = MissionScheduler()
+        # 任务交给常驻推理进程执行，模型在任务之间保持缓存；MSST_WORKER_POOL=0 时每个任务启动一个新进程
+        self.workers = WorkerPool(self.scheduler) if os.environ.get("MSST_WORKER_POOL", "1") != "0" else None
 
         _thread.start_new_thread(self.loop, ())
 
@@ -166,6 +175,8 @@ class Manager:
             
             # 初始化进度追踪，传入预设名称以支持多步骤进度
             task_progress.init_progress(mission.mission_dir, mission.input_dir, mission.preset_name)
+            if self.progress_events:
+                task_progress.track(mission.mission_dir)
         
         # 检查输入目录是否直接包含音频文件
         has_audio_files = False
@@ -235,6 +246,8 @@ class Manager:
     def loop(self):
         while True:
             start = time.time()
+            if self.workers:
+                self.workers.reap()
             self.check()
             current = time.time()
             interval = 2 + start - current
@@ -283,83 +296,19 @@ class Manager:
                         process_ended = True
                         print(f"调试信息 - 任务 executor 为 None，标记为已结束: {mission.input_dir}")
             
-            # 检查是否为批量任务
-            is_batch_task = False
-            expected_file_count = 1
-            
-            # 对于上传下载方式，检查inputs目录中的子目录数量
-            if mission.mission_dir:
-                inputs_dir = os.path.join(mission.mission_dir, 'inputs')
-                if os.path.exists(inputs_dir):
-                    subdirs = [d for d in os.listdir(inputs_dir) 
-                              if os.path.isdir(os.path.join(inputs_dir, d))]
-                    if len(subdirs) > 1:
-                        is_batch_task = True
-                        expected_file_count = len(subdirs)
-            
-            # 如果不是上传下载方式，检查原始输入目录
-            if not is_batch_task and mission.input_dir and os.path.exists(mission.input_dir):
-                audio_files = [f for f in os.listdir(mission.input_dir) 
-                             if os.path.isfile(os.path.join(mission.input_dir, f)) and 
-                             f.lower().endswith(('.wav', '.flac', '.mp3', '.m4a', '.aac', '.ogg'))]
-                if len(audio_files) > 1:
-                    is_batch_task = True
-                    expected_file_count = len(audio_files)
-            
-            # 检查输出目录中是否有文件 - 用于跟踪进度
-            processed_files = 0
-            processed_songs = 0
-            output_files = []
-            
-            # 检查主输出目录
-            if mission.output_dir and os.path.exists(mission.output_dir):
-                output_files.extend([f for f in os.listdir(mission.output_dir) 
-                                   if f.lower().endswith(('.wav', '.flac', '.mp3'))])
-            
-            # 检查批量输出目录（batch_output）
-            if mission.mission_dir:
-                batch_output_dir = os.path.join(mission.mission_dir, 'batch_output')
-                if os.path.exists(batch_output_dir):
-                    batch_files = [f for f in os.listdir(batch_output_dir) 
-                                 if f.lower().endswith(('.wav', '.flac', '.mp3'))]
-                    output_files.extend(batch_files)
-                    print(f"调试信息 - 检测到批量输出文件: {batch_output_dir}, 文件数: {len(batch_files)}")
-            
-            # 对于上传下载方式，还需要检查子任务的输出目录
-            if mission.mission_dir:
-                inputs_dir = os.path.join(mission.mission_dir, 'inputs')
-                if os.path.exists(inputs_dir):
-                    for subdir_name in os.listdir(inputs_dir):
-                        subdir_path = os.path.join(inputs_dir, subdir_name)
-                        if os.path.isdir(subdir_path):
-                            sub_outputs_dir = os.path.join(subdir_path, 'outputs')
-                            if os.path.exists(sub_outputs_dir):
-                                sub_files = [f for f in os.listdir(sub_outputs_dir) 
-                                           if f.lower().endswith(('.wav', '.flac', '.mp3'))]
-                                output_files.extend(sub_files)
-                                if sub_files:
-                                    print(f"调试信息 - 检测到子任务输出文件: {sub_outputs_dir}, 文件数: {len(sub_files)}")
-            
-            processed_files = len(output_files)
-            
-            # 计算每首歌生成的输出文件数量
-            outputs_per_song = 1
-            if mission.mission_dir:
-                try:
-                    from clientui.task_progress import task_progress
-                    outputs_per_song = task_progress._get_outputs_per_song(mission.mission_dir)
-                except:
-                    pass
-            
-            # 根据输出文件数计算已处理的歌曲数
-            if outputs_per_song > 0:
-                processed_songs = processed_files // outputs_per_song
-                # 确保已处理歌曲数不超过总歌曲数
-                processed_songs = min(processed_songs, expected_file_count)
+            if mission.batch_members:
+                self._check_batch(mission, process_ended)
+                continue
+
+            if not mission.input_dirs and mission.mission_dir and task_progress.is_tracked(mission.mission_dir):
+                # 进度由推理进程发送的进度事件维护，不再扫描输入/输出目录
+                is_batch_task, expected_file_count, output_count, processed_songs = self._event_progress(mission)
+            else:
+                is_batch_task, expected_file_count, output_count, processed_songs = self._scan_progress(mission)
             
-            if output_files:
+            if output_count:
                 # 有输出文件，说明任务已经完成部分或全部
-                print(f"调试信息 - 检测到输出文件: {mission.output_dir}, 文件数: {len(output_files)}, 处理歌曲数: {processed_songs}, 预期: {expected_file_count}")
+                print(f"调试信息 - 检测到输出文件: {mission.output_dir}, 文件数: {output_count}, 处理歌曲数: {processed_songs}, 预期: {expected_file_count}")
                 
                 # 检查是否所有文件都已处理完成
                 all_files_processed = processed_songs >= expected_file_count
@@ -388,20 +337,24 @@ class Manager:
                     # 如果任务完成，添加结束时间
                     if end_time:
                         update_data['end_time'] = end_time
-                        
-                    task_progress.update_progress(mission.mission_dir, update_data)
                     
-                    # 同时更新mission.json文件中的状态
-                    try:
-                        mission_json = os.path.join(mission.mission_dir, 'mission.json')
-                        if os.path.exists(mission_json):
-                            with open(mission_json, 'r', encoding='utf-8') as f:
-                                mission_info = json.load(f)
-                            mission_info['state'] = status
-                            with open(mission_json, 'w', encoding='utf-8') as f:
-                                json.dump(mission_info, f, indent=4, ensure_ascii=False)
-                    except Exception as e:
-                        print(f"更新mission.json状态时出错: {e}")
+                    # 进度没有变化时不重复写 progress.json 和 mission.json
+                    current_progress = task_progress.get_progress(mission.mission_dir) or {}
+                    changed = any(current_progress.get(k) != v for k, v in update_data.items() if k != 'end_time')
+                    if changed:
+                        task_progress.update_progress(mission.mission_dir, update_data)
+                        
+                        # 同时更新mission.json文件中的状态
+                        try:
+                            mission_json = os.path.join(mission.mission_dir, 'mission.json')
+                            if os.path.exists(mission_json):
+                                with open(mission_json, 'r', encoding='utf-8') as f:
+                                    mission_info = json.load(f)
+                                mission_info['state'] = status
+                                with open(mission_json, 'w', encoding='utf-8') as f:
+                                    json.dump(mission_info, f, indent=4, ensure_ascii=False)
+                        except Exception as e:
+                            print(f"更新mission.json状态时出错: {e}")
             
             # 如果所有文件都已处理完成，即使进程还没结束，也结束任务
             # 或者进程已结束时，结束任务
@@ -417,7 +370,7 @@ class Manager:
                 should_end_task = True
                 print(f"调试信息 - ✅ 进程已结束，准备结束任务")
                 # 如果进程结束但没有输出文件，也结束任务（可能是所有文件都被跳过）
-                if not output_files and expected_file_count > 0:
+                if not output_count and expected_file_count > 0:
                     print(f"调试信息 - ⚠️  进程已结束但没有输出文件，可能是所有文件都被跳过，结束任务")
             
             if should_end_task:
@@ -449,7 +402,7 @@ class Manager:
                     mission.write()
                 except:
                     pass  # 如果任务目录已删除，写入可能失败
-                self.running.remove(mission)
+                self.remove_running(mission)
                 print(f"调试信息 - ✅ 任务已从运行队列移除: {mission.input_dir}")
 
         # 清理无效任务（僵尸任务）
@@ -460,10 +413,98 @@ class Manager:
         while len(self.running) < self.thread_count and goon:
             goon = self.start_nxt_if_available()
 
+    def _event_progress(self, mission):
+        """从进度事件维护的内存状态获取任务进度，返回 (是否批量, 预期歌曲数, 输出数量, 已处理歌曲数)"""
+        progress_info = task_progress.get_progress(mission.mission_dir) or {}
+        expected_file_count = max(1, progress_info.get('total_files', 0) or 0)
+        processed_songs = min(progress_info.get('processed_files', 0) or 0, expected_file_count)
+        return expected_file_count > 1, expected_file_count, processed_songs, processed_songs
+
+    def _scan_progress(self, mission):
+        """扫描输入/输出目录推断任务进度（没有进度事件时使用），返回 (是否批量, 预期歌曲数, 输出文件数, 已处理歌曲数)"""
+        # 检查是否为批量任务
+        is_batch_task = False
+        expected_file_count = 1
+        
+        # 对于上传下载方式，检查inputs目录中的子目录数量
+        if mission.mission_dir:
+            inputs_dir = os.path.join(mission.mission_dir, 'inputs')
+            if os.path.exists(inputs_dir):
+                subdirs = [d for d in os.listdir(inputs_dir) 
+                          if os.path.isdir(os.path.join(inputs_dir, d))]
+                if len(subdirs) > 1:
+                    is_batch_task = True
+                    expected_file_count = len(subdirs)
+        
+        # 如果不是上传下载方式，检查原始输入目录
+        if not is_batch_task and mission.input_dir and os.path.exists(mission.input_dir):
+            audio_files = [f for f in os.listdir(mission.input_dir) 
+                         if os.path.isfile(os.path.join(mission.input_dir, f)) and 
+                         f.lower().endswith(('.wav', '.flac', '.mp3', '.m4a', '.aac', '.ogg'))]
+            if len(audio_files) > 1:
+                is_batch_task = True
+                expected_file_count = len(audio_files)
+        
+        # 检查输出目录中是否有文件 - 用于跟踪进度
+        processed_files = 0
+        processed_songs = 0
+        output_files = []
+        
+        # 检查主输出目录
+        if mission.output_dir and os.path.exists(mission.output_dir):
+            output_files.extend([f for f in os.listdir(mission.output_dir) 
+                               if f.lower().endswith(('.wav', '.flac', '.mp3'))])
+        
+        # 检查批量输出目录（batch_output）
+        if mission.mission_dir:
+            batch_output_dir = os.path.join(mission.mission_dir, 'batch_output')
+            if os.path.exists(batch_output_dir):
+                batch_files = [f for f in os.listdir(batch_output_dir) 
+                             if f.lower().endswith(('.wav', '.flac', '.mp3'))]
+                output_files.extend(batch_files)
+                print(f"调试信息 - 检测到批量输出文件: {batch_output_dir}, 文件数: {len(batch_files)}")
+        
+        # 对于上传下载方式，还需要检查子任务的输出目录
+        if mission.mission_dir:
+            inputs_dir = os.path.join(mission.mission_dir, 'inputs')
+            if os.path.exists(inputs_dir):
+                for subdir_name in os.listdir(inputs_dir):
+                    subdir_path = os.path.join(inputs_dir, subdir_name)
+                    if os.path.isdir(subdir_path):
+                        sub_outputs_dir = os.path.join(subdir_path, 'outputs')
+                        if os.path.exists(sub_outputs_dir):
+                            sub_files = [f for f in os.listdir(sub_outputs_dir) 
+                                       if f.lower().endswith(('.wav', '.flac', '.mp3'))]
+                            output_files.extend(sub_files)
+                            if sub_files:
+                                print(f"调试信息 - 检测到子任务输出文件: {sub_outputs_dir}, 文件数: {len(sub_files)}")
+        
+        processed_files = len(output_files)
+        
+        # 计算每首歌生成的输出文件数量
+        outputs_per_song = 1
+        if mission.mission_dir:
+            try:
+                from clientui.task_progress import task_progress
+                outputs_per_song = task_progress._get_outputs_per_song(mission.mission_dir)
+            except:
+                pass
+        
+        # 根据输出文件数计算已处理的歌曲数
+        if outputs_per_song > 0:
+            processed_songs = processed_files // outputs_per_song
+            # 确保已处理歌曲数不超过总歌曲数
+            processed_songs = min(processed_songs, expected_file_count)
+
+        return is_batch_task, expected_file_count, len(output_files), processed_songs
+
     def _cleanup_invalid_tasks(self):
         """清理无效任务（僵尸任务）"""
         invalid_tasks = []
         for mission in self.running[:]:
+            if mission.batch_members:
+                # 批量任务由 _check_batch 按成员分别结束
+                continue
             is_invalid = False
             invalid_reason = ""
             
@@ -518,7 +559,7 @@ class Manager:
                     except:
                         pass
                 
-                self.running.remove(mission)
+                self.remove_running(mission)
                 print(f"调试信息 - ✅ 已清理无效任务: {mission.input_dir}")
             except ValueError:
                 # 任务可能已经被其他线程移除
@@ -529,6 +570,63 @@ class Manager:
         if invalid_tasks:
             print(f"调试信息 - 📊 共清理了 {len(invalid_tasks)} 个无效任务，当前运行任务数: {len(self.running)}")
 
+    def _check_batch(self, batch_mission, process_ended):
+        """批量任务：分别更新每个成员任务的进度和状态，进程结束后整个批量任务结束"""
+        exit_code = None
+        if batch_mission.executor and batch_mission.executor.process:
+            exit_code = batch_mission.executor.process.poll()
+
+        for member in batch_mission.batch_members:
+            if member.state != 'running':
+                continue
+            if member.mission_dir and task_progress.is_tracked(member.mission_dir):
+                _, expected_file_count, _, processed_songs = self._event_progress(member)
+            else:
+                _, expected_file_count, _, processed_songs = self._scan_progress(member)
+
+            if processed_songs >= expected_file_count or process_ended:
+                member.state = 'completed' if processed_songs >= expected_file_count or exit_code == 0 else 'failed'
+                member.running = False
+                member.update_progress(status=member.state, processed_files=processed_songs, total_files=expected_file_count)
+                try:
+                    member.write()
+                except:
+                    pass  # 如果任务目录已删除，写入可能失败
+                print(f"调试信息 - 批量成员任务结束: {member.input_dir}, 状态: {member.state}, 已处理 {processed_songs}/{expected_file_count} 首歌曲")
+            else:
+                current_progress = task_progress.get_progress(member.mission_dir) or {}
+                if current_progress.get('processed_files') != processed_songs:
+                    member.update_progress(processed_files=processed_songs, total_files=expected_file_count)
+
+        if process_ended:
+            batch_mission.running = False
+            batch_mission.state = 'completed' if exit_code == 0 else 'failed'
+            self.remove_running(batch_mission)
+            print(f"调试信息 - ✅ 批量任务已从运行队列移除: {len(batch_mission.batch_members)} 个任务, exit_code={exit_code}")
+
+    def cancel_batch_member(self, batch_mission, mission_dir):
+        """只取消批量任务中属于 mission_dir 的成员，其余成员继续执行
+        执行方式不支持单独取消、或者所有成员都被取消时返回False，由调用方终止整个批量任务
+        """
+        members = [m for m in batch_mission.batch_members if m.mission_dir == mission_dir]
+        remaining = [m for m in batch_mission.batch_members if m.mission_dir != mission_dir]
+        if not members or not remaining or not hasattr(batch_mission.executor, 'cancel'):
+            return False
+        for member in members:
+            batch_mission.executor.cancel(member.input_dir)
+            member.running = False
+            member.state = 'terminated'
+        batch_mission.batch_members = remaining
+        if mission_dir in batch_mission.batch_mission_dirs:
+            batch_mission.batch_mission_dirs.remove(mission_dir)
+        print(f"调试信息 - 已取消批量任务中的 {len(members)} 个任务: {mission_dir}")
+        return True
+
+    def remove_running(self, mission):
+        """从运行队列移除任务并释放调度器为它预留的设备内存"""
+        self.running.remove(mission)
+        self.scheduler.release(mission)
+
     def start_nxt_if_available(self):
         if len(self.missions) == 0:
             return False
@@ -544,8 +642,22 @@ class Manager:
         if len(self.missions) == 0:
             return False
             
-        first: Mission = self.missions[0]
-        print(f"调试信息 - 🚀 开始处理单个任务: {first.input_dir}")
+        # 按队列顺序选择第一个能放进某个设备预算的任务，放不下的任务继续排队
+        first: Mission | None = None
+        device = None
+        for mission in self.missions:
+            device = self.scheduler.place(mission)
+            if device:
+                first = mission
+                break
+        if first is None:
+            print(f"调试信息 - 调度器: 没有设备满足 {len(self.missions)} 个等待任务的内存预算，继续排队")
+            # 空闲的常驻推理进程仍占用内存，回收一个后下一轮重试
+            if self.workers:
+                self.workers.evict_idle()
+            return False
+
+        print(f"调试信息 - 🚀 开始处理单个任务: {first.input_dir}, 设备: {device}")
         print(f"调试信息 - 当前运行任务数: {len(self.running)}/{self.thread_count}")
         print(f"调试信息 - 等待队列任务数: {len(self.missions)}")
         
@@ -581,7 +693,11 @@ class Manager:
         print(f"调试信息 - 预设路径: {preset_path}")
         
         try:
-            first.executor.execute_command(cmd_parts)
+            if self.workers:
+                first.executor = self.workers.submit(device, first.preset_name, preset_path, [first.input_dir],
+                                                     first.output_dir, first.output_format, debug=first.debug)
+            else:
+                first.executor.execute_command(cmd_parts, env=self.scheduler.get_env(device))
             first.running = True
             first.state = 'running'
             # 记录处理开始时间
@@ -594,7 +710,7 @@ class Manager:
             print(f"调试信息 - ❌ 命令执行失败: {e}")
             # 如果启动失败，从 running 列表中移除
             if first in self.running:
-                self.running.remove(first)
+                self.remove_running(first)
             import traceback
             traceback.print_exc()
             return False
@@ -629,8 +745,17 @@ class Manager:
             for m in batch_missions
             if getattr(m, "output_file", None) is not None or getattr(m, "mission_dir", "")
         ]
-        batch_mission.output_dir = os.path.join(os.path.dirname(first_mission.output_dir), "batch_output")
-        batch_mission.mission_dir = os.path.dirname(first_mission.output_file)
+        batch_mission.batch_members = batch_missions
+        # 每个任务的结果写入自己的输出目录，进度和状态由各个成员任务分别维护
+        batch_mission.output_dir = first_mission.output_dir
+        batch_mission.mission_dir = ''
+
+        device = self.scheduler.place(batch_mission)
+        if not device:
+            print(f"调试信息 - 调度器: 没有设备满足批量任务的内存预算，继续排队")
+            if self.workers:
+                self.workers.evict_idle()
+            return False
         
         # 从队列中移除已收集的任务
         for mission in batch_missions:
@@ -653,13 +778,12 @@ class Manager:
             str(script),
             "--batch",
             "-p", str(preset_path),
-            "-o", str(batch_mission.output_dir),
             "-f", str(batch_mission.output_format),
         ]
         
-        # 添加输入目录列表
-        for input_dir in batch_mission.input_dirs:
-            cmd_parts.extend(["-i", str(input_dir)])
+        # 添加输入目录列表和对应的输出目录
+        for mission in batch_missions:
+            cmd_parts.extend(["-i", str(mission.input_dir), "-o", str(mission.output_dir)])
         
         # 只在debug为True时添加--debug标志
         if batch_mission.debug:
@@ -669,16 +793,28 @@ class Manager:
         print(f"调试信息 - 批量处理 {len(batch_mission.input_dirs)} 个目录")
         
         try:
-            batch_mission.executor.execute_command(cmd_parts)
+            if self.workers:
+                batch_mission.executor = self.workers.submit(device, batch_mission.preset_name, preset_path, batch_mission.input_dirs,
+                                                             batch_mission.output_dir, batch_mission.output_format,
+                                                             debug=batch_mission.debug, batch=True,
+                                                             output_dirs=[m.output_dir for m in batch_missions])
+            else:
+                batch_mission.executor.execute_command(cmd_parts, env=self.scheduler.get_env(device))
             batch_mission.running = True
             batch_mission.state = 'running'
-            # 记录处理开始时间
-            batch_mission.update_progress(status='running')
-            batch_mission.write()
+            for mission in batch_missions:
+                mission.executor = batch_mission.executor
+                mission.running = True
+                mission.state = 'running'
+                # 记录处理开始时间
+                mission.update_progress(status='running')
+                mission.write()
             print(f"调试信息 - 批量命令执行成功")
             return True
         except Exception as e:
             print(f"调试信息 - 批量命令执行失败: {e}")
+            if batch_mission in self.running:
+                self.remove_running(batch_mission)
             return False
 
     def set_batch_mode(self, enabled: bool):
@@ -713,6 +849,8 @@ class Manager:
             'batch_mode': self.batch_mode,
             'force_batch_mode': self.force_batch_mode,
             'waiting_tasks': len(self.missions),
+            'devices': self.scheduler.get_status(),
+            'idle_workers': len(self.workers.idle) if self.workers else 0,
             'running_tasks': actual_running_count,  # 使用实际运行的任务数
             'total_tasks': len(self.missions) + len(self.running)  # 总任务数包括所有在 running 列表中的任务
         }
@@ -20,9 +20,13 @@ from utils.logger import get_logger
 # 导入任务进度追踪
 try:
     from clientui.task_progress import task_progress
+    from clientui.progress_events import emit as emit_progress
 except ImportError:
     task_progress = None
 
+    def emit_progress(mission_dir, event_type, **data):
+        return False
+
 logger = get_logger()
 
 
@@ -51,8 +55,9 @@ def update_progress(input_folder, processed_count):
                 mission_dir = str(parent_dir)
         
         if mission_dir:
-            # 更新进度
-            task_progress.update_progress(mission_dir, {'processed_files': processed_count})
+            # 更新进度，有进度事件通道时由客户端进程聚合
+            if not emit_progress(mission_dir, 'update', data={'processed_files': processed_count}):
+                task_progress.update_progress(mission_dir, {'processed_files': processed_count})
     except Exception as e:
         print(f"更新进度时出错: {e}")
 
@@ -85,21 +90,26 @@ def update_step_progress(input_folder, step_index, processed_count):
         
         if mission_dir:
             # 更新步骤进度
-            task_progress.update_step_progress(mission_dir, step_index, processed_count)
+            if not emit_progress(mission_dir, 'step', step_index=step_index, processed_files=processed_count):
+                task_progress.update_step_progress(mission_dir, step_index, processed_count)
             print(f"调试信息 - 更新步骤 {step_index} 进度: {processed_count}")
     except Exception as e:
         print(f"更新步骤进度时出错: {e}")
 
 
-def main(input_folder, store_dir, preset_path, output_format, skip_existing_files=False):
-    print(f"调试信息 - preset_infer_cli.main: 开始执行")
-    print(f"调试信息 - 输入文件夹: {input_folder}")
-    print(f"调试信息 - 输出目录: {store_dir}")
-    print(f"调试信息 - 预设路径: {preset_path}")
-    print(f"调试信息 - 输出格式: {output_format}")
-    print(f"调试信息 - 跳过已有文件: {skip_existing_files}")
-    
-    # 在开始时就确定任务目录，避免后续查找问题
+def report_step_progress(mission_dir, step_index, processed_count):
+    """
+    上报步骤进度：有进度事件通道时发送事件，否则直接更新进度文件
+    """
+    if emit_progress(mission_dir, 'step', step_index=step_index, processed_files=processed_count):
+        return True
+    return task_progress.update_step_progress(mission_dir, step_index, processed_count)
+
+
+def find_mission_dir(input_folder, store_dir):
+    """
+    从输入/输出目录向上查找任务目录（包含 mission*.json 或 progress.json）
+    """
     mission_dir_for_progress = None
     try:
         # 方法1: 从输入目录向上查找
@@ -178,15 +188,23 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
         import traceback
         traceback.print_exc()
     
-    print(f"调试信息 - task_progress 是否可用: {task_progress is not None}")
-    print(f"调试信息 - mission_dir_for_progress: {mission_dir_for_progress}")
-    
-    # 如果找到了任务目录，尝试初始化或更新进度追踪
+    return mission_dir_for_progress
+
+
+def init_mission_progress(mission_dir_for_progress, input_folder, preset_path):
+    """
+    初始化或更新任务目录中的进度追踪
+    """
     if mission_dir_for_progress and task_progress:
         try:
             # 提取预设文件名（不含路径）
             preset_filename = os.path.basename(preset_path)
             print(f"调试信息 - 预设文件名: {preset_filename}")
+
+            # 有进度事件通道时由客户端进程初始化，不在推理进程中读写进度文件
+            if emit_progress(mission_dir_for_progress, 'init', input_dir=input_folder, preset_name=preset_filename):
+                print(f"调试信息 - 已通过进度事件通道初始化进度追踪")
+                return
             
             # 检查进度文件是否存在
             progress_file = os.path.join(mission_dir_for_progress, 'progress.json')
@@ -211,6 +229,196 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
             print(f"调试信息 - ❌ 初始化进度追踪时出错: {e}")
             import traceback
             traceback.print_exc()
+
+
+def start_peak_memory_measurement():
+    """
+    开始测量本次任务的峰值内存，返回测量的起点，None 表示不测量
+    只在模型管理器中还没有模型时测量（新进程或常驻进程的第一个任务）：常驻进程中其他预设留下的模型会计入显存，
+    而本预设已缓存的模型不会再分配，两种情况测出的都不是该预设需要预留的内存
+    """
+    try:
+        import torch
+        from inference.model_manager import get_model_manager
+
+        if get_model_manager().get_cache_info()["cached_models"]:
+            print("调试信息 - 模型缓存中已有模型，本次任务不记录峰值内存")
+            return None
+        if torch.cuda.is_available():
+            baseline = {}
+            for i in range(torch.cuda.device_count()):
+                torch.cuda.reset_peak_memory_stats(i)
+                baseline[i] = torch.cuda.memory_allocated(i)
+            return {"cuda": baseline}
+        return {"cpu": None}
+    except Exception as e:
+        print(f"调试信息 - 开始测量峰值内存失败: {e}")
+        return None
+
+
+def record_preset_peak_memory(preset_name, measurement):
+    """
+    记录本次运行的峰值显存（任务期间分配的峰值减去开始时已分配的显存）或CPU模式下的峰值内存，客户端调度器据此为该预设预留内存
+    """
+    if measurement is None:
+        return
+    try:
+        import torch
+        from clientui.scheduler import record_peak_memory
+
+        if "cuda" in measurement:
+            peak = max(torch.cuda.max_memory_allocated(i) - baseline for i, baseline in measurement["cuda"].items())
+            record_peak_memory(preset_name, "cuda", peak)
+        else:
+            import psutil
+
+            memory_info = psutil.Process().memory_info()
+            record_peak_memory(preset_name, "cpu", getattr(memory_info, "peak_wset", memory_info.rss))
+    except Exception as e:
+        print(f"调试信息 - 记录峰值内存失败: {e}")
+
+
+def get_final_filename(base_name, preset_steps):
+    """
+    经过所有步骤后的最终文件名（每一步追加 _{input_to_next}）
+    """
+    final_filename = base_name
+    for step in preset_steps:
+        if step.get("input_to_next"):
+            final_filename += f"_{step['input_to_next']}"
+    return final_filename
+
+
+def main_in_memory(input_folder, store_dir, preset_path, output_format, skip_existing_files=False, pipeline=None, step_devices=None):
+    """
+    在当前进程中执行整个预设：模型只加载一次（MSST模型由模型管理器缓存），步骤之间的音轨以内存数组传递，
+    只有 output_to_storage 的音轨和最后一步的结果写入磁盘，不再经过 TEMP_PATH 中的中间文件
+    多步骤预设默认以歌曲为单位流水线执行（MSST_PRESET_PIPELINE=0 关闭），step_devices 指定每一步的设备，
+    例如 ["cuda:0", "cuda:1"]，也可以通过 MSST_PRESET_STEP_DEVICES="cuda:0,cuda:1" 设置
+    """
+    from inference.preset_engine import PresetEngine
+    from inference.preset_pipeline import PresetPipeline
+
+    if pipeline is None:
+        pipeline = os.environ.get("MSST_PRESET_PIPELINE", "1") != "0"
+    if step_devices is None:
+        step_devices = [d.strip() for d in os.environ.get("MSST_PRESET_STEP_DEVICES", "").split(",") if d.strip()]
+
+    mission_dir_for_progress = find_mission_dir(input_folder, store_dir)
+    init_mission_progress(mission_dir_for_progress, input_folder, preset_path)
+
+    preset_data = load_configs(preset_path)
+    preset_version = preset_data.get("version", "Unknown version")
+    if preset_version not in SUPPORTED_PRESET_VERSION:
+        logger.error(f"Unsupported preset version: {preset_version}, supported version: {SUPPORTED_PRESET_VERSION}")
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    input_files = [f for f in os.listdir(input_folder) if f.lower().endswith(('.wav', '.flac', '.mp3', '.m4a', '.aac'))]
+    if skip_existing_files:
+        # 只处理最终结果文件不存在的输入
+        input_files = [
+            f for f in input_files
+            if not os.path.exists(os.path.join(store_dir, f"{get_final_filename(os.path.splitext(f)[0], preset_data['flow'])}.{output_format}"))
+        ]
+        if not input_files:
+            logger.info(f"跳过预设处理: 所有最终结果文件已存在")
+            return
+
+    engine = PresetEngine(preset_data, force_cpu=False, use_tta=False, output_format=output_format, step_devices=step_devices, logger=logger)
+    total_steps = engine.preset.total_steps
+
+    logger.info(f"Starting in-memory preset inference process, use presets: {preset_path}")
+    logger.debug(f"presets: {engine.preset.presets}")
+    logger.debug(f"total_steps: {total_steps}, store_dir: {store_dir}, output_format: {output_format}, files: {len(input_files)}")
+
+    if not engine.preset.is_exist_models()[0]:
+        logger.error(f"Model {engine.preset.is_exist_models()[1]} not found")
+
+    peak_memory_measurement = start_peak_memory_measurement()
+    start_time = time.time()
+    engine.load()
+    logger.info(f"All {total_steps} steps loaded, time cost: {round(time.time() - start_time, 2)}s")
+
+    processed_count = 0
+    step_counts = [0] * total_steps
+    step_lock = threading.Lock()
+
+    def on_step_done(index, path=None):
+        with step_lock:
+            step_counts[index] += 1
+        if total_steps > 1 and mission_dir_for_progress and task_progress:
+            try:
+                report_step_progress(mission_dir_for_progress, index + 1, step_counts[index])
+            except Exception as e:
+                print(f"❌ 更新步骤进度时出错: {e}")
+
+    def on_file_done(path, error):
+        nonlocal processed_count
+        if error is None:
+            processed_count += 1
+        if emit_progress(mission_dir_for_progress, 'file', file=path, status='completed' if error is None else 'failed'):
+            return
+        if error is None:
+            update_progress(input_folder, processed_count)
+
+    if pipeline and total_steps > 1:
+        logger.info(f"Running {total_steps} steps as a song-level pipeline")
+        PresetPipeline(engine, queue_size=int(os.environ.get("MSST_PRESET_QUEUE_SIZE", 2)), logger=logger).run(
+            [os.path.join(input_folder, file) for file in input_files], store_dir, file_callback=on_file_done, step_callback=on_step_done
+        )
+    else:
+        for index, file in enumerate(input_files):
+            logger.info(f"\033[33m[{index + 1}/{len(input_files)}] Processing: {file}\033[0m")
+            path = os.path.join(input_folder, file)
+            try:
+                timings = engine.process_file(path, store_dir, step_callback=on_step_done)
+                logger.debug(f"{file}: " + ", ".join(f"{k}: {v:.2f}s" for k, v in timings.items()))
+            except Exception as e:
+                import traceback
+                logger.error(f"Fail to process: {file}, error: {e}\n{traceback.format_exc()}")
+                on_file_done(path, e)
+                continue
+            finally:
+                engine.del_cache()
+            on_file_done(path, None)
+
+    record_preset_peak_memory(os.path.basename(preset_path), peak_memory_measurement)
+
+    # 清理输出目录中的 .mission_dir 标记文件（路径方式）
+    marker_file = os.path.join(store_dir, '.mission_dir')
+    if os.path.exists(marker_file):
+        try:
+            os.remove(marker_file)
+        except Exception as e:
+            print(f"调试信息 - ⚠️  清理标记文件失败: {e}")
+
+    logger.info(f"\033[33mPreset: {preset_path} inference process completed, {processed_count}/{len(input_files)} files, results saved to {store_dir}, "
+                f"time cost: {round(time.time() - start_time, 2)}s\033[0m")
+
+
+def main(input_folder, store_dir, preset_path, output_format, skip_existing_files=False, in_memory=None, step_devices=None):
+    print(f"调试信息 - preset_infer_cli.main: 开始执行")
+    print(f"调试信息 - 输入文件夹: {input_folder}")
+    print(f"调试信息 - 输出目录: {store_dir}")
+    print(f"调试信息 - 预设路径: {preset_path}")
+    print(f"调试信息 - 输出格式: {output_format}")
+    print(f"调试信息 - 跳过已有文件: {skip_existing_files}")
+
+    # 默认在当前进程中以内存方式执行预设，设置 MSST_PRESET_IN_MEMORY=0 或使用 --legacy 回退到逐步骤子进程
+    if in_memory is None:
+        in_memory = os.environ.get("MSST_PRESET_IN_MEMORY", "1") != "0"
+    if in_memory:
+        return main_in_memory(input_folder, store_dir, preset_path, output_format, skip_existing_files, step_devices=step_devices)
+    
+    # 在开始时就确定任务目录，避免后续查找问题
+    mission_dir_for_progress = find_mission_dir(input_folder, store_dir)
+    
+    print(f"调试信息 - task_progress 是否可用: {task_progress is not None}")
+    print(f"调试信息 - mission_dir_for_progress: {mission_dir_for_progress}")
+    
+    # 如果找到了任务目录，尝试初始化或更新进度追踪
+    init_mission_progress(mission_dir_for_progress, input_folder, preset_path)
     
     # 检查输入路径
     try:
@@ -265,10 +473,7 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
                     base_name = os.path.splitext(input_file)[0]
                     
                     # 构建最终文件名：经过所有步骤后的文件名
-                    final_filename = base_name
-                    for step in preset_steps:
-                        if step.get("input_to_next"):
-                            final_filename += f"_{step['input_to_next']}"
+                    final_filename = get_final_filename(base_name, preset_steps)
                     
                     # 如果最后一步有输出到存储，文件名就是当前构建的文件名
                     # 不需要额外添加后缀，因为input_to_next已经包含了最终的文件名部分
@@ -418,7 +623,7 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
         if preset.total_steps > 1 and mission_dir_for_progress and task_progress:
             try:
                 print(f"调试信息 - 更新步骤 {current_step + 1} 开始进度: processed=0")
-                result = task_progress.update_step_progress(mission_dir_for_progress, current_step + 1, 0)
+                result = report_step_progress(mission_dir_for_progress, current_step + 1, 0)
                 print(f"调试信息 - 步骤开始进度更新结果: {result}")
             except Exception as e:
                 print(f"❌ 更新步骤开始进度时出错: {e}")
@@ -466,7 +671,7 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
                         # 只在文件数量变化时更新
                         if current_count != last_count:
                             try:
-                                result = task_progress.update_step_progress(mission_dir_for_progress, current_step + 1, current_count)
+                                result = report_step_progress(mission_dir_for_progress, current_step + 1, current_count)
                                 if result:
                                     last_count = current_count
                                     update_count += 1
@@ -609,7 +814,7 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
             
             try:
                 print(f"调试信息 - 更新步骤 {current_step + 1} 最终进度: processed={processed_count}")
-                result = task_progress.update_step_progress(mission_dir_for_progress, current_step + 1, processed_count)
+                result = report_step_progress(mission_dir_for_progress, current_step + 1, processed_count)
                 print(f"调试信息 - 步骤最终进度更新结果: {result}")
             except Exception as e:
                 print(f"❌ 更新步骤完成进度时出错: {e}")
@@ -680,16 +885,131 @@ def main(input_folder, store_dir, preset_path, output_format, skip_existing_file
                 f"time cost: {round(time.time() - start_time, 2)}s\033[0m")
 
 
-def main_batch(input_folders, store_dir, preset_path, output_format, skip_existing_files=False):
+def main_batch_in_memory(input_folders, store_dirs, preset_path, output_format, skip_existing_files=False, step_devices=None, is_cancelled=None):
+    """
+    把多个任务的歌曲合并成一次预设执行：每一步的模型只加载一次，所有歌曲以流水线方式经过各个步骤，
+    同一个MSST步骤同时处理 MSST_BATCH_CONCURRENCY（默认4）首歌，它们的分块通过动态批处理合并成batch
+    每首歌的结果写入所属任务自己的输出目录（store_dirs 与 input_folders 一一对应），进度按任务分别上报
+    is_cancelled(input_folder) 返回True时跳过该输入文件夹（任务）剩余的歌曲
+    """
+    from inference.preset_engine import PresetEngine
+    from inference.preset_pipeline import PresetPipeline
+
+    if step_devices is None:
+        step_devices = [d.strip() for d in os.environ.get("MSST_PRESET_STEP_DEVICES", "").split(",") if d.strip()]
+
+    preset_data = load_configs(preset_path)
+    preset_version = preset_data.get("version", "Unknown version")
+    if preset_version not in SUPPORTED_PRESET_VERSION:
+        logger.error(f"Unsupported preset version: {preset_version}, supported version: {SUPPORTED_PRESET_VERSION}")
+
+    # 收集所有任务的歌曲，记录每首歌的输出目录和任务目录
+    files, file_store_dirs, file_missions, file_folders = [], {}, {}, {}
+    mission_dirs = []
+    for input_folder, store_dir in zip(input_folders, store_dirs):
+        mission_dir = find_mission_dir(input_folder, store_dir)
+        init_mission_progress(mission_dir, input_folder, preset_path)
+        mission_dirs.append(mission_dir)
+        os.makedirs(store_dir, exist_ok=True)
+        for file in os.listdir(input_folder):
+            if not file.lower().endswith(('.wav', '.flac', '.mp3', '.m4a', '.aac')):
+                continue
+            if skip_existing_files and os.path.exists(os.path.join(store_dir, f"{get_final_filename(os.path.splitext(file)[0], preset_data['flow'])}.{output_format}")):
+                continue
+            path = os.path.join(input_folder, file)
+            files.append(path)
+            file_store_dirs[path] = store_dir
+            file_missions[path] = mission_dir
+            file_folders[path] = input_folder
+
+    if not files:
+        logger.info(f"跳过批量预设处理: 所有最终结果文件已存在")
+        return
+
+    engine = PresetEngine(preset_data, force_cpu=False, use_tta=False, output_format=output_format, step_devices=step_devices, dynamic_batching=True, logger=logger)
+    total_steps = engine.preset.total_steps
+
+    logger.info(f"Starting single-pass batch preset inference, use presets: {preset_path}, missions: {len(input_folders)}, files: {len(files)}")
+    if not engine.preset.is_exist_models()[0]:
+        logger.error(f"Model {engine.preset.is_exist_models()[1]} not found")
+
+    peak_memory_measurement = start_peak_memory_measurement()
+    start_time = time.time()
+    engine.load()
+    logger.info(f"All {total_steps} steps loaded, time cost: {round(time.time() - start_time, 2)}s")
+
+    processed_counts = {}
+    step_counts = {}
+    count_lock = threading.Lock()
+
+    def on_step_done(index, path):
+        mission_dir = file_missions[path]
+        with count_lock:
+            step_counts[(mission_dir, index)] = step_counts.get((mission_dir, index), 0) + 1
+            count = step_counts[(mission_dir, index)]
+        if total_steps > 1 and mission_dir and task_progress:
+            try:
+                report_step_progress(mission_dir, index + 1, count)
+            except Exception as e:
+                print(f"❌ 更新步骤进度时出错: {e}")
+
+    def on_file_done(path, error):
+        mission_dir = file_missions[path]
+        with count_lock:
+            if error is None:
+                processed_counts[mission_dir] = processed_counts.get(mission_dir, 0) + 1
+            count = processed_counts.get(mission_dir, 0)
+        if emit_progress(mission_dir, 'file', file=path, status='completed' if error is None else 'failed'):
+            return
+        if error is None:
+            update_progress(os.path.dirname(path), count)
+
+    def cancelled(path):
+        return bool(is_cancelled and is_cancelled(file_folders[path]))
+
+    PresetPipeline(
+        engine,
+        queue_size=int(os.environ.get("MSST_PRESET_QUEUE_SIZE", 2)),
+        step_concurrency=int(os.environ.get("MSST_BATCH_CONCURRENCY", 4)),
+        logger=logger,
+    ).run(files, file_store_dirs, file_callback=on_file_done, step_callback=on_step_done, cancelled=cancelled)
+
+    record_preset_peak_memory(os.path.basename(preset_path), peak_memory_measurement)
+
+    for store_dir in set(store_dirs):
+        marker_file = os.path.join(store_dir, '.mission_dir')
+        if os.path.exists(marker_file):
+            try:
+                os.remove(marker_file)
+            except Exception as e:
+                print(f"调试信息 - ⚠️  清理标记文件失败: {e}")
+
+    logger.info(f"\033[33mBatch preset: {preset_path} inference process completed, {sum(processed_counts.values())}/{len(files)} files, "
+                f"time cost: {round(time.time() - start_time, 2)}s\033[0m")
+
+
+def main_batch(input_folders, store_dir, preset_path, output_format, skip_existing_files=False, store_dirs=None, in_memory=None, is_cancelled=None):
     """
     批量处理多个文件夹，复用已加载的模型
+    store_dirs 与 input_folders 一一对应时每个文件夹写入自己的输出目录，否则全部写入 store_dir
     """
     print(f"调试信息 - preset_infer_cli.main_batch: 开始批量执行")
     print(f"调试信息 - 输入文件夹列表: {input_folders}")
-    print(f"调试信息 - 输出目录: {store_dir}")
+    print(f"调试信息 - 输出目录: {store_dirs or store_dir}")
     print(f"调试信息 - 预设路径: {preset_path}")
     print(f"调试信息 - 输出格式: {output_format}")
     print(f"调试信息 - 跳过已有文件: {skip_existing_files}")
+
+    if not store_dirs or len(store_dirs) != len(input_folders):
+        store_dirs = [store_dir] * len(input_folders)
+    if in_memory is None:
+        in_memory = os.environ.get("MSST_PRESET_IN_MEMORY", "1") != "0"
+    if in_memory:
+        return main_batch_in_memory(input_folders, store_dirs, preset_path, output_format, skip_existing_files, is_cancelled=is_cancelled)
+    if len(set(store_dirs)) > 1:
+        # 逐步骤子进程方式只支持一个输出目录
+        logger.warning("Legacy batch mode writes all missions to the first output directory")
+        store_dir = store_dirs[0]
     
     preset_data = load_configs(preset_path)
     preset_version = preset_data.get("version", "Unknown version")
@@ -884,11 +1204,13 @@ if __name__ == "__main__":
                         help="Path to the preset file (*.json). To create a preset file, please refer to the documentation or use WebUI to create one.",
                         required=True)
     parser.add_argument("-i", "--input_dir", type=str, action='append', help="Path to the input folder (can be specified multiple times for batch processing)")
-    parser.add_argument("-o", "--output_dir", type=str, default="results", help="Path to the output folder")
+    parser.add_argument("-o", "--output_dir", type=str, action='append', help="Path to the output folder (in batch mode one per input folder, default: results)")
     parser.add_argument("-f", "--output_format", type=str, default="wav", choices=["wav", "mp3", "flac"],
                         help="Output format of the audio")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--batch", action="store_true", help="Enable batch processing mode")
+    parser.add_argument("--legacy", action="store_true", help="Run every step in its own process with temporary files between steps")
+    parser.add_argument("--step_devices", type=str, default=None, help="Comma separated device of every preset step, e.g. cuda:0,cuda:1")
     args = parser.parse_args()
 
     print(f"调试信息 - 命令行参数解析完成")
@@ -909,15 +1231,18 @@ if __name__ == "__main__":
 
     setup_webui()  # must be called because we use some functions from webui app
     set_debug(args)
+    output_dirs = args.output_dir or ["results"]
 
     if args.batch and args.input_dir and len(args.input_dir) > 1:
         # 批量处理模式
         print(f"调试信息 - 使用批量处理模式，处理 {len(args.input_dir)} 个输入目录")
-        main_batch(args.input_dir, args.output_dir, args.preset_path, args.output_format)
+        main_batch(args.input_dir, output_dirs[0], args.preset_path, args.output_format, store_dirs=output_dirs,
+                   in_memory=False if args.legacy else None)
     else:
         # 单个处理模式
         input_dir = args.input_dir[0] if args.input_dir else "input"
-        main(input_dir, args.output_dir, args.preset_path, args.output_format)
+        main(input_dir, output_dirs[0], args.preset_path, args.output_format, in_memory=False if args.legacy else None,
+             step_devices=args.step_devices.split(",") if args.step_devices else None)
 
 
 
@@ -0,0 +1,125 @@
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import json
+import time
+import queue
+import shutil
+import argparse
+import threading
+import traceback
+
+# 与客户端通信的消息行以此开头，其余输出（日志、进度条）原样转发到客户端控制台
+WORKER_MARKER = "@@MSST_WORKER "
+
+
+def send(message):
+    sys.stdout.write(WORKER_MARKER + json.dumps(message, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+# 已取消的输入文件夹，批量任务跳过其中剩余的歌曲
+cancelled_folders = set()
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def release_memory():
+    # 模型留在模型管理器的缓存中，只释放推理过程中的临时显存
+    try:
+        import gc
+        import torch
+
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+def run_job(request):
+    """
+    执行一个任务，参数与 preset_infer_cli.py 的命令行参数相同，返回退出码
+    """
+    import clientui.preset_infer_cli as preset_infer_cli
+    from webui.setup import set_debug
+
+    set_debug(argparse.Namespace(debug=request.get("debug", False)))
+    try:
+        input_dirs = request["input_dirs"]
+        if request.get("batch") and len(input_dirs) > 1:
+            preset_infer_cli.main_batch(input_dirs, request["output_dir"], request["preset_path"], request["output_format"],
+                                        store_dirs=request.get("output_dirs"),
+                                        is_cancelled=lambda folder: normalize_path(folder) in cancelled_folders)
+        else:
+            preset_infer_cli.main(input_dirs[0], request["output_dir"], request["preset_path"], request["output_format"])
+        return 0
+    except BaseException as e:
+        if isinstance(e, KeyboardInterrupt):
+            raise
+        print(f"调试信息 - ❌ 常驻推理进程执行任务失败: {e}")
+        traceback.print_exc()
+        return 1
+    finally:
+        release_memory()
+
+
+def serve():
+    """
+    常驻推理进程：启动时导入一次 torch 和 webui 模块，之后从标准输入逐行读取任务（JSON），
+    模型保留在模型管理器的缓存中供后续任务复用。标准输入关闭（客户端退出或回收进程）时退出
+    标准输入由单独的线程读取，任务执行期间也能收到取消消息 {"type": "cancel", "input_dir": ...}
+    """
+    start_time = time.time()
+    if not os.path.exists("configs"):
+        shutil.copytree("configs_backup", "configs")
+    if not os.path.exists("data"):
+        shutil.copytree("data_backup", "data")
+
+    from webui.setup import setup_webui
+    import clientui.preset_infer_cli  # noqa: F401
+
+    setup_webui()
+    send({"type": "ready", "pid": os.getpid(), "startup": round(time.time() - start_time, 2)})
+
+    jobs = queue.Queue()
+
+    def read_stdin():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                print(f"调试信息 - 常驻推理进程收到无效的消息: {line}")
+                continue
+            if message.get("type") == "cancel":
+                cancelled_folders.add(normalize_path(message["input_dir"]))
+                print(f"调试信息 - 取消任务: {message['input_dir']}")
+            else:
+                jobs.put(message)
+        jobs.put(None)
+
+    threading.Thread(target=read_stdin, name="preset_worker_stdin", daemon=True).start()
+
+    while True:
+        request = jobs.get()
+        if request is None:
+            break
+        cancelled_folders.clear()
+        job_start = time.time()
+        exit_code = run_job(request)
+        send({"type": "done", "id": request.get("id"), "exit_code": exit_code, "time": round(time.time() - job_start, 2)})
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    multiprocessing.set_start_method('spawn', force=True)
+    serve()
@@ -0,0 +1,138 @@
+import os
+import json
+import queue
+import socket
+import threading
+
+# 推理子进程通过该环境变量找到客户端进程中的进度事件通道，格式为 "127.0.0.1:端口"
+PROGRESS_ADDR_ENV = "MSST_PROGRESS_ADDR"
+
+
+class ProgressAggregator:
+    """进度事件聚合器
+
+    推理线程/子进程不再直接读写 progress.json，而是发送进度事件：
+    同一进程内的事件直接放入队列，子进程的事件通过本机UDP套接字发送到同一个队列。
+    聚合线程把事件应用到 TaskProgress 的内存状态，并按 flush_interval 批量、原子地写入 progress.json。
+    """
+
+    def __init__(self, progress, flush_interval=1.0):
+        self.progress = progress
+        self.flush_interval = flush_interval
+        self.address = None
+        self._events = queue.Queue()
+        self._socket = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """绑定本机UDP端口并启动接收和聚合线程，返回是否成功"""
+        with self._lock:
+            if self._started:
+                return True
+            try:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.bind(("127.0.0.1", 0))
+            except OSError as e:
+                print(f"调试信息 - ⚠️  进度事件通道启动失败，回退到目录扫描: {e}")
+                self._socket = None
+                return False
+
+            host, port = self._socket.getsockname()
+            self.address = f"{host}:{port}"
+            # 之后启动的推理子进程会继承该环境变量
+            os.environ[PROGRESS_ADDR_ENV] = self.address
+
+            threading.Thread(target=self._receive, name="progress_receiver", daemon=True).start()
+            threading.Thread(target=self._run, name="progress_aggregator", daemon=True).start()
+            self._started = True
+            print(f"调试信息 - 进度事件通道已启动: {self.address}")
+            return True
+
+    @property
+    def started(self):
+        return self._started
+
+    def put(self, event):
+        self._events.put(event)
+
+    def _receive(self):
+        while True:
+            try:
+                data, _ = self._socket.recvfrom(65536)
+                self._events.put(json.loads(data.decode("utf-8")))
+            except (ValueError, UnicodeDecodeError) as e:
+                print(f"调试信息 - 收到无效的进度事件: {e}")
+            except OSError:
+                return
+
+    def _run(self):
+        while True:
+            try:
+                event = self._events.get(timeout=self.flush_interval)
+            except queue.Empty:
+                event = None
+
+            # 把队列中已有的事件一次处理完，再统一写盘
+            while event is not None:
+                try:
+                    self.progress.apply_event(event)
+                except Exception as e:
+                    print(f"应用进度事件时出错: {e}, 事件: {event}")
+                try:
+                    event = self._events.get_nowait()
+                except queue.Empty:
+                    event = None
+
+            self.progress.flush()
+
+
+_aggregator = None
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def start_aggregator(progress, flush_interval=1.0):
+    """在客户端进程中启动全局进度事件聚合器，失败时返回None"""
+    global _aggregator
+    if _aggregator is None:
+        _aggregator = ProgressAggregator(progress, flush_interval)
+    return _aggregator if _aggregator.start() else None
+
+
+def get_aggregator():
+    return _aggregator if _aggregator is not None and _aggregator.started else None
+
+
+def emit(mission_dir, event_type, **data):
+    """发送进度事件，没有可用的事件通道时返回False（调用方回退到直接写进度文件）
+
+    事件类型:
+        init: input_dir, preset_name  初始化任务进度
+        file: file, status             单个文件处理完成（completed）或失败（failed），按文件去重计数
+        step: step_index, file 或 processed_files  某个步骤完成一个文件（按文件去重计数）或直接给出已处理数
+        update: data                   与 TaskProgress.update_progress 相同的部分更新
+    """
+    global _sender
+    if not mission_dir:
+        return False
+    event = {"mission_dir": str(mission_dir), "type": event_type, **data}
+
+    aggregator = get_aggregator()
+    if aggregator is not None:
+        aggregator.put(event)
+        return True
+
+    address = os.environ.get(PROGRESS_ADDR_ENV)
+    if not address:
+        return False
+    try:
+        host, port = address.rsplit(":", 1)
+        with _sender_lock:
+            if _sender is None:
+                _sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _sender.sendto(json.dumps(event, ensure_ascii=False).encode("utf-8"), (host, int(port)))
+        return True
+    except (OSError, ValueError) as e:
+        print(f"发送进度事件失败: {e}")
+        return False
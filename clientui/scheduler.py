@@ -0,0 +1,230 @@
+import os
+import json
+import threading
+import subprocess
+
+from utils.constant import WEBUI_CONFIG, MODEL_FOLDER, PRESETS, get_cache_dir
+from utils.model_registry import get_model_registry
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 每个预设实测的峰值内存，由推理进程在运行结束后记录
+PEAK_MEMORY_FILE = os.path.join(get_cache_dir(), "preset_memory.json")
+
+# 没有实测数据时的估算：模型文件大小 * 系数 + 固定开销（CUDA上下文、分块缓冲区等）
+MODEL_MEMORY_FACTOR = 3
+GPU_BASE_MEMORY = 1536 * 1024 * 1024
+CPU_BASE_MEMORY = 1024 * 1024 * 1024
+DEFAULT_MODEL_SIZE = 512 * 1024 * 1024
+# torch 统计的显存不包含CUDA上下文本身
+GPU_CONTEXT_MEMORY = 512 * 1024 * 1024
+
+_peak_memory_lock = threading.Lock()
+
+
+def parse_budgets(spec):
+    """解析内存预算，格式: "cuda=20000,cpu=32000"（单位MB），设备名可带编号，如 "cuda:1=10000" """
+    budgets = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        device, value = item.split("=", 1)
+        try:
+            budgets[device.strip()] = float(value) * 1024 * 1024
+        except ValueError:
+            print(f"调试信息 - 无效的调度预算: {item}")
+    return budgets
+
+
+def detect_devices():
+    """检测可用设备及其总内存（字节），返回 {"cuda:0": 总显存, ..., "cpu": 总内存}
+
+    通过 nvidia-smi 查询显卡，避免在客户端进程中导入 torch
+    """
+    devices = {}
+    try:
+        output = subprocess.check_output(
+            ["nvidia-smi", "--query-gpu=index,memory.total", "--format=csv,noheader,nounits"],
+            text=True, timeout=10
+        )
+        for line in output.strip().splitlines():
+            index, total = [v.strip() for v in line.split(",")[:2]]
+            devices[f"cuda:{int(index)}"] = float(total) * 1024 * 1024
+    except (OSError, subprocess.SubprocessError, ValueError):
+        pass
+
+    if psutil is not None:
+        devices["cpu"] = float(psutil.virtual_memory().total)
+    else:
+        devices["cpu"] = 16.0 * 1024 ** 3
+    return devices
+
+
+def load_peak_memory():
+    try:
+        with open(PEAK_MEMORY_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_peak_memory(preset_name, device_type, peak_bytes):
+    """记录预设在某类设备（cuda/cpu）上的实测峰值内存，保存最近一次的测量值"""
+    if not preset_name or not peak_bytes:
+        return
+    with _peak_memory_lock:
+        data = load_peak_memory()
+        entry = data.setdefault(preset_name, {})
+        entry[device_type] = float(peak_bytes)
+        try:
+            os.makedirs(os.path.dirname(PEAK_MEMORY_FILE), exist_ok=True)
+            tmp_file = f"{PEAK_MEMORY_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_file, PEAK_MEMORY_FILE)
+        except OSError as e:
+            print(f"记录预设峰值内存时出错: {e}")
+
+
+def get_model_file(model_type, model_name):
+    """返回模型文件路径，找不到时返回None"""
+    if model_type == "UVR_VR_Models":
+        try:
+            with open(WEBUI_CONFIG, "r", encoding="utf-8") as f:
+                return os.path.join(json.load(f)["settings"]["uvr_model_dir"], model_name)
+        except (OSError, ValueError, KeyError):
+            return None
+    model = get_model_registry().get_msst(model_name)
+    return os.path.join(MODEL_FOLDER, model["category"], model_name) if model else None
+
+
+class PresetProfile:
+    """预设的模型集合和每类设备上的峰值内存（实测值优先，否则按模型文件大小估算）"""
+
+    def __init__(self, preset_name, models, peak_memory):
+        self.preset_name = preset_name
+        self.models = models
+        self.peak_memory = peak_memory
+
+    def get_memory(self, device):
+        return self.peak_memory["cpu" if device == "cpu" else "cuda"]
+
+
+class MissionScheduler:
+    """按显存/内存预算把任务放到GPU或CPU槽位上
+
+    每个设备的预算默认为总内存的 MSST_SCHEDULER_MEMORY_FRACTION（默认0.9），也可以通过
+    MSST_SCHEDULER_BUDGET（如 "cuda=20000,cpu=32000"，单位MB）指定。任务需要的内存超出所有设备的剩余预算时
+    留在队列中等待，而不是启动后OOM。空闲设备总是可以接收一个任务，避免超大预设永远无法运行。
+    有GPU时默认不把任务放到CPU上，设置 MSST_SCHEDULER_CPU_SLOTS=1 允许GPU满载时使用CPU。
+    """
+
+    def __init__(self, devices=None, budgets=None):
+        self.devices = devices if devices is not None else detect_devices()
+        fraction = float(os.environ.get("MSST_SCHEDULER_MEMORY_FRACTION", 0.9))
+        budgets = budgets if budgets is not None else parse_budgets(os.environ.get("MSST_SCHEDULER_BUDGET", ""))
+        self.budgets = {}
+        for device, total in self.devices.items():
+            device_type = device.split(":")[0]
+            self.budgets[device] = budgets.get(device, budgets.get(device_type, total * fraction))
+        self.use_cpu_slots = not self.gpus or os.environ.get("MSST_SCHEDULER_CPU_SLOTS", "0") == "1"
+        self._assignments = {}  # id(mission) -> (设备, 预留字节数, 模型集合)
+        self._lock = threading.Lock()
+        print(f"调试信息 - 调度器设备预算: " + ", ".join(f"{d}={b / 1024 ** 3:.1f}GB" for d, b in self.budgets.items()))
+
+    @property
+    def gpus(self):
+        return [device for device in self.devices if device.startswith("cuda")]
+
+    def get_profile(self, preset_name):
+        models = []
+        model_bytes = 0
+        try:
+            with open(os.path.join(PRESETS, preset_name), "r", encoding="utf-8") as f:
+                flow = json.load(f).get("flow", [])
+        except (OSError, ValueError):
+            flow = []
+        for step in flow:
+            models.append(step.get("model_name"))
+            model_file = get_model_file(step.get("model_type"), step.get("model_name"))
+            if model_file and os.path.exists(model_file):
+                model_bytes += os.path.getsize(model_file)
+            else:
+                model_bytes += DEFAULT_MODEL_SIZE
+
+        measured = load_peak_memory().get(preset_name, {})
+        peak_memory = {
+            "cuda": measured["cuda"] + GPU_CONTEXT_MEMORY if measured.get("cuda") else model_bytes * MODEL_MEMORY_FACTOR + GPU_BASE_MEMORY,
+            "cpu": measured.get("cpu") or model_bytes * MODEL_MEMORY_FACTOR + CPU_BASE_MEMORY,
+        }
+        return PresetProfile(preset_name, set(models), peak_memory)
+
+    def _usage(self, device):
+        return sum(reserved for d, reserved, _ in self._assignments.values() if d == device)
+
+    def _shared_models(self, device, models):
+        return sum(len(models & m) for d, _, m in self._assignments.values() if d == device)
+
+    def place(self, mission):
+        """为任务选择设备，没有满足预算的设备时返回None（任务继续排队）
+
+        优先选择已经运行着相同模型的设备（之后可以复用同一个常驻推理进程），其次选择剩余预算最多的设备
+        """
+        profile = self.get_profile(mission.preset_name)
+        candidates = list(self.gpus)
+        if self.use_cpu_slots:
+            candidates.append("cpu")
+
+        with self._lock:
+            fits = []
+            for device in candidates:
+                usage = self._usage(device)
+                need = profile.get_memory(device)
+                if usage == 0 or usage + need <= self.budgets[device]:
+                    fits.append((device, need))
+            if not fits:
+                return None
+
+            device, need = max(
+                fits,
+                key=lambda item: (item[0] != "cpu", self._shared_models(item[0], profile.models), self.budgets[item[0]] - self._usage(item[0]))
+            )
+            self._assignments[id(mission)] = (device, need, profile.models)
+            print(f"调试信息 - 调度器: {mission.preset_name} -> {device}, 预留 {need / 1024 ** 3:.2f}GB, 已用 {self._usage(device) / 1024 ** 3:.2f}/{self.budgets[device] / 1024 ** 3:.2f}GB")
+            return device
+
+    def reserve(self, owner, device, preset_name):
+        """在指定设备上为owner（如空闲的常驻推理进程）预留预设的峰值内存，不检查预算"""
+        profile = self.get_profile(preset_name)
+        with self._lock:
+            self._assignments[id(owner)] = (device, profile.get_memory(device), profile.models)
+
+    def release(self, mission):
+        with self._lock:
+            assignment = self._assignments.pop(id(mission), None)
+        if assignment:
+            print(f"调试信息 - 调度器: 释放 {assignment[0]} 上的 {assignment[1] / 1024 ** 3:.2f}GB")
+
+    def get_device(self, mission):
+        with self._lock:
+            assignment = self._assignments.get(id(mission))
+        return assignment[0] if assignment else None
+
+    def get_env(self, device):
+        """推理子进程的环境变量：只暴露分配到的显卡，CPU槽位不暴露任何显卡"""
+        env = os.environ.copy()
+        if device == "cpu":
+            env["CUDA_VISIBLE_DEVICES"] = ""
+        elif device:
+            env["CUDA_VISIBLE_DEVICES"] = device.split(":")[1]
+        return env
+
+    def get_status(self):
+        with self._lock:
+            return {
+                device: {"budget": self.budgets[device], "used": self._usage(device), "missions": sum(1 for d, _, _ in self._assignments.values() if d == device)}
+                for device in self.budgets
+            }
@@ -10,10 +10,50 @@ class TaskProgress:
         self._progress_cache = {}  # 缓存任务进度，避免频繁读取文件
         self._last_update = {}     # 记录上次更新时间，避免过于频繁的文件访问
         self._verifying = set()    # 正在验证的任务目录集合，防止递归调用
+        self._tracked = set()      # 由进度事件维护的任务目录，内存状态即为最新状态，不再读文件和扫描目录
+        self._dirty = set()        # 内存状态已变化、等待批量写盘的任务目录
+        self._done_files = {}      # 任务目录 -> 已完成的文件集合，用于事件去重
+        self._done_steps = {}      # 任务目录 -> {步骤键: 已完成的文件集合}
     
     def get_progress_file_path(self, mission_dir):
         """获取进度文件路径"""
         return os.path.join(mission_dir, 'progress.json')
+
+    def _write_progress_file(self, mission_dir, progress_data):
+        """原子地写入进度文件，读取方不会读到写了一半的文件"""
+        progress_file = self.get_progress_file_path(mission_dir)
+        tmp_file = f"{progress_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(progress_data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, progress_file)
+
+    def _read_progress_file(self, mission_dir):
+        """读取进度文件，不存在或损坏时返回None"""
+        progress_file = self.get_progress_file_path(mission_dir)
+        if not os.path.exists(progress_file):
+            return None
+        try:
+            with open(progress_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, RecursionError, OSError) as e:
+            print(f"JSON文件损坏或格式错误: {progress_file}, 错误: {e}")
+            return None
+
+    def track(self, mission_dir):
+        """之后该任务的进度由进度事件维护，get_progress 直接返回内存状态"""
+        with self._lock:
+            if mission_dir in self._tracked:
+                return
+        progress_data = self._read_progress_file(mission_dir)
+        with self._lock:
+            if progress_data is not None and mission_dir not in self._progress_cache:
+                self._progress_cache[mission_dir] = progress_data
+                self._last_update[mission_dir] = time.time()
+            self._tracked.add(mission_dir)
+
+    def is_tracked(self, mission_dir):
+        with self._lock:
+            return mission_dir in self._tracked and mission_dir in self._progress_cache
     
     def init_progress(self, mission_dir, input_dir, preset_name=None):
         """初始化任务进度文件
@@ -76,14 +116,15 @@ class TaskProgress:
                     print(f"调试信息 - 初始化步骤进度: {len(step_progress)} 个步骤")
             
             # 保存到文件
-            progress_file = self.get_progress_file_path(mission_dir)
-            with open(progress_file, 'w', encoding='utf-8') as f:
-                json.dump(progress_data, f, indent=4, ensure_ascii=False)
+            self._write_progress_file(mission_dir, progress_data)
                 
             # 更新缓存
             with self._lock:
                 self._progress_cache[mission_dir] = progress_data
                 self._last_update[mission_dir] = time.time()
+                self._done_files.pop(mission_dir, None)
+                self._done_steps.pop(mission_dir, None)
+                self._dirty.discard(mission_dir)
                 
             print(f"调试信息 - 进度初始化完成: {total_files} 个文件")
             return progress_data
@@ -108,40 +149,13 @@ class TaskProgress:
             current_progress = self.get_progress(mission_dir)
             if not current_progress:
                 return False
-            
-            # 检查总数是否已锁定
-            is_locked = current_progress.get('total_files_locked', False)
-
-            if 'total_files' in progress_update:
-                incoming_total = progress_update.get('total_files', 0) or 0
-                current_total = current_progress.get('total_files', 0) or 0
-
-                if is_locked and incoming_total <= current_total and current_total > 0:
-                    progress_update_copy = progress_update.copy()
-                    progress_update_copy['total_files'] = current_total
-                    progress_update_copy['total_files_locked'] = True
-                    current_progress.update(progress_update_copy)
-                    print(f"调试信息 - 总数已锁定，保持原有总数: {current_total}")
-                else:
-                    if current_total != incoming_total:
-                        print(f"调试信息 - 更新文件总数: {current_total} -> {incoming_total}")
-                    current_progress.update(progress_update)
-                    if is_locked:
-                        current_progress['total_files_locked'] = True
-            else:
-                current_progress.update(progress_update)
-
-            total_after = current_progress.get('total_files', 0) or 0
-            processed_after = current_progress.get('processed_files', 0) or 0
-            if total_after > 0 and processed_after > total_after:
-                current_progress['processed_files'] = total_after
 
-            current_progress['last_update'] = time.time()
+            with self._lock:
+                self._merge_update(current_progress, progress_update)
+                self._dirty.discard(mission_dir)
             
             # 保存到文件
-            progress_file = self.get_progress_file_path(mission_dir)
-            with open(progress_file, 'w', encoding='utf-8') as f:
-                json.dump(current_progress, f, indent=4, ensure_ascii=False)
+            self._write_progress_file(mission_dir, current_progress)
                 
             # 更新缓存
             with self._lock:
@@ -152,10 +166,46 @@ class TaskProgress:
         except Exception as e:
             print(f"更新任务进度时出错: {e}")
             return False
+
+    def _merge_update(self, current_progress, progress_update):
+        """把部分进度数据合并到 current_progress（保持总数锁定语义）"""
+        # 检查总数是否已锁定
+        is_locked = current_progress.get('total_files_locked', False)
+
+        if 'total_files' in progress_update:
+            incoming_total = progress_update.get('total_files', 0) or 0
+            current_total = current_progress.get('total_files', 0) or 0
+
+            if is_locked and incoming_total <= current_total and current_total > 0:
+                progress_update_copy = progress_update.copy()
+                progress_update_copy['total_files'] = current_total
+                progress_update_copy['total_files_locked'] = True
+                current_progress.update(progress_update_copy)
+                print(f"调试信息 - 总数已锁定，保持原有总数: {current_total}")
+            else:
+                if current_total != incoming_total:
+                    print(f"调试信息 - 更新文件总数: {current_total} -> {incoming_total}")
+                current_progress.update(progress_update)
+                if is_locked:
+                    current_progress['total_files_locked'] = True
+        else:
+            current_progress.update(progress_update)
+
+        total_after = current_progress.get('total_files', 0) or 0
+        processed_after = current_progress.get('processed_files', 0) or 0
+        if total_after > 0 and processed_after > total_after:
+            current_progress['processed_files'] = total_after
+
+        current_progress['last_update'] = time.time()
     
     def get_progress(self, mission_dir):
         """获取任务进度"""
         try:
+            # 由进度事件维护的任务直接使用内存状态
+            with self._lock:
+                if mission_dir in self._tracked and mission_dir in self._progress_cache:
+                    return self._progress_cache[mission_dir]
+
             progress_file = self.get_progress_file_path(mission_dir)
             
             # 检查缓存是否有效
@@ -348,14 +398,13 @@ class TaskProgress:
         """直接保存进度数据到文件，不触发验证，避免递归"""
         try:
             progress_data['last_update'] = time.time()
-            progress_file = self.get_progress_file_path(mission_dir)
-            with open(progress_file, 'w', encoding='utf-8') as f:
-                json.dump(progress_data, f, indent=4, ensure_ascii=False)
+            self._write_progress_file(mission_dir, progress_data)
             
             # 更新缓存
             with self._lock:
                 self._progress_cache[mission_dir] = progress_data
                 self._last_update[mission_dir] = time.time()
+                self._dirty.discard(mission_dir)
         except Exception as e:
             print(f"直接保存进度数据时出错: {e}")
     
@@ -427,6 +476,81 @@ class TaskProgress:
         except Exception as e:
             print(f"更新步骤进度时出错: {e}")
             return False
+
+    def apply_event(self, event):
+        """把一个进度事件应用到内存状态（见 clientui.progress_events.emit），不立即写盘，由 flush 批量写入"""
+        mission_dir = event.get('mission_dir')
+        event_type = event.get('type')
+        if not mission_dir:
+            return
+
+        if event_type == 'init':
+            # 与 preset_infer_cli.init_mission_progress 相同：进度不存在或缺少步骤进度时重新初始化
+            self.track(mission_dir)
+            with self._lock:
+                progress_data = self._progress_cache.get(mission_dir)
+            if not progress_data or not progress_data.get('step_progress'):
+                self.init_progress(mission_dir, event.get('input_dir', ''), event.get('preset_name'))
+            return
+
+        self.track(mission_dir)
+        with self._lock:
+            progress_data = self._progress_cache.get(mission_dir)
+            if progress_data is None:
+                return
+
+            if event_type == 'file':
+                file_path = event.get('file', '')
+                file_name = os.path.basename(file_path)
+                status = event.get('status', 'completed')
+                done = self._done_files.setdefault(mission_dir, set())
+                if status == 'completed' and file_path not in done:
+                    done.add(file_path)
+                    total = progress_data.get('total_files', 0) or 0
+                    processed = (progress_data.get('processed_files', 0) or 0) + 1
+                    progress_data['processed_files'] = min(processed, total) if total > 0 else processed
+                progress_data.setdefault('details', []).append({
+                    'file_name': file_name,
+                    'status': status,
+                    'update_time': time.time()
+                })
+            elif event_type == 'step':
+                step_key = f"step{event.get('step_index')}"
+                step_progress = progress_data.get('step_progress', {})
+                if step_key not in step_progress:
+                    return
+                if 'file' in event:
+                    done = self._done_steps.setdefault(mission_dir, {}).setdefault(step_key, set())
+                    if event['file'] in done:
+                        return
+                    done.add(event['file'])
+                    step_progress[step_key]['processed'] = step_progress[step_key].get('processed', 0) + 1
+                else:
+                    step_progress[step_key]['processed'] = event.get('processed_files', 0)
+            elif event_type == 'update':
+                self._merge_update(progress_data, event.get('data', {}))
+            else:
+                return
+
+            progress_data['last_update'] = time.time()
+            self._last_update[mission_dir] = time.time()
+            self._dirty.add(mission_dir)
+
+    def flush(self):
+        """把所有已变化的内存进度批量、原子地写入各自的 progress.json"""
+        with self._lock:
+            pending = {}
+            for mission_dir in self._dirty:
+                if mission_dir in self._progress_cache:
+                    pending[mission_dir] = json.loads(json.dumps(self._progress_cache[mission_dir]))
+            self._dirty.clear()
+
+        for mission_dir, progress_data in pending.items():
+            try:
+                if os.path.isdir(mission_dir):
+                    self._write_progress_file(mission_dir, progress_data)
+            except Exception as e:
+                print(f"写入进度文件时出错: {mission_dir}, 错误: {e}")
     
     def _get_outputs_per_song(self, mission_dir):
         """获取每首歌生成的输出文件数量"""
@@ -713,6 +837,10 @@ class TaskProgress:
                     del self._progress_cache[mission_dir]
                 if mission_dir in self._last_update:
                     del self._last_update[mission_dir]
+                self._tracked.discard(mission_dir)
+                self._dirty.discard(mission_dir)
+                self._done_files.pop(mission_dir, None)
+                self._done_steps.pop(mission_dir, None)
             
             return True
         except Exception as e:
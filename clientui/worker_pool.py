@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+import subprocess
+from pathlib import Path
+
+import psutil
+
+from clientui.preset_worker import WORKER_MARKER
+
+
+class WorkerJob:
+    """
+    交给常驻推理进程的一个任务，接口与 subprocess.Popen 相同（poll/pid），Manager 不需要区分两种执行方式
+    """
+
+    def __init__(self, worker, request):
+        self.worker = worker
+        self.request = request
+        self.pid = worker.pid
+        self.returncode = None
+        self.done = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def finish(self, returncode):
+        if self.returncode is None:
+            self.returncode = returncode
+            self.done.set()
+
+
+class WorkerExecutor:
+    """
+    与 CommandExecutor 相同的接口：process 为当前任务，kill_command 终止任务
+    """
+
+    def __init__(self, pool, job):
+        self.pool = pool
+        self.process = job
+
+    def kill_command(self):
+        if self.process and self.process.poll() is None:
+            self.pool.kill(self.process.worker)
+        else:
+            print("There is no running process to kill.")
+
+    def cancel(self, input_dir):
+        """取消批量任务中的一个输入文件夹，其余任务继续执行"""
+        if self.process and self.process.poll() is None:
+            self.process.worker.send({"type": "cancel", "input_dir": str(input_dir)})
+
+
+class PresetWorker:
+    """
+    常驻推理进程，启动后只导入一次 torch 和 webui 模块，模型在任务之间保持缓存
+    每个进程固定在一个设备上（通过 CUDA_VISIBLE_DEVICES），一次执行一个任务
+    """
+
+    def __init__(self, device, env, on_done):
+        current_dir = Path.cwd()
+        python = current_dir / "workenv" / "python.exe"
+        script = current_dir / "clientui" / "preset_worker.py"
+
+        self.device = device
+        self.preset_name = None
+        self.job = None
+        self.last_used = time.time()
+        self._on_done = on_done
+
+        env = dict(env)
+        env["PYTHONIOENCODING"] = "utf-8"
+        self.process = subprocess.Popen(
+            [str(python), "-u", str(script)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self.pid = self.process.pid
+        print(f"调试信息 - 启动常驻推理进程: PID {self.pid}, 设备: {device}")
+        threading.Thread(target=self._read, name=f"preset_worker_{self.pid}", daemon=True).start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+
+    def submit(self, job, preset_name):
+        self.job = job
+        self.preset_name = preset_name
+        self.send(job.request)
+
+    def _read(self):
+        for line in self.process.stdout:
+            if not line.startswith(WORKER_MARKER):
+                sys.stdout.write(line)
+                continue
+            try:
+                message = json.loads(line[len(WORKER_MARKER):])
+            except ValueError:
+                continue
+            if message.get("type") == "ready":
+                print(f"调试信息 - 常驻推理进程就绪: PID {self.pid}, 启动耗时 {message.get('startup')}s")
+            elif message.get("type") == "done":
+                job = self.job
+                if job is not None and job.request.get("id") == message.get("id"):
+                    self.job = None
+                    self.last_used = time.time()
+                    print(f"调试信息 - 常驻推理进程 {self.pid} 完成任务 {message.get('id')}, 耗时 {message.get('time')}s")
+                    self._on_done(self)
+                    job.finish(message.get("exit_code", 1))
+
+        # 进程退出（崩溃或被终止），正在执行的任务以进程的退出码结束
+        returncode = self.process.wait()
+        job = self.job
+        self.job = None
+        if job is not None:
+            job.finish(returncode or 1)
+
+    def close(self):
+        """关闭标准输入，进程执行完当前任务后退出"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def kill(self):
+        if not self.alive():
+            return
+        try:
+            parent = psutil.Process(self.pid)
+            for child in parent.children(recursive=True):
+                child.kill()
+            parent.kill()
+            print("The running process has been terminated.")
+        except psutil.NoSuchProcess:
+            print("The process does not exist.")
+        except Exception as e:
+            print(f"Error when terminating process: {e}")
+
+
+class WorkerPool:
+    """
+    常驻推理进程池，代替每个任务启动一个新的 preset_infer_cli.py 进程
+
+    任务结束后进程留在池中，下一个任务优先交给同一设备上刚运行过相同预设的进程，直接复用已缓存的模型。
+    空闲进程占用的内存按其预设在调度器中预留；调度器放不下新任务时回收最久未用的空闲进程。
+    MSST_WORKER_MAX_IDLE 为最多保留的空闲进程数（默认2），MSST_WORKER_IDLE_TIMEOUT 为空闲多久（秒，默认600）后回收
+    """
+
+    def __init__(self, scheduler, max_idle=None, idle_timeout=None):
+        self.scheduler = scheduler
+        self.max_idle = max_idle if max_idle is not None else int(os.environ.get("MSST_WORKER_MAX_IDLE", 2))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.environ.get("MSST_WORKER_IDLE_TIMEOUT", 600))
+        self.idle: list[PresetWorker] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, device, preset_name, preset_path, input_dirs, output_dir, output_format, debug=False, batch=False, output_dirs=None):
+        """把任务交给设备上的常驻进程（没有空闲进程时启动一个），返回 WorkerExecutor
+        批量任务的 output_dirs 与 input_dirs 一一对应，每个任务的结果写入自己的输出目录
+        """
+        worker = self._acquire(device, preset_name)
+        request = {
+            "id": next(self._ids),
+            "preset_path": str(preset_path),
+            "input_dirs": [str(d) for d in input_dirs],
+            "output_dir": str(output_dir),
+            "output_dirs": [str(d) for d in output_dirs] if output_dirs else None,
+            "output_format": str(output_format),
+            "debug": bool(debug),
+            "batch": bool(batch),
+        }
+        job = WorkerJob(worker, request)
+        try:
+            worker.submit(job, preset_name)
+        except OSError:
+            worker.kill()
+            raise
+        print(f"调试信息 - 任务 {request['id']} 交给常驻推理进程 {worker.pid} ({device})")
+        return WorkerExecutor(self, job)
+
+    def _acquire(self, device, preset_name):
+        with self._lock:
+            candidates = [w for w in self.idle if w.device == device and w.alive()]
+            if candidates:
+                # 优先选择上一次运行相同预设的进程，其次选择最近使用的进程
+                worker = max(candidates, key=lambda w: (w.preset_name == preset_name, w.last_used))
+                self.idle.remove(worker)
+                self.scheduler.release(worker)
+                print(f"调试信息 - 复用常驻推理进程 {worker.pid}, 上一个预设: {worker.preset_name}")
+                return worker
+        return PresetWorker(device, self.scheduler.get_env(device), self._on_done)
+
+    def _on_done(self, worker):
+        with self._lock:
+            if not worker.alive():
+                return
+            self.idle.append(worker)
+            self.scheduler.reserve(worker, worker.device, worker.preset_name)
+            while len(self.idle) > self.max_idle:
+                self._close(min(self.idle, key=lambda w: w.last_used))
+
+    def _close(self, worker):
+        self.idle.remove(worker)
+        self.scheduler.release(worker)
+        worker.close()
+        print(f"调试信息 - 回收常驻推理进程 {worker.pid}")
+
+    def kill(self, worker):
+        """终止进程及其子进程（与 CommandExecutor.kill_command 相同），正在执行的任务以非零退出码结束"""
+        with self._lock:
+            if worker in self.idle:
+                self.idle.remove(worker)
+                self.scheduler.release(worker)
+        worker.kill()
+
+    def evict_idle(self):
+        """回收最久未用的空闲进程，释放它占用的内存，没有空闲进程时返回False"""
+        with self._lock:
+            if not self.idle:
+                return False
+            self._close(min(self.idle, key=lambda w: w.last_used))
+            return True
+
+    def reap(self):
+        """回收已退出或空闲超时的进程"""
+        now = time.time()
+        with self._lock:
+            for worker in self.idle[:]:
+                if not worker.alive() or now - worker.last_used > self.idle_timeout:
+                    self._close(worker)
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self.idle[:]:
+                self._close(worker)
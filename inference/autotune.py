@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import platform
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import yaml
+
+from utils.constant import get_cache_dir
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# 自动调优的推理参数，与 MSSeparator 的 inference_params 和 webui 的 save_model_config 相同
+TUNED_PARAMS = ["batch_size", "num_overlap", "chunk_size"]
+# chunk_size 可以自由改变的模型类型，其他模型的 chunk_size 由网络结构决定（如 mdx23c 的 dim_t），只调整 batch_size 和 num_overlap
+CHUNK_SIZE_MODEL_TYPES = ["bs_roformer", "mel_band_roformer"]
+
+PROFILE_DIR = os.path.join(get_cache_dir(), "autotune")
+
+
+def autotune_enabled() -> bool:
+    """
+    环境变量 MSST_AUTOTUNE=0 时 MSSeparator 不加载调优参数
+    """
+    return os.environ.get("MSST_AUTOTUNE", "1").strip().lower() not in ["0", "false", "off"]
+
+
+def _cpu_name() -> str:
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def get_device_name(device: str, device_ids: List[int] = [0]) -> str:
+    """
+    设备型号，调优结果按型号保存：同型号的设备共用一份参数，更换显卡或CPU后需要重新调优
+    """
+    if device.startswith("cuda"):
+        index = int(device.split(":")[1]) if ":" in device else device_ids[0]
+        props = torch.cuda.get_device_properties(index)
+        name = f"{props.name} {round(props.total_memory / 1024 ** 3)}GB"
+        if len(device_ids) > 1:
+            name += f" x{len(device_ids)}"
+        return name
+    if device == "mps":
+        return f"mps {platform.machine()}"
+    # cpu 和 onnx-cpu
+    return f"{device} {_cpu_name()} {os.cpu_count()} threads"
+
+
+def get_profile_path(model_path: str, device_name: str, precision: str = "fp32") -> str:
+    from inference.result_cache import hash_file
+
+    device_tag = re.sub(r"[^0-9A-Za-z.]+", "_", device_name).strip("_")
+    if precision and precision != "fp32":
+        device_tag += f"_{precision}"
+    return os.path.join(PROFILE_DIR, f"{os.path.basename(model_path)}.{hash_file(model_path)[:16]}.{device_tag}.json")
+
+
+def load_autotune_profile(model_path: str, device: str, device_ids: List[int] = [0], precision: str = "fp32") -> Optional[dict]:
+    """
+    读取检查点在该设备型号上的调优结果，检查点改变后结果自动失效
+    """
+    try:
+        with open(get_profile_path(model_path, get_device_name(device, device_ids), precision), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_autotune_profile(model_path: str, device_name: str, precision: str, profile: dict) -> str:
+    path = get_profile_path(model_path, device_name, precision)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_tuned_params(model_path: str, device: str, device_ids: List[int] = [0], precision: str = "fp32") -> Dict[str, int]:
+    """
+    MSSeparator 使用的调优参数 {batch_size, num_overlap, chunk_size}，没有调优结果或 MSST_AUTOTUNE=0 时返回空字典
+    """
+    if not autotune_enabled():
+        return {}
+    try:
+        profile = load_autotune_profile(model_path, device, device_ids, precision)
+    except Exception as e:
+        logger.debug(f"Cannot load the autotune profile: {e}")
+        return {}
+    if not profile or not profile.get("params"):
+        return {}
+    return {key: int(value) for key, value in profile["params"].items() if key in TUNED_PARAMS and value}
+
+
+class PeakMemory:
+    """
+    记录一段代码的峰值内存（MB）：CUDA 使用 torch 的峰值统计，CPU 在后台线程中采样进程的RSS，其他设备不记录
+    """
+
+    def __init__(self, device: str, interval: float = 0.05):
+        self.device = device
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+        elif self.device in ["cpu", "onnx-cpu"]:
+            import psutil
+
+            process = psutil.Process()
+            self.peak = process.memory_info().rss
+
+            def sample():
+                while not self._stop.wait(self.interval):
+                    self.peak = max(self.peak, process.memory_info().rss)
+
+            self._thread = threading.Thread(target=sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize(self.device)
+            self.peak = torch.cuda.max_memory_allocated(self.device)
+        elif self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        if self.peak is not None:
+            self.peak = self.peak / 1024 ** 2
+        return False
+
+
+def get_device_memory(device: str) -> Optional[float]:
+    """设备的总内存（MB），未知时返回 None"""
+    if device.startswith("cuda"):
+        return torch.cuda.get_device_properties(device).total_memory / 1024 ** 2
+    if device in ["cpu", "onnx-cpu"]:
+        import psutil
+
+        return psutil.virtual_memory().total / 1024 ** 2
+    return None
+
+
+def is_out_of_memory(e: Exception) -> bool:
+    return isinstance(e, getattr(torch.cuda, "OutOfMemoryError", ())) or "out of memory" in str(e).lower()
+
+
+def read_inference_params(config_path: str) -> Dict[str, Optional[int]]:
+    """
+    直接从配置文件读取 batch_size、num_overlap、chunk_size 和 hop_length。模型管理器缓存的配置会被 MSSeparator 的 inference_params 修改，不能作为基准
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader) or {}
+    inference, audio = config.get("inference") or {}, config.get("audio") or {}
+    return {
+        "batch_size": int(inference.get("batch_size") or 1),
+        "num_overlap": int(inference.get("num_overlap") or 4),
+        "chunk_size": int(audio.get("chunk_size") or 0) or None,
+        "hop_length": int(audio.get("hop_length") or 1),
+    }
+
+
+def get_candidates(model_type: str, base: Dict[str, Optional[int]], batch_sizes=None, num_overlaps=None, chunk_sizes=None):
+    """
+    调优的候选参数，未指定时以配置中的值为基准：
+    batch_size 1~16，num_overlap 2~4，chunk_size 为配置值的 1/2、1、2 倍（只对 CHUNK_SIZE_MODEL_TYPES）
+    """
+    batch_sizes = batch_sizes or sorted({1, 2, 4, 8, 16, base["batch_size"]})
+    num_overlaps = num_overlaps or sorted({2, 4, base["num_overlap"]})
+    if chunk_sizes is None:
+        chunk_size, hop_length = base["chunk_size"], base["hop_length"]
+        chunk_sizes = [chunk_size]
+        if model_type in CHUNK_SIZE_MODEL_TYPES and chunk_size:
+            chunk_sizes = sorted({chunk_size // 2 // hop_length * hop_length, chunk_size, chunk_size * 2})
+    return sorted(batch_sizes), sorted(num_overlaps), sorted(chunk_sizes, key=lambda c: c or 0)
+
+
+def autotune(
+    model_type: str,
+    config_path: str,
+    model_path: str,
+    mix: np.ndarray,
+    sample_rate: int,
+    device: str = "auto",
+    device_ids: List[int] = [0],
+    batch_sizes: Optional[List[int]] = None,
+    num_overlaps: Optional[List[int]] = None,
+    chunk_sizes: Optional[List[int]] = None,
+    reference_overlap: int = 8,
+    min_sdr: float = 30.0,
+    max_memory: Optional[float] = None,
+    memory_fraction: float = 0.9,
+    cpu_precision: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    在本机设备上扫描 batch_size、num_overlap 和 chunk_size，返回并保存调优结果：
+    {"params": 选中的参数, "results": [{参数, "throughput": 每秒处理的音频秒数, "peak_memory": MB, "sdr": dB, "status": ok/oom/error}, ...]}
+
+    mix 为 (声道数, 采样点数) 的测试音频。参考结果使用配置中的 chunk_size 和 reference_overlap，
+    每组参数的SDR以参考结果为基准（越高越接近参考）。选中的参数为 SDR 不低于 min_sdr、峰值内存不超过
+    max_memory（默认设备内存的 memory_fraction）的组合中吞吐量最高的一个
+    """
+    from inference.msst_infer import MSSeparator
+    from utils.utils import get_metrics
+
+    duration = mix.shape[-1] / sample_rate
+
+    def run(params):
+        separator = MSSeparator(model_type, config_path, model_path, device=device, device_ids=device_ids, store_dirs={}, inference_params=dict(params, normalize=None), cpu_precision=cpu_precision)
+        # 每组参数都要实际计算，不使用结果缓存
+        separator.result_cache = None
+        try:
+            # 预热：cudnn.benchmark、编译等只在第一次以某个形状调用时发生，不计入耗时
+            warmup = 2 * (params["chunk_size"] or 10 * sample_rate)
+            separator.separate(mix[..., :warmup])
+            with PeakMemory(separator.model_device) as memory:
+                start_time = time.time()
+                results = separator.separate(mix)
+                elapsed = time.time() - start_time
+            return results, elapsed, memory.peak, separator
+        finally:
+            separator.del_cache()
+
+    base = read_inference_params(config_path)
+    batch_sizes, num_overlaps, chunk_sizes = get_candidates(model_type, base, batch_sizes, num_overlaps, chunk_sizes)
+    reference_params = {"batch_size": base["batch_size"], "num_overlap": reference_overlap, "chunk_size": base["chunk_size"]}
+    logger.info(f"Computing the reference with {reference_params}")
+    reference, _, _, separator = run(reference_params)
+    model_device, precision = separator.model_device, separator.cpu_precision
+    del separator
+
+    device_name = get_device_name(model_device, device_ids)
+    if max_memory is None and get_device_memory(model_device) is not None:
+        max_memory = get_device_memory(model_device) * memory_fraction
+    logger.info(f"Autotuning on {device_name}, batch_size: {batch_sizes}, num_overlap: {num_overlaps}, chunk_size: {chunk_sizes}, memory limit: {max_memory} MB")
+
+    results = []
+    for chunk_size in chunk_sizes:
+        for num_overlap in num_overlaps:
+            for batch_size in batch_sizes:
+                params = {"batch_size": batch_size, "num_overlap": num_overlap, "chunk_size": chunk_size}
+                result = dict(params, throughput=None, peak_memory=None, sdr=None, status="ok")
+                results.append(result)
+                try:
+                    estimates, elapsed, peak, _ = run(params)
+                except Exception as e:
+                    result["status"] = "oom" if is_out_of_memory(e) else "error"
+                    logger.warning(f"{params}: {result['status']}, {e}")
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                    # 更大的batch同样会内存不足
+                    if result["status"] == "oom":
+                        break
+                    continue
+
+                sdrs = [get_metrics(["sdr"], reference[instr].T, estimates[instr].T, mix)["sdr"] for instr in reference if instr in estimates]
+                result.update(throughput=duration / elapsed, peak_memory=peak, sdr=float(np.mean(sdrs)) if sdrs else None)
+                logger.info(f"{params}: {result['throughput']:.2f}x realtime, peak memory: {peak if peak is None else round(peak)} MB, SDR: {result['sdr']:.2f} dB")
+
+    def acceptable(r):
+        return (
+            r["status"] == "ok"
+            and r["sdr"] is not None and r["sdr"] >= min_sdr
+            and (max_memory is None or r["peak_memory"] is None or r["peak_memory"] <= max_memory)
+        )
+
+    candidates = [r for r in results if acceptable(r)]
+    best = max(candidates, key=lambda r: r["throughput"]) if candidates else None
+    if best is None:
+        logger.warning(f"No parameters reached {min_sdr} dB within the memory limit, keeping the model config")
+
+    profile = {
+        "model_type": model_type,
+        "model_path": model_path,
+        "config_path": config_path,
+        "device": model_device,
+        "device_name": device_name,
+        "cpu_precision": precision,
+        "torch_version": torch.__version__,
+        "duration": duration,
+        "reference": reference_params,
+        "min_sdr": min_sdr,
+        "max_memory": max_memory,
+        "params": {key: best[key] for key in TUNED_PARAMS if best[key]} if best else {},
+        "results": results,
+    }
+    path = save_autotune_profile(model_path, device_name, precision, profile)
+    logger.info(f"Autotune profile saved to {path}, params: {profile['params']}")
+    return profile
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import glob
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import yaml
+
+from utils.constant import get_cache_dir
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# CPU推理精度：demix 的 autocast 只对CUDA生效，CPU上默认总是float32
+CPU_PRECISIONS = ["fp32", "bf16", "int8"]
+# int8 动态量化只用于以线性层为主的 roformer 模型
+INT8_MODEL_TYPES = ["bs_roformer", "mel_band_roformer"]
+
+PROFILE_DIR = os.path.join(get_cache_dir(), "cpu_precision")
+
+
+def read_cpu_precision(config_path: str) -> str:
+    """
+    读取模型配置中 inference.cpu_precision（fp32/bf16/int8/auto），未设置时为 fp32
+    在模型加载之前调用，模型管理器的缓存键需要用到精度
+    """
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = yaml.load(f, Loader=yaml.FullLoader) or {}
+        return str((config.get("inference") or {}).get("cpu_precision", "fp32")).lower()
+    except Exception as e:
+        logger.warning(f"Cannot read cpu_precision from {config_path}: {e}")
+        return "fp32"
+
+
+def bf16_supported() -> bool:
+    """
+    CPU是否原生支持bf16矩阵运算（AVX512-BF16 或 AMX），不支持时bf16由软件模拟，比float32更慢
+    """
+    for check in ["_is_amx_tile_supported", "_is_avx512_bf16_supported"]:
+        fn = getattr(torch.cpu, check, None)
+        if fn is not None and fn():
+            return True
+    return False
+
+
+def resolve_cpu_precision(precision: Optional[str], model_type: str, model_path: str) -> str:
+    """
+    把配置中的精度转换为实际使用的精度：auto 使用精度报告中推荐的精度，不支持的组合回退到 fp32
+    """
+    precision = (precision or "fp32").lower()
+    if precision == "auto":
+        profile = load_precision_profile(model_path)
+        precision = profile.get("recommended", "fp32") if profile else "fp32"
+        logger.info(f"cpu_precision auto: {precision}" + ("" if profile else " (no precision report for this checkpoint)"))
+    if precision not in CPU_PRECISIONS:
+        logger.warning(f"Invalid cpu_precision: {precision}, choices: {CPU_PRECISIONS + ['auto']}")
+        return "fp32"
+    if precision == "int8" and model_type not in INT8_MODEL_TYPES:
+        logger.warning(f"int8 is only supported for {INT8_MODEL_TYPES}, using fp32")
+        return "fp32"
+    if precision == "bf16" and not bf16_supported():
+        logger.warning("This CPU has no native bf16 support, using fp32")
+        return "fp32"
+    return precision
+
+
+def quantize_int8(model: torch.nn.Module) -> int:
+    """
+    动态int8量化 roformer 的 Attention、FeedForward、BandSplit 和 MaskEstimator 中的线性层（原地修改），返回量化的层数
+    权重以int8保存，激活在运行时按批量化，权重占用的内存和带宽约为float32的1/4
+    """
+    from modules.bs_roformer import bs_roformer, mel_band_roformer
+
+    blocks = tuple(
+        getattr(module, name)
+        for module in [bs_roformer, mel_band_roformer]
+        for name in ["Attention", "LinearAttention", "FeedForward", "BandSplit", "MaskEstimator"]
+    )
+    names = set()
+    for name, module in model.named_modules():
+        if isinstance(module, blocks):
+            for child_name, child in module.named_modules():
+                if isinstance(child, torch.nn.Linear):
+                    names.add(f"{name}.{child_name}")
+
+    qconfig = torch.ao.quantization.default_dynamic_qconfig
+    torch.ao.quantization.quantize_dynamic(model, {name: qconfig for name in names}, dtype=torch.qint8, inplace=True)
+    return len(names)
+
+
+class CpuAutocastModel(torch.nn.Module):
+    """
+    在CPU bf16 autocast 中执行的模型，输出转换回float32，demix 的重叠相加仍用float32；原模型保存在 module 属性中
+    """
+
+    def __init__(self, module: torch.nn.Module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            out = self.module(x)
+        return out.float() if isinstance(out, torch.Tensor) else out
+
+
+def apply_cpu_precision(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    if precision == "int8":
+        logger.info(f"int8动态量化: {quantize_int8(model)} 个线性层")
+    elif precision == "bf16":
+        model = CpuAutocastModel(model)
+    return model
+
+
+def get_profile_path(model_path: str) -> str:
+    from inference.result_cache import hash_file
+
+    return os.path.join(PROFILE_DIR, f"{os.path.basename(model_path)}.{hash_file(model_path)[:16]}.json")
+
+
+def load_precision_profile(model_path: str) -> Optional[dict]:
+    """
+    读取检查点的精度报告，检查点改变后报告自动失效
+    """
+    try:
+        with open(get_profile_path(model_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_precision_profile(model_path: str, report: dict):
+    path = get_profile_path(model_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_reference_set(reference_dir: str, instruments: List[str], sample_rate: int, extension: str = "wav"):
+    """
+    参考数据集的格式与验证集相同：<目录>/<曲目>/mixture.wav 和 <曲目>/<乐器>.wav
+    所有音频的采样率必须与模型的 sample_rate 相同，否则分离结果和SDR没有意义
+    """
+    import soundfile as sf
+
+    tracks = []
+    mismatched = []
+    for mixture_path in sorted(glob.glob(os.path.join(reference_dir, "*", f"mixture.{extension}"))):
+        folder = os.path.dirname(mixture_path)
+        mix, sr = sf.read(mixture_path, dtype="float32")
+        if sr != sample_rate:
+            mismatched.append(f"{mixture_path} ({sr} Hz)")
+            continue
+        references = {}
+        for instr in instruments:
+            stem_path = os.path.join(folder, f"{instr}.{extension}")
+            if os.path.exists(stem_path):
+                stem, stem_sr = sf.read(stem_path, dtype="float32")
+                if stem_sr != sample_rate:
+                    mismatched.append(f"{stem_path} ({stem_sr} Hz)")
+                    continue
+                references[instr] = stem
+        if references:
+            tracks.append((os.path.basename(folder), mix, sr, references))
+    if mismatched:
+        raise ValueError(f"The reference set must be at the model sample rate ({sample_rate} Hz), resample these files: {', '.join(mismatched)}")
+    return tracks
+
+
+def evaluate_precisions(
+    model_type: str,
+    config_path: str,
+    model_path: str,
+    reference_dir: str,
+    precisions: List[str] = CPU_PRECISIONS,
+    metrics: List[str] = ["sdr"],
+    max_sdr_drop: float = 0.1,
+    extension: str = "wav",
+) -> Dict[str, object]:
+    """
+    在参考数据集上用每种CPU精度分离，用 utils.utils.get_metrics 计算指标，返回并保存精度报告：
+    {"precisions": {精度: {"metrics": {指标: {乐器: 平均值}}, "sdr_delta": 与fp32相比的平均SDR变化, "time": 秒}}, "recommended": 精度}
+    推荐精度为平均SDR下降不超过 max_sdr_drop dB 的精度中最快的一个
+    """
+    from inference.msst_infer import MSSeparator
+    from utils.utils import get_metrics
+
+    metrics = list(dict.fromkeys(["sdr"] + list(metrics)))
+    precisions = list(dict.fromkeys(["fp32"] + list(precisions)))
+    report = {"model_path": model_path, "config_path": config_path, "reference_dir": reference_dir, "precisions": {}}
+
+    tracks = None
+    for precision in precisions:
+        separator = MSSeparator(model_type, config_path, model_path, device="cpu", store_dirs={}, cpu_precision=precision)
+        if separator.cpu_precision != precision:
+            logger.warning(f"Skip {precision}, not available for this model or CPU")
+            continue
+        # 每种精度都要实际计算，不使用结果缓存
+        separator.result_cache = None
+
+        instruments = list(separator.config.training.instruments)
+        if tracks is None:
+            sample_rate = int(separator.config.audio.get("sample_rate", 44100))
+            tracks = load_reference_set(reference_dir, instruments, sample_rate, extension)
+            if not tracks:
+                raise ValueError(f"No reference tracks found in {reference_dir}, expected <track>/mixture.{extension} and <track>/<instrument>.{extension}")
+
+        values = {metric: {instr: [] for instr in instruments} for metric in metrics}
+        elapsed = 0.0
+        for name, mix, sr, references in tracks:
+            start_time = time.time()
+            results = separator.separate(mix.T)
+            elapsed += time.time() - start_time
+            for instr, reference in references.items():
+                if instr not in results:
+                    continue
+                track_metrics = get_metrics(metrics, reference.T, results[instr].T, mix.T)
+                for metric, value in track_metrics.items():
+                    values[metric][instr].append(float(value))
+            logger.info(f"{precision}: {name} done")
+        separator.del_cache()
+
+        means = {metric: {instr: float(np.mean(v)) for instr, v in per_instr.items() if v} for metric, per_instr in values.items()}
+        report["precisions"][precision] = {"metrics": means, "time": elapsed}
+
+    fp32_sdr = report["precisions"]["fp32"]["metrics"]["sdr"]
+    recommended, best_time = "fp32", report["precisions"]["fp32"]["time"]
+    for precision, result in report["precisions"].items():
+        sdr = result["metrics"]["sdr"]
+        deltas = [sdr[instr] - fp32_sdr[instr] for instr in sdr if instr in fp32_sdr]
+        result["sdr_delta"] = float(np.mean(deltas)) if deltas else 0.0
+        if result["sdr_delta"] >= -max_sdr_drop and result["time"] < best_time:
+            recommended, best_time = precision, result["time"]
+    report["recommended"] = recommended
+
+    path = save_precision_profile(model_path, report)
+    logger.info(f"Precision report saved to {path}, recommended: {recommended}")
+    return report
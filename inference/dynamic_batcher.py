@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class DynamicBatcher:
+    """
+    动态批处理器：收集同一模型上多个并发音轨的分块，凑满目标batch大小或等待超时后执行一次前向推理，
+    再把输出按提交顺序拆分返回给各个音轨
+    """
+
+    def __init__(self, model: torch.nn.Module, config, device: str, max_batch_size: int, max_wait: float = 0.01):
+        self.model = model
+        self.config = config
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"batches": 0, "chunks": 0, "requests": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="msst_dynamic_batcher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join(timeout=10)
+                self._thread = None
+
+    def submit(self, chunks: torch.Tensor) -> Future:
+        """
+        chunks: (n, channels, chunk_size)，返回的Future结果为模型输出 (n, ...)，位于推理设备上
+        """
+        self.start()
+        future = Future()
+        self._queue.put((chunks, future))
+        return future
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["chunks"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _collect(self, first) -> Tuple[List, Optional[Tuple], bool]:
+        """
+        返回 (本批的请求, 留给下一批的请求, 是否停止)；合并后的分块数不超过 max_batch_size，
+        放不下的请求整体留到下一批（单个请求本身超过上限时单独执行）
+        """
+        pending = [first]
+        count = first[0].shape[0]
+        deadline = time.time() + self.max_wait
+        while count < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return pending, None, True
+            if count + item[0].shape[0] > self.max_batch_size:
+                return pending, item, False
+            pending.append(item)
+            count += item[0].shape[0]
+        return pending, None, False
+
+    def _loop(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            if first is None:
+                break
+            pending, carry, stop = self._collect(first)
+            self._run(pending)
+            if stop:
+                break
+
+    def _run(self, pending):
+        try:
+            arr = torch.cat([chunks for chunks, _ in pending], dim=0).to(self.device)
+            with torch.amp.autocast("cuda", enabled=self.config.training.get("use_amp", True)):
+                with torch.inference_mode():
+                    x = self.model(arr)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for chunks, future in pending:
+            n = chunks.shape[0]
+            future.set_result(x[offset : offset + n])
+            offset += n
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["chunks"] += offset
+            self._stats["requests"] += len(pending)
@@ -0,0 +1,160 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+import torch
+
+from utils.constant import get_cache_dir
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# demix 总是以固定的 (batch_size, 声道数, chunk_size) 调用这些模型，适合静态形状编译
+COMPILE_MODEL_TYPES = ["bs_roformer", "mel_band_roformer", "mdx23c", "scnet", "scnet_unofficial", "htdemucs"]
+COMPILE_MODES = ["compile", "export"]
+
+
+def get_compile_mode() -> Optional[str]:
+    """
+    读取环境变量 MSST_MODEL_COMPILE：未设置或为0时不编译，1/compile 使用 torch.compile，export 使用 torch.export + AOTInductor
+    """
+    mode = os.environ.get("MSST_MODEL_COMPILE", "").strip().lower()
+    if mode in ["", "0", "false", "off"]:
+        return None
+    if mode in ["1", "true", "on"]:
+        return "compile"
+    if mode not in COMPILE_MODES:
+        logger.warning(f"Invalid MSST_MODEL_COMPILE: {mode}, choices: {COMPILE_MODES}")
+        return None
+    return mode
+
+
+def _slice_batch(output, batch):
+    if isinstance(output, torch.Tensor):
+        return output[:batch]
+    if isinstance(output, (list, tuple)):
+        return type(output)(_slice_batch(o, batch) for o in output)
+    if isinstance(output, dict):
+        return {k: _slice_batch(v, batch) for k, v in output.items()}
+    return output
+
+
+class CompiledModel(torch.nn.Module):
+    """
+    静态形状编译的模型，接口与原模型相同，原模型保存在 module 属性中（与 DataParallel 相同）
+
+    第一次以某个形状调用时编译（或从磁盘缓存加载）该形状的版本，之后较小的batch（每个音轨的最后一批）补零后复用同一个版本。
+    编译产物按 (检查点和配置的哈希, torch版本, 输入形状, 设备, 精度) 保存在缓存目录的 compiled 文件夹中（或 MSST_MODEL_COMPILE_DIR），
+    编译失败、训练模式或设备不同（如模型被转移到CPU）时使用原模型
+    """
+
+    def __init__(self, module: torch.nn.Module, mode: str, cache_key: str, cache_dir: Optional[str] = None):
+        super().__init__()
+        self.module = module
+        self.mode = mode
+        self.cache_key = cache_key
+        self.cache_dir = cache_dir or os.environ.get("MSST_MODEL_COMPILE_DIR") or os.path.join(get_cache_dir(), "compiled")
+        self.stats = {"compiles": 0, "cache_hits": 0, "failures": 0, "compile_time": 0.0}
+        # 不注册为子模块，避免 parameters() / to() 重复处理；(batch, 其余形状和设备) -> 编译后的函数，None 表示编译失败
+        self.__dict__["_variants"] = {}
+        self.__dict__["_compiled"] = None
+        self.__dict__["_compile_lock"] = threading.Lock()
+
+    def forward(self, x):
+        variant = self._get_variant(x) if isinstance(x, torch.Tensor) and not self.training else None
+        if variant is None:
+            return self.module(x)
+
+        fn, batch = variant
+        n = x.shape[0]
+        if n < batch:
+            x = torch.cat([x, x.new_zeros((batch - n, *x.shape[1:]))], dim=0)
+            return _slice_batch(fn(x), n)
+        return fn(x)
+
+    def _get_variant(self, x):
+        signature = (tuple(x.shape[1:]), str(x.device), x.dtype, torch.is_autocast_enabled())
+        with self._compile_lock:
+            # 优先使用形状相同、batch不小于输入的最小版本
+            candidates = [(batch, fn) for (batch, sig), fn in self._variants.items() if sig == signature and batch >= x.shape[0]]
+            if candidates:
+                batch, fn = min(candidates, key=lambda c: c[0])
+                return (fn, batch) if fn is not None else None
+
+            fn = self._compile(x)
+            self._variants[(x.shape[0], signature)] = fn
+            return (fn, x.shape[0]) if fn is not None else None
+
+    def _artifact_path(self, x):
+        spec = f"{self.cache_key}|{self.mode}|{torch.__version__}|{tuple(x.shape)}|{x.device}|{x.dtype}|{torch.is_autocast_enabled()}"
+        key = hashlib.sha256(spec.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.{'pt2' if self.mode == 'export' else 'bin'}")
+
+    def _compile(self, x):
+        path = self._artifact_path(x)
+        cache_hit = os.path.exists(path)
+        start_time = time.time()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.mode == "export":
+                fn = self._export(x, path, cache_hit)
+            else:
+                fn = self._torch_compile(x, path, cache_hit)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.warning(f"模型编译失败，使用eager模式: shape: {tuple(x.shape)}, error: {e}")
+            return None
+
+        elapsed = time.time() - start_time
+        self.stats["compile_time"] += elapsed
+        if cache_hit:
+            self.stats["cache_hits"] += 1
+            logger.info(f"从缓存加载编译模型 ({self.mode})，耗时: {elapsed:.2f}秒，shape: {tuple(x.shape)}, device: {x.device}")
+        else:
+            self.stats["compiles"] += 1
+            logger.info(f"模型编译完成 ({self.mode})，耗时: {elapsed:.2f}秒，shape: {tuple(x.shape)}, device: {x.device}, 保存到: {path}")
+        return fn
+
+    def _torch_compile(self, x, path, cache_hit):
+        """
+        torch.compile 只编译一次模型，每个新形状重新编译；编译产物通过 torch.compiler 的缓存接口保存和加载
+        """
+        can_cache = hasattr(torch.compiler, "save_cache_artifacts")
+        if cache_hit and can_cache:
+            with open(path, "rb") as f:
+                torch.compiler.load_cache_artifacts(f.read())
+
+        if self._compiled is None:
+            self.__dict__["_compiled"] = torch.compile(self.module, dynamic=False)
+        # 预热，编译在这里完成，计入编译时间
+        self._compiled(x)
+
+        if not cache_hit and can_cache:
+            artifacts = torch.compiler.save_cache_artifacts()
+            if artifacts is not None:
+                self._write_atomic(path, artifacts[0])
+        return self._compiled
+
+    def _export(self, x, path, cache_hit):
+        """
+        torch.export 导出静态形状的计算图，AOTInductor 编译为 .pt2 包（包含权重），加载后不需要重新编译
+        """
+        if not cache_hit:
+            with torch.inference_mode(False), torch.no_grad():
+                example = x.clone()
+                program = torch.export.export(self.module, (example,))
+                tmp_path = f"{path[:-len('.pt2')]}.{os.getpid()}.tmp.pt2"
+                torch._inductor.aoti_compile_and_package(program, package_path=tmp_path)
+                os.replace(tmp_path, path)
+        return torch._inductor.aoti_load_package(path)
+
+    def _write_atomic(self, path, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_stats(self) -> Dict[str, float]:
+        return dict(self.stats, variants=sum(1 for fn in self._variants.values() if fn is not None))
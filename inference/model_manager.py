@@ -1,81 +1,334 @@
 import os
 import time
+import weakref
 import threading
-from typing import Dict, Tuple, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional
 import torch
 from utils.logger import get_logger
 from utils.utils import get_model_from_config
+from inference.model_compiler import CompiledModel, COMPILE_MODEL_TYPES, get_compile_mode
+from inference.onnx_backend import OnnxModel, ONNX_DEVICE
+from inference.cpu_precision import apply_cpu_precision
+from inference.result_cache import hash_file
 
 logger = get_logger()
 
+# 支持频带融合（modules/bs_roformer/fused.py）的模型类型
+FUSED_MODEL_TYPES = ["bs_roformer", "mel_band_roformer"]
+
+
+def parse_memory_budgets(spec: str) -> Dict[str, float]:
+    """
+    解析显存/内存预算，格式: "cuda=8192,cpu=16384"（单位MB），设备名可带编号，如 "cuda:1=4096"
+    """
+    budgets = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        device, value = item.split("=", 1)
+        budgets[device.strip()] = float(value) * 1024 * 1024
+    return budgets
+
+
+def get_model_size(model: torch.nn.Module) -> int:
+    """
+    模型参数和缓冲区占用的字节数
+    """
+    size = sum(p.numel() * p.element_size() for p in model.parameters())
+    size += sum(b.numel() * b.element_size() for b in model.buffers())
+    return size
+
 
 class ModelManager:
     """
     模型管理器，用于缓存和复用已加载的模型
     避免重复加载相同的模型，提高处理效率
+
+    每个设备可以设置内存预算，超出时按LRU顺序淘汰未被使用的模型：GPU上的模型优先转移到CPU，CPU超出预算时直接释放
+    预算通过环境变量 MSST_MODEL_CACHE_BUDGET（如 "cuda=8192,cpu=16384"，单位MB）或 set_memory_budget 设置，未设置的设备不限制
+    设置环境变量 MSST_MODEL_CACHE_OFFLOAD=0 可关闭转移到CPU，直接释放
+
+    BS-Roformer / Mel-Band-Roformer 加载后逐频带的 BandSplit / MaskEstimator 会替换为批量矩阵乘法的融合版本，
+    设置环境变量 MSST_FUSE_BANDS=0 可关闭
+
+    设备为 onnx-cpu 时模型的核心网络由 ONNX Runtime 执行（见 onnx_backend.py），模型本身按CPU上的模型管理
+    设置环境变量 MSST_MODEL_COMPILE=compile 或 export 后，支持的模型按推理时的固定输入形状编译，编译产物缓存在磁盘上（见 model_compiler.py）
     """
-    
+
     def __init__(self):
-        self._models: Dict[str, Tuple[torch.nn.Module, object]] = {}  # model_key -> (model, config)
+        self._models: "OrderedDict[str, Tuple[torch.nn.Module, object]]" = OrderedDict()  # model_key -> (model, config)，按最近使用排序
         self._lock = threading.RLock()
         self._model_load_times: Dict[str, float] = {}  # 记录模型加载时间，用于统计
-    
-    def _get_model_key(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list) -> str:
+        self._batchers: Dict[str, "DynamicBatcher"] = {}  # model_key -> 跨音轨共享的动态批处理器
+        self._model_sizes: Dict[str, int] = {}  # model_key -> 参数和缓冲区字节数
+        self._model_devices: Dict[str, str] = {}  # model_key -> 模型当前所在设备（转移到CPU后为cpu）
+        self._target_devices: Dict[str, str] = {}  # model_key -> 请求的推理设备
+        self._leases: Dict[str, int] = {}  # model_key -> 正在使用该模型的分离器数量，使用中的模型不会被淘汰
+        self._loading: Dict[str, threading.Lock] = {}  # model_key -> 加载锁，避免同一模型被并发加载
+        self._budgets: Dict[str, float] = parse_memory_budgets(os.environ.get("MSST_MODEL_CACHE_BUDGET", ""))
+        self.offload_to_cpu = os.environ.get("MSST_MODEL_CACHE_OFFLOAD", "1") != "0"
+        self.fuse_bands = os.environ.get("MSST_FUSE_BANDS", "1") != "0"
+        self.compile_mode = get_compile_mode()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "offloads": 0, "restores": 0, "load_time": 0.0}
+
+    def _get_model_key(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list, precision: str = "fp32") -> str:
         """
         生成模型缓存键
         """
-        # 使用模型类型、配置文件路径、模型文件路径和设备信息作为键
+        # 使用模型类型、配置文件路径、模型文件路径和设备信息作为键，路径统一为绝对路径，避免同一文件因写法不同被重复加载
+        config_path = os.path.normcase(os.path.abspath(config_path))
+        model_path = os.path.normcase(os.path.abspath(model_path))
         device_str = f"{device}_{'-'.join(map(str, device_ids))}"
+        if precision and precision != "fp32":
+            device_str += f"_{precision}"
         return f"{model_type}_{config_path}_{model_path}_{device_str}"
-    
-    def get_model(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list) -> Tuple[torch.nn.Module, object]:
+
+    def get_model_key(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list, precision: str = "fp32") -> str:
+        return self._get_model_key(model_type, config_path, model_path, device, device_ids, precision)
+
+    def _get_artifact_key(self, model_type: str, config_path: str, model_path: str, precision: str = "fp32") -> str:
+        """
+        编译产物和导出的ONNX计算图的缓存键：检查点和配置文件的内容哈希，以及会改变计算图的加载选项
+        """
+        fused = self.fuse_bands and model_type in FUSED_MODEL_TYPES and precision != "int8"
+        return f"{model_type}|{hash_file(model_path)}|{hash_file(config_path)}|fused={fused}|{precision}"
+
+    def set_memory_budget(self, device: str, budget_mb: Optional[float]):
+        """
+        设置设备的内存预算（MB），None表示不限制。"cuda" 对所有GPU分别生效，"cuda:1" 只对该GPU生效
+        """
+        with self._lock:
+            if budget_mb is None:
+                self._budgets.pop(device, None)
+            else:
+                self._budgets[device] = float(budget_mb) * 1024 * 1024
+            for dev in set(self._model_devices.values()):
+                self._enforce_budget(dev)
+
+    def _get_budget(self, device: str) -> Optional[float]:
+        if device in self._budgets:
+            return self._budgets[device]
+        return self._budgets.get(device.split(":")[0])
+
+    def _get_usage(self, device: str) -> int:
+        return sum(self._model_sizes[k] for k, d in self._model_devices.items() if d == device)
+
+    def _enforce_budget(self, device: str, incoming: int = 0, protect: Optional[str] = None):
+        """
+        淘汰设备上最久未使用且未被占用的模型，直到 已用 + incoming 不超过预算
+        """
+        budget = self._get_budget(device)
+        if budget is None:
+            return
+
+        freed = False
+        while self._get_usage(device) + incoming > budget:
+            candidates = [k for k in self._models if self._model_devices.get(k) == device and k != protect and not self._leases.get(k)]
+            if not candidates:
+                logger.warning(f"设备 {device} 的模型缓存超出预算: {(self._get_usage(device) + incoming) / 1024 ** 2:.0f}MB > {budget / 1024 ** 2:.0f}MB，剩余模型均在使用中")
+                break
+            key = candidates[0]  # OrderedDict 中最久未使用的模型
+            if self.offload_to_cpu and device != "cpu":
+                model, _ = self._models[key]
+                model.to("cpu")
+                self._model_devices[key] = "cpu"
+                self._stats["offloads"] += 1
+                logger.info(f"模型转移到CPU: {key}, 大小: {self._model_sizes[key] / 1024 ** 2:.0f}MB")
+                self._enforce_budget("cpu", protect=protect)
+            else:
+                self._remove(key)
+                self._stats["evictions"] += 1
+                logger.info(f"淘汰模型缓存: {key}")
+            freed = True
+
+        if freed and device.startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _remove(self, model_key: str):
+        self._models.pop(model_key, None)
+        self._model_load_times.pop(model_key, None)
+        self._model_sizes.pop(model_key, None)
+        self._model_devices.pop(model_key, None)
+        self._target_devices.pop(model_key, None)
+        if model_key in self._batchers:
+            self._batchers.pop(model_key).stop()
+
+    def _get_cached(self, model_key: str) -> Optional[Tuple[torch.nn.Module, object]]:
+        """
+        命中缓存时更新LRU顺序，模型已被转移到CPU时移回推理设备
+        """
+        if model_key not in self._models:
+            return None
+        self._models.move_to_end(model_key)
+        self._stats["hits"] += 1
+        model, config = self._models[model_key]
+        device = self._target_devices[model_key]
+        if self._model_devices[model_key] != device:
+            self._enforce_budget(device, incoming=self._model_sizes[model_key], protect=model_key)
+            model.to(device)
+            self._model_devices[model_key] = device
+            self._stats["restores"] += 1
+            logger.info(f"模型从CPU移回 {device}: {model_key}")
+        return model, config
+
+    def get_model(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list, precision: str = "fp32") -> Tuple[torch.nn.Module, object]:
         """
         获取模型，如果已缓存则直接返回，否则加载并缓存
+        precision 为CPU推理精度（fp32/bf16/int8，见 cpu_precision.py），只对CPU上的模型生效，不同精度的模型分别缓存
         """
-        model_key = self._get_model_key(model_type, config_path, model_path, device, device_ids)
-        
+        precision = precision if device == "cpu" else "fp32"
+        model_key = self._get_model_key(model_type, config_path, model_path, device, device_ids, precision)
+
         with self._lock:
-            if model_key in self._models:
+            cached = self._get_cached(model_key)
+            if cached is not None:
                 logger.info(f"使用缓存的模型: {model_key}")
-                return self._models[model_key]
-            
+                return cached
+            loading_lock = self._loading.setdefault(model_key, threading.Lock())
+
+        # 加载时只锁住该模型，其他模型的缓存命中和加载不受影响
+        with loading_lock:
+            with self._lock:
+                cached = self._get_cached(model_key)
+                if cached is not None:
+                    return cached
+                self._stats["misses"] += 1
+
             # 模型未缓存，需要加载
             logger.info(f"加载新模型: {model_key}")
             start_time = time.time()
-            
+
             try:
                 model, config = get_model_from_config(model_type, config_path)
-                
-                # 加载模型权重
+
+                # 加载模型权重，先放在CPU上，确认预算后再移到推理设备
                 if model_type in ["htdemucs", "apollo"]:
-                    state_dict = torch.load(model_path, map_location=device, weights_only=False)
+                    state_dict = torch.load(model_path, map_location="cpu", weights_only=False)
                     if "state" in state_dict:
                         state_dict = state_dict["state"]
                     if "state_dict" in state_dict:
                         state_dict = state_dict["state_dict"]
                 else:
-                    state_dict = torch.load(model_path, map_location=device, weights_only=True)
-                
+                    state_dict = torch.load(model_path, map_location="cpu", weights_only=True)
+
                 model.load_state_dict(state_dict)
-                
+                del state_dict
+
+                # 推理用的频带融合，必须在加载权重之后
+                # int8 量化逐频带的线性层，不做融合
+                if self.fuse_bands and model_type in FUSED_MODEL_TYPES and precision != "int8":
+                    from modules.bs_roformer.fused import fuse_bands
+
+                    logger.debug(f"融合频带模块: {fuse_bands(model)} 个")
+
                 # 多GPU支持
                 if len(device_ids) > 1:
                     model = torch.nn.DataParallel(model, device_ids=device_ids)
-                
-                model = model.to(device)
+
+                # onnx-cpu 的模型在CPU上，按CPU计算预算
+                torch_device = "cpu" if device == ONNX_DEVICE else device
+
+                size = get_model_size(model)
+                with self._lock:
+                    self._enforce_budget(torch_device, incoming=size)
+
+                model = model.to(torch_device)
                 model.eval()
-                
+
+                if precision != "fp32":
+                    model = apply_cpu_precision(model, precision)
+
+                if device == ONNX_DEVICE:
+                    model = OnnxModel(model, model_type, model_path, self._get_artifact_key(model_type, config_path, model_path))
+                # 可选的静态形状编译，第一次推理时才真正编译，失败时使用eager模式
+                elif self.compile_mode and model_type in COMPILE_MODEL_TYPES and len(device_ids) <= 1:
+                    model = CompiledModel(model, self.compile_mode, self._get_artifact_key(model_type, config_path, model_path, precision))
+
                 # 缓存模型
-                self._models[model_key] = (model, config)
-                self._model_load_times[model_key] = time.time() - start_time
-                
-                logger.info(f"模型加载完成，耗时: {self._model_load_times[model_key]:.2f}秒")
+                with self._lock:
+                    self._models[model_key] = (model, config)
+                    self._model_load_times[model_key] = time.time() - start_time
+                    self._model_sizes[model_key] = size
+                    self._model_devices[model_key] = torch_device
+                    self._target_devices[model_key] = torch_device
+                    self._stats["load_time"] += self._model_load_times[model_key]
+
+                logger.info(f"模型加载完成，耗时: {self._model_load_times[model_key]:.2f}秒，大小: {size / 1024 ** 2:.0f}MB")
                 return model, config
-                
+
             except Exception as e:
                 logger.error(f"模型加载失败: {str(e)}")
                 raise
-    
+            finally:
+                # 加载失败时也要移除加载锁，下次请求重新加载
+                with self._lock:
+                    self._loading.pop(model_key, None)
+
+    def acquire(self, model_key: str, owner=None):
+        """
+        标记模型正在使用，使用中的模型不会被淘汰或转移。传入owner时，owner被回收后自动释放
+        """
+        with self._lock:
+            self._leases[model_key] = self._leases.get(model_key, 0) + 1
+        if owner is not None:
+            weakref.finalize(owner, self.release, model_key)
+
+    def release(self, model_key: str):
+        with self._lock:
+            if self._leases.get(model_key, 0) > 1:
+                self._leases[model_key] -= 1
+            else:
+                self._leases.pop(model_key, None)
+
+    @contextmanager
+    def lease(self, model_key: str):
+        """
+        在 with 块中占用模型，退出时释放。常驻进程中的分离器只在处理文件时占用模型，空闲的模型可以被预算淘汰
+        """
+        self.acquire(model_key)
+        try:
+            yield
+        finally:
+            self.release(model_key)
+
+    def preload(self, models: List[Tuple[str, str, str, str, list]], background: bool = True) -> Optional[threading.Thread]:
+        """
+        预加载模型，models为 (model_type, config_path, model_path, device, device_ids) 列表
+        background为True时在后台线程中加载并返回该线程
+        """
+        def _load():
+            for model_type, config_path, model_path, device, device_ids in models:
+                try:
+                    self.get_model(model_type, config_path, model_path, device, device_ids)
+                except Exception as e:
+                    logger.warning(f"预加载模型失败: {model_path}, 错误: {e}")
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name="msst_model_preload", daemon=True)
+        thread.start()
+        return thread
+
+    def get_batcher(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list, max_wait: float = 0.01, precision: str = "fp32"):
+        """
+        获取模型对应的动态批处理器，同一模型的所有并发音轨共享一个批处理器
+        """
+        from inference.dynamic_batcher import DynamicBatcher
+
+        precision = precision if device == "cpu" else "fp32"
+        model, config = self.get_model(model_type, config_path, model_path, device, device_ids, precision)
+        model_key = self._get_model_key(model_type, config_path, model_path, device, device_ids, precision)
+
+        with self._lock:
+            if model_key not in self._batchers:
+                max_batch_size = config.inference.get("max_batch_size", None) or config.inference.batch_size
+                self._batchers[model_key] = DynamicBatcher(model, config, "cpu" if device == ONNX_DEVICE else device, max_batch_size, max_wait)
+                logger.info(f"创建动态批处理器: {model_key}, max_batch_size: {max_batch_size}, max_wait: {max_wait}s")
+            return self._batchers[model_key]
+
     def clear_cache(self, model_key: Optional[str] = None):
         """
         清除模型缓存
@@ -83,16 +336,46 @@ class ModelManager:
         with self._lock:
             if model_key:
                 if model_key in self._models:
-                    del self._models[model_key]
-                    if model_key in self._model_load_times:
-                        del self._model_load_times[model_key]
+                    self._remove(model_key)
                     logger.info(f"清除模型缓存: {model_key}")
+                if model_key in self._batchers:
+                    self._batchers.pop(model_key).stop()
             else:
                 # 清除所有缓存
-                self._models.clear()
-                self._model_load_times.clear()
+                for key in list(self._models.keys()):
+                    self._remove(key)
+                for batcher in self._batchers.values():
+                    batcher.stop()
+                self._batchers.clear()
                 logger.info("清除所有模型缓存")
-    
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        获取命中/未命中/淘汰/转移次数，以及每个设备的占用和预算（MB）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            devices = set(self._model_devices.values()) | set(self._budgets.keys())
+            stats["devices"] = {
+                d: {"used_mb": self._get_usage(d) / 1024 ** 2, "budget_mb": (self._get_budget(d) / 1024 ** 2) if self._get_budget(d) is not None else None}
+                for d in devices
+            }
+            stats["models"] = {
+                k: {
+                    "size_mb": self._model_sizes[k] / 1024 ** 2,
+                    "device": self._model_devices[k],
+                    "load_time": self._model_load_times.get(k, 0.0),
+                    "in_use": self._leases.get(k, 0),
+                }
+                for k in self._models
+            }
+            compiled = [model.get_stats() for model, _ in self._models.values() if isinstance(model, CompiledModel)]
+            if compiled:
+                stats["compile"] = {key: sum(c[key] for c in compiled) for key in compiled[0]}
+            return stats
+
     def get_cache_info(self) -> Dict[str, float]:
         """
         获取缓存信息
@@ -101,9 +384,11 @@ class ModelManager:
             return {
                 "cached_models": len(self._models),
                 "model_keys": list(self._models.keys()),
-                "load_times": self._model_load_times.copy()
+                "load_times": self._model_load_times.copy(),
+                "batchers": {k: v.get_stats() for k, v in self._batchers.items()},
+                "stats": self.get_stats(),
             }
-    
+
     def is_model_cached(self, model_type: str, config_path: str, model_path: str, device: str, device_ids: list) -> bool:
         """
         检查模型是否已缓存
@@ -124,11 +409,31 @@ def get_model_manager() -> ModelManager:
     return _model_manager
 
 
-def get_cached_model(model_type: str, config_path: str, model_path: str, device: str, device_ids: list) -> Tuple[torch.nn.Module, object]:
+def get_cached_model(model_type: str, config_path: str, model_path: str, device: str, device_ids: list, owner=None, precision: str = "fp32") -> Tuple[torch.nn.Module, object]:
     """
     获取缓存的模型，如果不存在则加载并缓存
+    传入owner时，模型在owner存活期间不会被淘汰；只在使用期间占用模型时用 get_model_manager().lease(model_key)
     """
-    return _model_manager.get_model(model_type, config_path, model_path, device, device_ids)
+    precision = precision if device == "cpu" else "fp32"
+    model, config = _model_manager.get_model(model_type, config_path, model_path, device, device_ids, precision)
+    if owner is not None:
+        _model_manager.acquire(_model_manager.get_model_key(model_type, config_path, model_path, device, device_ids, precision), owner=owner)
+    return model, config
+
+
+def preload_preset_models(preset_data: dict, device: str, device_ids: list = [0], background: bool = True) -> Optional[threading.Thread]:
+    """
+    在后台预加载预设中所有MSST模型（VR模型不经过模型管理器）
+    """
+    from webui.utils import get_msst_model
+
+    models = []
+    for step in preset_data.get("flow", []):
+        if step["model_type"] == "UVR_VR_Models":
+            continue
+        model_path, config_path, model_type, _ = get_msst_model(step["model_name"])
+        models.append((model_type, config_path, model_path, device, device_ids))
+    return _model_manager.preload(models, background=background)
 
 
 def clear_model_cache(model_key: Optional[str] = None):
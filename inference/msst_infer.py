@@ -1,5 +1,7 @@
 import gc
 import os
+import queue
+import threading
 import librosa
 import logging
 import soundfile as sf
@@ -8,11 +10,19 @@ import numpy as np
 import platform
 import subprocess
 from time import time
+from contextlib import contextmanager
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 from pydub import AudioSegment
 
 from utils.utils import demix, get_model_from_config
+from utils.demix_pipeline import demix_pipelined, demix_batched
+from utils.demix_stream import StreamingDemixer, StreamingAudioWriter
 from utils.logger import get_logger, set_log_level
+from inference.result_cache import get_result_cache, hash_file, config_to_dict
+from inference.onnx_backend import ONNX_DEVICE, ONNX_MODEL_TYPES
+from inference.cpu_precision import read_cpu_precision, resolve_cpu_precision
+from inference.autotune import get_tuned_params
 
 
 class MSSeparator:
@@ -31,6 +41,8 @@ class MSSeparator:
 		debug=False,
 		inference_params={"batch_size": None, "num_overlap": None, "chunk_size": None, "normalize": None},
 		callback=None,
+		check_finite=None,
+		cpu_precision=None,
 	):
 		self.logger = logger
 
@@ -51,6 +63,7 @@ class MSSeparator:
 		self.audio_params = audio_params
 		self.debug = debug
 		self.callback = callback
+		self._defer_done = False  # process_folder reports a file as done once its stems are written
 
 		if self.debug:
 			set_log_level(logger, logging.DEBUG)
@@ -64,8 +77,17 @@ class MSSeparator:
 
 		self.device = "cpu"
 		self.device_ids = device_ids
+		# Device of the model in the model manager. With "onnx-cpu" the chunking and the STFT run in PyTorch on the CPU
+		# and the network between the STFT and the iSTFT runs in ONNX Runtime
+		self.model_device = None
 
-		if device not in ["cpu", "cuda", "mps"]:
+		if device == ONNX_DEVICE and model_type not in ONNX_MODEL_TYPES:
+			self.logger.warning(f"Model type {model_type} is not supported by the ONNX backend, running in PyTorch on the CPU")
+			device = "cpu"
+
+		if device == ONNX_DEVICE:
+			self.model_device = ONNX_DEVICE
+		elif device not in ["cpu", "cuda", "mps"]:
 			if torch.cuda.is_available():
 				self.device = "cuda"
 				self.device = f"cuda:{self.device_ids[0]}"
@@ -79,10 +101,32 @@ class MSSeparator:
 		if self.device == "cpu":
 			self.logger.warning("No hardware acceleration could be configured, running in CPU mode")
 
+		self.model_device = self.model_device or self.device
+		# fp32, bf16 or int8 on the CPU, "cpu_precision" under "inference" in the model config, "auto" uses the precision report
+		self.cpu_precision = "fp32"
+		if self.model_device == "cpu":
+			self.cpu_precision = resolve_cpu_precision(cpu_precision or read_cpu_precision(self.config_path), model_type, model_path)
+
 		torch.backends.cudnn.benchmark = True
-		self.logger.info(f"Using device: {self.device}, device_ids: {self.device_ids}")
+		self.logger.info(f"Using device: {self.model_device}, device_ids: {self.device_ids}")
 
 		self.model, self.config = self.load_model()
+		# Keep the overlap-add buffers on the inference device, set "accumulate_on_device: true" under "inference" in the model config
+		self.accumulate_on_device = bool(self.config.inference.get("accumulate_on_device", False)) and self.device != "cpu"
+		# Prepare the chunks in a background thread while the model runs, set "use_pipeline: true" under "inference"
+		self.use_pipeline = bool(self.config.inference.get("use_pipeline", False))
+		# Read, separate and write the files block by block with bounded memory, set "streaming: true" under "inference"
+		self.streaming = bool(self.config.inference.get("streaming", False))
+		# Merge the chunks of concurrent tracks using the same model into shared batches, set "dynamic_batching: true" under "inference"
+		self.dynamic_batching = bool(self.config.inference.get("dynamic_batching", False))
+		self.batcher = self.get_batcher()
+		# NaN/Inf checks inside the model forward force a device sync on every chunk, so by default they are replaced by one check
+		# of the separated track. Set "check_finite: true" under "inference" (or check_finite=True) to check every chunk again
+		# The model is shared through the model manager, so the flag is only set on it while this separator uses it (see use_model)
+		self.check_finite = bool(self.config.inference.get("check_finite", False)) if check_finite is None else bool(check_finite)
+		self.check_track_finite = hasattr(self.unwrap_model(), "check_finite") and not self.check_finite
+		# Reuse the stems of inputs already separated with the same checkpoint and params, enabled by MSST_RESULT_CACHE_SIZE
+		self.result_cache = get_result_cache()
 
 		if type(self.store_dirs) == str:
 			self.store_dirs = {k: self.store_dirs for k in self.config.training.instruments}
@@ -116,8 +160,10 @@ class MSSeparator:
 		# 使用模型管理器获取缓存的模型
 		from inference.model_manager import get_cached_model
 		
-		model, config = get_cached_model(self.model_type, self.config_path, self.model_path, self.device, self.device_ids)
+		# 模型只在分离时被占用（见 use_model），空闲时可以被模型管理器按预算淘汰
+		model, config = get_cached_model(self.model_type, self.config_path, self.model_path, self.model_device, self.device_ids, precision=self.cpu_precision)
 
+		self.inference_params = self.apply_tuned_params(self.inference_params)
 		self.update_inference_params(config, self.inference_params)
 
 		self.logger.info(f"Separator params: model_type: {self.model_type}, model_path: {self.model_path}, config_path: {self.config_path}, output_folder: {self.store_dirs}")
@@ -129,6 +175,49 @@ class MSSeparator:
 
 		return model, config
 
+	def get_batcher(self):
+		if not self.dynamic_batching:
+			return None
+		from inference.model_manager import get_model_manager
+
+		max_wait = float(self.config.inference.get("max_batch_wait", 0.01))
+		return get_model_manager().get_batcher(self.model_type, self.config_path, self.model_path, self.model_device, self.device_ids, max_wait, precision=self.cpu_precision)
+
+	@contextmanager
+	def use_model(self):
+		"""
+		Lease the model from the model manager while separating, so separators kept alive in long-running processes
+		do not pin their models between files. A model offloaded to the CPU meanwhile is moved back, an evicted one is reloaded.
+		"""
+		from inference.model_manager import get_model_manager
+
+		manager = get_model_manager()
+		model_key = manager.get_model_key(self.model_type, self.config_path, self.model_path, self.model_device, self.device_ids, self.cpu_precision)
+		with manager.lease(model_key):
+			model, config = manager.get_model(self.model_type, self.config_path, self.model_path, self.model_device, self.device_ids, self.cpu_precision)
+			if model is not self.model:
+				self.logger.debug("The model was evicted from the model cache and has been reloaded.")
+				self.model = model
+				self.config = self.update_inference_params(config, self.inference_params)
+				self.batcher = self.get_batcher()
+
+			core = self.unwrap_model()
+			previous = getattr(core, "check_finite", None)
+			if previous is not None:
+				core.check_finite = self.check_finite
+			try:
+				yield
+			finally:
+				if previous is not None:
+					core.check_finite = previous
+
+	def unwrap_model(self):
+		"""The model without DataParallel / compile / ONNX / autocast wrappers, which keep it in their module attribute."""
+		model = self.model
+		while hasattr(model, "module"):
+			model = model.module
+		return model
+
 	def normalize_audio(self, audio: np.ndarray):
 		mono = audio.mean(0)
 		mean, std = mono.mean(), mono.std()
@@ -138,7 +227,7 @@ class MSSeparator:
 		track_proc_list = [mix[::-1].copy(), -1.0 * mix.copy()]
 
 		for i, augmented_mix in enumerate(track_proc_list):
-			waveforms = demix(self.config, self.model, augmented_mix, self.device, model_type=self.model_type, callback=self.callback)
+			waveforms = self.demix(augmented_mix)
 			for el in waveforms:
 				if i == 0:
 					waveforms_orig[el] += waveforms[el][::-1].copy()
@@ -151,95 +240,224 @@ class MSSeparator:
 
 		return waveforms_orig
 
+	def demix(self, mix: np.ndarray):
+		# check_track_finite: one NaN/Inf check of the overlap-added track, before nan_to_num replaces them
+		if self.batcher is not None:
+			return demix_batched(self.config, self.model_type, mix, self.batcher, callback=self.callback, accumulate_on_device=self.accumulate_on_device, accumulate_device=self.device, check_finite=self.check_track_finite)
+		if self.use_pipeline:
+			return demix_pipelined(self.config, self.model, mix, self.device, model_type=self.model_type, callback=self.callback, accumulate_on_device=self.accumulate_on_device, check_finite=self.check_track_finite)
+		return demix(self.config, self.model, mix, self.device, model_type=self.model_type, callback=self.callback, accumulate_on_device=self.accumulate_on_device, check_finite=self.check_track_finite)
+
+	def outputs_exist(self, path, file_name):
+		"""
+		检查该文件的所有输出是否都已存在
+		"""
+		self.logger.debug(f"[跳过检查] 检查文件: {os.path.basename(path)}")
+		missing_outputs = []
+		for instr in self.config.training.instruments:
+			save_dir = self.store_dirs.get(instr, "")
+			if save_dir and type(save_dir) == str:
+				output_file = os.path.join(save_dir, f"{file_name}_{instr}.{self.output_format}")
+				if not os.path.exists(output_file):
+					missing_outputs.append(f"{instr}")
+			elif save_dir and type(save_dir) == list:
+				for dir in save_dir:
+					output_file = os.path.join(dir, f"{file_name}_{instr}.{self.output_format}")
+					if not os.path.exists(output_file):
+						missing_outputs.append(f"{instr}")
+
+		# 如果所有输出文件都已存在，跳过处理
+		if not missing_outputs:
+			self.logger.info(f"⏭️  跳过已存在的文件: {os.path.basename(path)} (所有输出文件已存在)")
+			self.logger.debug(f"[跳过检查] 所有输出都已存在，检查的输出目录: {list(set([self.store_dirs.get(i, '') for i in self.config.training.instruments]))}")
+			return True
+		self.logger.debug(f"✅ 处理文件: {os.path.basename(path)} (缺少输出: {', '.join(missing_outputs)})")
+		return False
+
 	def process_folder(self, input_folder, skip_existing_files=False):
+		"""
+		Three-stage pipeline: a thread pool decodes the next files while the model separates the current one,
+		and a writer pool encodes the stems of the previous files. The queues between the stages are bounded
+		by "decode_workers", "encode_workers" and "prefetch_files" under "inference" in the model config.
+		As in the sequential loop, a file only counts as done (progress bar, callback, returned list) once all of its
+		stems are written, and skip_existing_files sees the outputs written for the earlier files.
+		"""
 		if not os.path.isdir(input_folder):
 			raise ValueError(f"Input folder '{input_folder}' does not exist.")
 
-		all_mixtures_path = [os.path.join(input_folder, f) for f in os.listdir(input_folder)]
-		file_lists = all_mixtures_path.copy()
+		file_lists = [os.path.join(input_folder, f) for f in os.listdir(input_folder)]
 
 		sample_rate = getattr(self.config.audio, 'sample_rate', 44100)
-		self.logger.info(f"Input_folder: {input_folder}, Total files found: {len(all_mixtures_path)}, Use sample rate: {sample_rate}")
+		self.logger.info(f"Input_folder: {input_folder}, Total files found: {len(file_lists)}, Use sample rate: {sample_rate}")
 
-		if not self.debug:
-			all_mixtures_path = tqdm(all_mixtures_path, desc="Total progress")
+		decode_workers = max(1, int(self.config.inference.get("decode_workers", 2)))
+		encode_workers = max(1, int(self.config.inference.get("encode_workers", 2)))
+		prefetch = max(1, int(self.config.inference.get("prefetch_files", 2)))
+
+		progress_bar = None if self.debug else tqdm(total=len(file_lists), desc="Total progress")
 
 		success_files = []
 		skipped_files = []
-		for path in all_mixtures_path:
-			if not self.debug:
-				all_mixtures_path.set_postfix({"track": os.path.basename(path)})
-			
-			# 检查输出文件是否已存在
-			file_name, _ = os.path.splitext(os.path.basename(path))
-			all_outputs_exist = True
-			missing_outputs = []
-			
-			if skip_existing_files:
-				self.logger.debug(f"[跳过检查] 检查文件: {os.path.basename(path)}")
-				for instr in self.config.training.instruments:
-					save_dir = self.store_dirs.get(instr, "")
-					if save_dir and type(save_dir) == str:
-						output_file = os.path.join(save_dir, f"{file_name}_{instr}.{self.output_format}")
-						if not os.path.exists(output_file):
-							all_outputs_exist = False
-							missing_outputs.append(f"{instr}")
-					elif save_dir and type(save_dir) == list:
-						for dir in save_dir:
-							output_file = os.path.join(dir, f"{file_name}_{instr}.{self.output_format}")
-							if not os.path.exists(output_file):
-								all_outputs_exist = False
-								missing_outputs.append(f"{instr}")
-				
-				# 如果所有输出文件都已存在，跳过处理
-				if all_outputs_exist:
-					self.logger.info(f"⏭️  跳过已存在的文件: {os.path.basename(path)} (所有输出文件已存在)")
-					self.logger.debug(f"[跳过检查] 所有输出都已存在，检查的输出目录: {list(set([self.store_dirs.get(i, '') for i in self.config.training.instruments]))}")
-					skipped_files.append(os.path.basename(path))
+		pending_writes = []  # [(path, file name, [write futures] or None if not processed)], in input order
+		decoded = queue.Queue(maxsize=prefetch)
+		stop_event = threading.Event()
+		write_slots = threading.Semaphore(encode_workers * 2)
+		decode_pool = ThreadPoolExecutor(decode_workers, thread_name_prefix="msst_decode")
+		encode_pool = ThreadPoolExecutor(encode_workers, thread_name_prefix="msst_encode")
+
+		def put(item):
+			while not stop_event.is_set():
+				try:
+					decoded.put(item, timeout=0.1)
+					return True
+				except queue.Full:
 					continue
-				else:
-					self.logger.debug(f"✅ 处理文件: {os.path.basename(path)} (缺少输出: {', '.join(missing_outputs)})")
-			
+			return False
+
+		def produce():
 			try:
-				mix, sr = librosa.load(path, sr=sample_rate, mono=False)
+				for path in file_lists:
+					file_name, _ = os.path.splitext(os.path.basename(path))
+					if skip_existing_files and self.outputs_exist(path, file_name):
+						item = ("skip", path, file_name, None)
+					elif self.streaming and self.can_stream(path, sample_rate):
+						item = ("stream", path, file_name, None)
+					else:
+						item = ("decode", path, file_name, decode_pool.submit(librosa.load, path, sr=sample_rate, mono=False))
+					if not put(item):
+						return
 			except Exception as e:
-				self.logger.warning(f"Cannot process track: {path}, error: {str(e)}")
-				continue
-
-			self.logger.debug(f"Starting separation process for audio_file: {path}")
-
-			if self.callback:
-				self.callback["info"] = {"index": file_lists.index(path) + 1, "total": len(file_lists), "name": os.path.basename(path)}
-
-			results = self.separate(mix)
-			self.logger.debug(f"Separation audio_file: {path} completed. Starting to save results.")
-
-			for instr in results.keys():
-				save_dir = self.store_dirs.get(instr, "")
-				if save_dir and type(save_dir) == str:
-					os.makedirs(save_dir, exist_ok=True)
-					self.save_audio(results[instr], sr, f"{file_name}_{instr}", save_dir)
-					self.logger.debug(f"Saved {instr} for {file_name}_{instr}.{self.output_format} in {save_dir}")
-				elif save_dir and type(save_dir) == list:
-					for dir in save_dir:
-						os.makedirs(dir, exist_ok=True)
-						self.save_audio(results[instr], sr, f"{file_name}_{instr}", dir)
-						self.logger.debug(f"Saved {instr} for {file_name}_{instr}.{self.output_format} in {dir}")
-
-			success_files.append(os.path.basename(path))
-			del mix, results
-			gc.collect()
-		
+				put(e)
+			finally:
+				put(None)
+
+		def release_slot(_):
+			write_slots.release()
+
+		def collect_writes(wait):
+			# files count as processed once all of their stems are written, in input order
+			while pending_writes and (wait or all(f.done() for f in pending_writes[0][2] or [])):
+				path, _, futures = pending_writes.pop(0)
+				if futures is not None:
+					for f in futures:
+						f.result()
+					success_files.append(os.path.basename(path))
+					# the progress of a file is complete once its stems are on disk, unless the next file has started
+					if self.callback and (self.callback.get("info") or {}).get("index") == file_lists.index(path) + 1:
+						self.callback["progress"] = 1.0
+				if progress_bar is not None:
+					progress_bar.update(1)
+
+		def wait_writes(file_name):
+			# outputs of an earlier file with the same name must be on disk before checking skip_existing_files
+			if any(name == file_name for _, name, _ in pending_writes):
+				collect_writes(wait=True)
+
+		producer = threading.Thread(target=produce, name="msst_decode_producer", daemon=True)
+		producer.start()
+		self._defer_done = True
+
+		try:
+			while True:
+				item = decoded.get()
+				if item is None:
+					break
+				if isinstance(item, Exception):
+					raise item
+
+				kind, path, file_name, future = item
+				if progress_bar is not None:
+					progress_bar.set_postfix({"track": os.path.basename(path)})
+
+				try:
+					if kind != "skip" and skip_existing_files:
+						wait_writes(file_name)
+						if self.outputs_exist(path, file_name):
+							kind = "skip"
+					if kind == "skip":
+						skipped_files.append(os.path.basename(path))
+						pending_writes.append((path, file_name, None))
+						continue
+
+					if self.callback:
+						self.callback["info"] = {"index": file_lists.index(path) + 1, "total": len(file_lists), "name": os.path.basename(path)}
+
+					if kind == "stream":
+						# separation errors propagate, the same as separate() on the regular path
+						with self.use_model():
+							self.separate_stream(path, file_name, sample_rate)
+						pending_writes.append((path, file_name, []))
+						continue
+
+					try:
+						mix, sr = future.result()
+					except Exception as e:
+						self.logger.warning(f"Cannot process track: {path}, error: {str(e)}")
+						pending_writes.append((path, file_name, None))
+						continue
+
+					self.logger.debug(f"Starting separation process for audio_file: {path}")
+					results = self.separate(mix)
+					self.logger.debug(f"Separation audio_file: {path} completed. Starting to save results.")
+
+					futures = []
+					for instr in results.keys():
+						save_dir = self.store_dirs.get(instr, "")
+						save_dirs = [save_dir] if save_dir and type(save_dir) == str else (save_dir if save_dir and type(save_dir) == list else [])
+						for dir in save_dirs:
+							os.makedirs(dir, exist_ok=True)
+							write_slots.acquire()
+							f = encode_pool.submit(self.save_audio, results[instr], sr, f"{file_name}_{instr}", dir)
+							f.add_done_callback(release_slot)
+							futures.append(f)
+							self.logger.debug(f"Queued {instr} for {file_name}_{instr}.{self.output_format} in {dir}")
+					pending_writes.append((path, file_name, futures))
+					del mix, results
+				finally:
+					collect_writes(wait=False)
+					gc.collect()
+
+			collect_writes(wait=True)
+		finally:
+			self._defer_done = False
+			stop_event.set()
+			producer.join()
+			decode_pool.shutdown(wait=True, cancel_futures=True)
+			encode_pool.shutdown(wait=True)
+			if progress_bar is not None:
+				progress_bar.close()
+
 		# 输出处理统计信息
 		if skip_existing_files and skipped_files:
 			self.logger.info(f"跳过了 {len(skipped_files)} 个已存在的文件")
 			self.logger.debug(f"跳过的文件列表: {', '.join(skipped_files[:10])}{'...' if len(skipped_files) > 10 else ''}")
 		self.logger.info(f"成功处理了 {len(success_files)} 个文件")
 		self.logger.info(f"统计信息: 输入文件总数={len(file_lists)}, 成功处理={len(success_files)}, 跳过={len(skipped_files)}")
-		
+
 		return success_files
 
+	def report_done(self):
+		if self.callback and not self._defer_done:
+			self.callback["progress"] = 1.0
+
+	def cache_fingerprint(self):
+		"""Everything besides the input that changes the separation results."""
+		return {"model_type": self.model_type, "checkpoint": hash_file(self.model_path), "config": config_to_dict(self.config), "use_tta": self.use_tta, "cpu_precision": self.cpu_precision}
+
 	def separate(self, mix):
+		with self.use_model():
+			return self._separate(mix)
+
+	def _separate(self, mix):
+		cache_key = None
+		if self.result_cache is not None:
+			cache_key = self.result_cache.make_key(mix, self.cache_fingerprint())
+			results = self.result_cache.get(cache_key)
+			if results is not None:
+				self.logger.debug("Separation results loaded from the result cache.")
+				self.report_done()
+				return results
+
 		isstereo = True
 		if self.model_type in ["bs_roformer", "mel_band_roformer"]:
 			isstereo = self.config.model.get("stereo", True)
@@ -265,7 +483,7 @@ class MSSeparator:
 			if self.config.inference['normalize']:
 				mix, norm_params = self.normalize_audio(mix)
 
-		waveforms_orig = demix(self.config, self.model, mix, self.device, model_type=self.model_type, callback=self.callback)
+		waveforms_orig = self.demix(mix)
 		self.logger.debug(f"Finished demixing track, total instruments: {len(waveforms_orig)}")
 
 		if self.use_tta:
@@ -295,13 +513,151 @@ class MSSeparator:
 
 				results[other_instruments[0]] = estimates.T
 
+		if cache_key is not None:
+			self.result_cache.put(cache_key, results)
+
 		self.logger.debug("Separation process completed.")
 
-		if self.callback:
-			self.callback["progress"] = 1.0
+		self.report_done()
 
 		return results
 
+	def can_stream(self, path, sample_rate):
+		try:
+			info = sf.info(path)
+		except Exception:
+			self.logger.debug(f"soundfile cannot read {path}, falling back to full decoding")
+			return False
+		if info.samplerate != sample_rate:
+			try:
+				import soxr  # noqa: F401
+			except ImportError:
+				self.logger.debug(f"soxr is not installed, cannot resample {path} while streaming, falling back to full decoding")
+				return False
+		return True
+
+	def _stream_norm_params(self, path, blocksize):
+		count, total, total_sq = 0, 0.0, 0.0
+		with sf.SoundFile(path) as f:
+			for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+				mono = block.mean(axis=1, dtype=np.float64)
+				count += mono.shape[0]
+				total += mono.sum()
+				total_sq += np.square(mono).sum()
+		mean = total / max(count, 1)
+		std = np.sqrt(max(total_sq / max(count, 1) - mean**2, 0.0))
+		return {"mean": mean, "std": std}
+
+	def separate_stream(self, path, file_name, sample_rate):
+		"""
+		Separate an audio file block by block and write every stem incrementally to store_dirs.
+		Peak memory depends on chunk_size, num_overlap and batch_size, not on the track duration.
+		"""
+		isstereo = True
+		if self.model_type in ["bs_roformer", "mel_band_roformer"]:
+			isstereo = self.config.model.get("stereo", True)
+		channels = 2 if isstereo else 1
+
+		target_instrument = self.config.training.target_instrument
+		other_instruments = [instr for instr in self.config.training.instruments if instr != target_instrument] if target_instrument is not None else []
+
+		demixer = StreamingDemixer(self.config, self.model, self.device, model_type=self.model_type, use_tta=self.use_tta, check_finite=self.check_track_finite)
+		blocksize = demixer.step * demixer.batch_size
+
+		norm_params = None
+		if self.config.inference.get("normalize"):
+			norm_params = self._stream_norm_params(path, blocksize)
+
+		writers = {}
+		pending_mix = np.zeros((channels, 0), dtype=np.float32)  # input not matched by an output yet, for the residual stem
+
+		def write(instr, audio):
+			save_dir = self.store_dirs.get(instr, "")
+			dirs = [save_dir] if type(save_dir) == str else save_dir
+			for dir in dirs:
+				if not dir:
+					continue
+				if (instr, dir) not in writers:
+					os.makedirs(dir, exist_ok=True)
+					file = os.path.join(dir, f"{file_name}_{instr}.{self.output_format}")
+					writers[(instr, dir)] = StreamingAudioWriter(file, sample_rate, channels, self.output_format, self.audio_params)
+				writers[(instr, dir)].write(audio.T)
+
+		def store(results):
+			nonlocal pending_mix
+			for instr, estimates in results.items():
+				if estimates.shape[-1] == 0:
+					continue
+				if instr == target_instrument and other_instruments:
+					# the same as separate(): the original mix minus the estimate, then denormalised
+					n = estimates.shape[-1]
+					residual = pending_mix[:, :n] - estimates
+					pending_mix = pending_mix[:, n:]
+					if norm_params is not None:
+						residual = residual * norm_params["std"] + norm_params["mean"]
+				if norm_params is not None:
+					estimates = estimates * norm_params["std"] + norm_params["mean"]
+				write(instr, estimates)
+
+				if instr == target_instrument and other_instruments:
+					write(other_instruments[0], residual)
+
+		def feed(block):
+			nonlocal pending_mix
+			mix = block.T
+			if isstereo and mix.shape[0] == 1:
+				mix = np.concatenate([mix, mix], axis=0)
+			elif isstereo and mix.shape[0] > 2:
+				mix = np.repeat(mix.mean(axis=0, keepdims=True), 2, axis=0)
+			elif not isstereo and mix.shape[0] != 1:
+				mix = mix.mean(axis=0, keepdims=True)
+
+			if other_instruments:
+				pending_mix = np.concatenate([pending_mix, mix], axis=-1)
+			if norm_params is not None:
+				mix = (mix - norm_params["mean"]) / norm_params["std"]
+			store(demixer.push(mix))
+
+		try:
+			with sf.SoundFile(path) as f:
+				resampler = None
+				if f.samplerate != sample_rate:
+					import soxr
+
+					resampler = soxr.ResampleStream(f.samplerate, sample_rate, f.channels, dtype="float32")
+				total = max(int(f.frames * sample_rate / f.samplerate), 1)
+				self.logger.debug(f"Streaming separation of {path}: {total} samples, blocksize: {blocksize}")
+
+				done = 0
+				for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+					if resampler is not None:
+						block = resampler.resample_chunk(block, last=False)
+					done += block.shape[0]
+					feed(block)
+					if self.callback:
+						self.callback["progress"] = min(0.99 * (done / total), 0.99)
+
+				if resampler is not None:
+					feed(resampler.resample_chunk(np.zeros((0, f.channels), dtype=np.float32), last=True))
+
+			store(demixer.flush())
+		except Exception:
+			for writer in writers.values():
+				try:
+					writer.close()
+				except Exception:
+					pass
+				if os.path.exists(writer.path):
+					os.remove(writer.path)
+			raise
+
+		for writer in writers.values():
+			writer.close()
+
+		self.report_done()
+
+		self.logger.debug(f"Streaming separation of {path} completed.")
+
 	def save_audio(self, audio, sr, file_name, store_dir):
 		if self.output_format.lower() == "flac":
 			file = os.path.join(store_dir, file_name + ".flac")
@@ -336,6 +692,19 @@ class MSSeparator:
 		
 		# 注意：不再删除self.model，因为模型现在由模型管理器缓存和复用
 
+	def apply_tuned_params(self, params):
+		"""
+		Fill the params the caller did not set with the autotune profile of this checkpoint on this device model
+		(scripts/autotune_cli.py). Set MSST_AUTOTUNE=0 to keep the values of the model config.
+		"""
+		tuned = get_tuned_params(self.model_path, self.model_device, self.device_ids, self.cpu_precision)
+		params = dict(params)
+		applied = {key: value for key, value in tuned.items() if params.get(key) is None}
+		if applied:
+			params.update(applied)
+			self.logger.info(f"Using autotuned inference params: {applied}")
+		return params
+
 	def update_inference_params(self, config, params):
 		for key, value in {"batch_size": "inference", "num_overlap": "inference", "chunk_size": "audio", "normalize": "inference"}.items():
 			if config[value].get(key) and params[key] is not None:
@@ -0,0 +1,192 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# MSSeparator / ModelManager 的设备名，STFT/iSTFT 和分块仍由 PyTorch 在CPU上完成，separate_core 由 ONNX Runtime 执行
+ONNX_DEVICE = "onnx-cpu"
+# 提供 separate_core（STFT和iSTFT之间的网络）的模型类型
+ONNX_MODEL_TYPES = ["mdx23c", "bs_roformer", "mel_band_roformer", "scnet"]
+ONNX_OPSET = 17
+
+
+def import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImportError(f"onnxruntime is required for device='{ONNX_DEVICE}', install it with: pip install onnxruntime")
+    return onnxruntime
+
+
+def get_onnx_path(model_path: str, cache_key: str, core_shape) -> str:
+    """
+    导出的计算图保存在检查点旁边：<检查点名>.<键>.onnx，检查点目录不可写时保存到缓存目录
+    键包含检查点和配置的哈希、torch版本、opset和核心网络的输入形状（不含batch）
+    """
+    spec = f"{cache_key}|{torch.__version__}|{ONNX_OPSET}|{tuple(core_shape)}"
+    key = hashlib.sha256(spec.encode()).hexdigest()[:16]
+    name = f"{os.path.splitext(os.path.basename(model_path))[0]}.{key}.onnx"
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    if os.access(model_dir, os.W_OK):
+        return os.path.join(model_dir, name)
+    from utils.constant import get_cache_dir
+
+    return os.path.join(get_cache_dir(), "onnx", name)
+
+
+class CoreModule(torch.nn.Module):
+    """
+    导出用的包装：只调用模型类定义的 separate_core，不经过 OnnxModel 的替换
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return type(self.model).separate_core(self.model, x)
+
+
+def export_core(model: torch.nn.Module, example: torch.Tensor, path: str):
+    """
+    把模型的 separate_core 导出为ONNX，batch维度为动态；TorchScript导出失败时尝试 dynamo 导出
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    core = CoreModule(model).eval()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    export_kwargs = dict(input_names=["input"], output_names=["output"], dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}})
+
+    start_time = time.time()
+    with torch.inference_mode(False), torch.no_grad():
+        example = example.detach().to("cpu", torch.float32).clone()
+        try:
+            torch.onnx.export(core, (example,), tmp_path, opset_version=ONNX_OPSET, **export_kwargs)
+        except Exception as e:
+            logger.debug(f"TorchScript ONNX export failed, retrying with the dynamo exporter: {e}")
+            torch.onnx.export(core, (example,), tmp_path, opset_version=max(ONNX_OPSET, 18), dynamo=True, **export_kwargs)
+    os.replace(tmp_path, path)
+    logger.info(f"ONNX导出完成，耗时: {time.time() - start_time:.2f}秒，保存到: {path}")
+
+
+class OnnxCore:
+    """
+    ONNX Runtime 会话，输入输出为CPU上的 torch.Tensor，通过 IO binding 直接使用输入张量的内存
+    MSST_ONNX_THREADS 设置算子内的线程数（默认由 ONNX Runtime 决定）
+    """
+
+    def __init__(self, path: str, threads: Optional[int] = None):
+        ort = import_onnxruntime()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads if threads is not None else int(os.environ.get("MSST_ONNX_THREADS", 0))
+        if threads > 0:
+            options.intra_op_num_threads = threads
+
+        start_time = time.time()
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        logger.info(f"ONNX Runtime 会话加载完成，耗时: {time.time() - start_time:.2f}秒: {path}")
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.detach().to("cpu", torch.float32).contiguous()
+        binding = self.session.io_binding()
+        binding.bind_input(self.input_name, "cpu", 0, np.float32, tuple(x.shape), x.data_ptr())
+        binding.bind_output(self.output_name, "cpu")
+        self.session.run_with_iobinding(binding)
+        return torch.from_numpy(binding.copy_outputs_to_cpu()[0])
+
+
+class OnnxModel(torch.nn.Module):
+    """
+    在CPU上用 ONNX Runtime 执行模型的 separate_core，接口与原模型相同，原模型保存在 module 属性中（与 DataParallel 相同）
+
+    原模型的 forward（STFT、iSTFT和掩码计算）仍由 PyTorch 执行，demix 的分块逻辑不变。
+    第一次以某个形状调用时导出（或加载已导出的）计算图，导出或加载失败时使用 PyTorch
+    """
+
+    def __init__(self, module: torch.nn.Module, model_type: str, model_path: str, cache_key: str):
+        super().__init__()
+        if model_type not in ONNX_MODEL_TYPES:
+            raise ValueError(f"Model type {model_type} is not supported by the ONNX backend, supported: {ONNX_MODEL_TYPES}")
+        import_onnxruntime()
+
+        self.module = module
+        self.model_type = model_type
+        self.model_path = model_path
+        self.cache_key = cache_key
+        self.__dict__["_cores"] = {}  # 核心网络的输入形状（不含batch）-> OnnxCore，None 表示导出失败
+        self.__dict__["_lock"] = threading.Lock()
+        self.__dict__["_local"] = threading.local()
+        if hasattr(module, "check_finite"):
+            module.check_finite = False
+        # 原模型的 forward 调用 separate_core 时转到 ONNX Runtime
+        module.separate_core = self._run_core
+
+    def forward(self, x):
+        return self.module(x)
+
+    def eager(self, x):
+        """用 PyTorch 执行完整的模型，用于对比"""
+        self._local.eager = True
+        try:
+            return self.module(x)
+        finally:
+            self._local.eager = False
+
+    def _run_core(self, x):
+        core = None
+        if not self.training and not getattr(self._local, "eager", False):
+            core = self._get_core(x)
+        if core is None:
+            return type(self.module).separate_core(self.module, x)
+        return core(x).to(x.device)
+
+    def _get_core(self, x):
+        shape = tuple(x.shape[1:])
+        with self._lock:
+            if shape not in self._cores:
+                self._cores[shape] = self._load(x)
+            return self._cores[shape]
+
+    def _load(self, x):
+        path = get_onnx_path(self.model_path, self.cache_key, x.shape[1:])
+        try:
+            if not os.path.exists(path):
+                export_core(self.module, x, path)
+            return OnnxCore(path)
+        except Exception as e:
+            logger.warning(f"ONNX导出或加载失败，使用PyTorch: shape: {tuple(x.shape)}, error: {e}")
+            return None
+
+
+def check_parity(model: OnnxModel, x: torch.Tensor) -> Dict[str, float]:
+    """
+    同一输入分别用 ONNX Runtime 和 PyTorch 执行，返回最大绝对误差、SDR（以PyTorch输出为参考，dB）和两者的耗时
+    """
+    with torch.inference_mode():
+        model(x)  # 导出和加载不计入耗时
+        start_time = time.time()
+        onnx_out = model(x)
+        onnx_time = time.time() - start_time
+        start_time = time.time()
+        eager_out = model.eager(x)
+        eager_time = time.time() - start_time
+
+    reference = eager_out.double()
+    error = onnx_out.double() - reference
+    sdr = 10 * torch.log10(reference.pow(2).sum() / error.pow(2).sum().clamp(min=1e-20))
+    return {
+        "max_abs_diff": error.abs().max().item(),
+        "sdr": sdr.item(),
+        "onnx_time": onnx_time,
+        "eager_time": eager_time,
+    }
@@ -0,0 +1,195 @@
+import os
+import time
+import numpy as np
+from typing import Dict, List, Tuple
+
+from utils.logger import get_logger
+from utils.lazy_import import lazy_import
+
+librosa = lazy_import("librosa")
+
+logger = get_logger()
+
+
+class PresetEngine:
+    """
+    在当前进程中执行预设的全部步骤
+    分离器（以及模型）在歌曲之间保持加载，步骤之间的音轨以内存数组传递，只有需要保存的音轨才会编码写盘
+    """
+
+    def __init__(self, preset_data: dict, force_cpu=False, use_tta=False, output_format="wav", step_devices=None, dynamic_batching=False, logger=logger):
+        from webui.preset import Presets
+
+        self.preset = Presets(preset_data, force_cpu=force_cpu, use_tta=use_tta, logger=logger)
+        self.output_format = output_format
+        self.logger = logger
+        self.steps = [self.preset.get_step(i) for i in range(self.preset.total_steps)]
+        # 每一步使用的设备，例如 ["cuda:0", "cuda:1"]，也可以在预设的步骤中写 "device"
+        self.step_devices = step_devices or []
+        # 多首歌同时执行同一个MSST步骤时，通过模型的动态批处理器把它们的分块合并成batch
+        self.dynamic_batching = dynamic_batching
+        self.separators = []
+
+    @property
+    def audio_params(self):
+        return {"wav_bit_depth": self.preset.wav_bit_depth, "flac_bit_depth": self.preset.flac_bit_depth, "mp3_bit_rate": self.preset.mp3_bit_rate}
+
+    def get_step_device(self, index: int):
+        """
+        返回步骤指定的设备（"cpu", "mps", "cuda:N"），未指定时返回None（自动选择）
+        """
+        if self.preset.force_cpu:
+            return "cpu"
+        device = self.steps[index].get("device")
+        if not device and index < len(self.step_devices):
+            device = self.step_devices[index]
+        return device or None
+
+    def load(self):
+        """
+        加载所有步骤的模型，MSST模型通过模型管理器缓存
+        """
+        if self.separators:
+            return
+
+        from webui.utils import get_msst_model
+
+        for index, step in enumerate(self.steps):
+            start_time = time.time()
+            device = self.get_step_device(index)
+            if step["model_type"] == "UVR_VR_Models":
+                from modules.vocal_remover.separator import Separator
+
+                separator = Separator(
+                    logger=self.logger,
+                    debug=self.preset.debug,
+                    model_file=os.path.join(self.preset.vr_model_path, step["model_name"]),
+                    output_dir={},
+                    output_format=self.output_format,
+                    invert_using_spec=self.preset.invert_using_spec,
+                    use_cpu=self.preset.force_cpu or device == "cpu",
+                    device=device,
+                    vr_params={
+                        "batch_size": self.preset.batch_size,
+                        "window_size": self.preset.window_size,
+                        "aggression": self.preset.aggression,
+                        "enable_tta": self.preset.use_tta,
+                        "enable_post_process": self.preset.enable_post_process,
+                        "post_process_threshold": self.preset.post_process_threshold,
+                        "high_end_process": self.preset.high_end_process,
+                    },
+                    audio_params=self.audio_params,
+                )
+            else:
+                from inference.msst_infer import MSSeparator
+
+                model_path, config_path, msst_model_type, _ = get_msst_model(step["model_name"])
+                device_ids = self.preset.gpu_ids
+                if device and device.startswith("cuda:"):
+                    device, device_ids = "auto", [int(device.split(":")[1])]
+                separator = MSSeparator(
+                    model_type=msst_model_type,
+                    config_path=config_path,
+                    model_path=model_path,
+                    device=device or self.preset.device,
+                    device_ids=device_ids,
+                    output_format=self.output_format,
+                    use_tta=self.preset.use_tta,
+                    store_dirs={},
+                    audio_params=self.audio_params,
+                    logger=self.logger,
+                    debug=self.preset.debug,
+                )
+                if self.dynamic_batching and separator.batcher is None:
+                    # 与分离器自己创建的批处理器相同，使用其实际设备（如 onnx-cpu）和CPU精度
+                    separator.dynamic_batching = True
+                    separator.batcher = separator.get_batcher()
+            self.separators.append(separator)
+            self.logger.info(f"Step {index + 1}: {step['model_name']} loaded on {device or 'auto'}, time cost: {time.time() - start_time:.2f}s")
+
+    def supports_concurrency(self, index: int) -> bool:
+        """
+        步骤能否同时处理多首歌：MSST分离器不保存每首歌的状态，VR分离器不能并发使用
+        """
+        return self.steps[index]["model_type"] != "UVR_VR_Models"
+
+    def get_sample_rate(self, index: int) -> int:
+        separator = self.separators[index]
+        if hasattr(separator, "config"):
+            return getattr(separator.config.audio, "sample_rate", 44100)
+        return separator.sample_rate
+
+    def separate(self, mix: np.ndarray, sr: int, file_name: str, step_callback=None) -> Tuple[List[Tuple[str, np.ndarray, int, int]], np.ndarray, int]:
+        """
+        依次执行所有步骤, mix: (channels, samples)
+        返回需要保存的音轨列表 [(文件名, 音频(samples, channels), 采样率, 步骤序号)]，以及最后一步的input_to_next音轨
+        step_callback(步骤序号) 在每一步完成后调用
+        """
+        self.load()
+
+        outputs = []
+        current, current_sr, name = mix, sr, file_name
+        for index in range(len(self.steps)):
+            step_outputs, current, current_sr, name = self.run_step(index, current, current_sr, name)
+            outputs.extend(step_outputs)
+            if step_callback:
+                step_callback(index)
+
+        return outputs, current, current_sr
+
+    def run_step(self, index: int, current: np.ndarray, current_sr: int, name: str):
+        """
+        执行单个步骤，返回 (需要保存的音轨, 下一步的输入, 采样率, 下一步的文件名)
+        """
+        step = self.steps[index]
+        step_sr = self.get_sample_rate(index)
+        if current_sr != step_sr:
+            current = librosa.resample(current, orig_sr=current_sr, target_sr=step_sr)
+            current_sr = step_sr
+
+        results = self.separators[index].separate(current)
+
+        input_to_next = step["input_to_next"]
+        stored = list(step.get("output_to_storage", []))
+        # 最后一步的input_to_next音轨即为最终结果
+        if index == len(self.steps) - 1 and input_to_next not in stored:
+            stored.append(input_to_next)
+        outputs = [(f"{name}_{stem}", results[stem], current_sr, index) for stem in stored]
+
+        return outputs, results[input_to_next].T, current_sr, f"{name}_{input_to_next}"
+
+    def save(self, outputs, store_dir: str):
+        os.makedirs(store_dir, exist_ok=True)
+        for output_name, audio, sr, index in outputs:
+            self.separators[index].save_audio(audio, sr, output_name, store_dir)
+
+    def process_file(self, path: str, store_dir: str, step_callback=None) -> Dict[str, float]:
+        """
+        处理单个文件，返回各阶段耗时（秒）: decode, separate, encode
+        """
+        timings = {}
+        file_name = os.path.splitext(os.path.basename(path))[0]
+
+        start_time = time.time()
+        mix, sr = self.load_audio(path)
+        timings["decode"] = time.time() - start_time
+
+        start_time = time.time()
+        outputs, _, _ = self.separate(mix, sr, file_name, step_callback=step_callback)
+        timings["separate"] = time.time() - start_time
+
+        start_time = time.time()
+        self.save(outputs, store_dir)
+        timings["encode"] = time.time() - start_time
+
+        return timings
+
+    def load_audio(self, path: str):
+        mix, sr = librosa.load(path, sr=self.get_sample_rate(0) if self.separators else 44100, mono=False)
+        if mix.ndim == 1:
+            mix = np.stack([mix, mix], axis=0)
+        return mix, sr
+
+    def del_cache(self):
+        for separator in self.separators:
+            separator.del_cache()
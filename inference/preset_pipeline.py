@@ -0,0 +1,196 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Union
+
+from inference.preset_engine import PresetEngine
+from utils.logger import get_logger
+
+logger = get_logger()
+
+_STOP = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.files = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.files += 1
+            self.busy += seconds
+
+    def to_dict(self, wall_time: float) -> Dict[str, float]:
+        return {
+            "files": self.files,
+            "busy": round(self.busy, 3),
+            "files_per_second": round(self.files / self.busy, 4) if self.busy > 0 else 0.0,
+            "utilization": round(self.busy / wall_time, 4) if wall_time > 0 else 0.0,
+        }
+
+
+class PresetPipeline:
+    """
+    以歌曲为单位在预设步骤之间流水线执行：解码 -> 步骤1 -> ... -> 步骤N -> 编码
+    每个阶段一个线程，阶段之间通过有界队列连接，因此第1首歌处于步骤2时第2首歌已经在执行步骤1
+    每首歌经过的计算与 PresetEngine.separate 完全相同，结果与顺序模式一致
+    step_concurrency > 1 时每个MSST步骤由多个线程同时处理不同的歌曲，配合动态批处理把多首歌的分块合并到同一个batch中
+    """
+
+    def __init__(self, engine: PresetEngine, queue_size: int = 2, step_concurrency: int = 1, logger=logger):
+        self.engine = engine
+        self.queue_size = max(1, int(queue_size))
+        self.step_concurrency = max(1, int(step_concurrency))
+        self.logger = logger
+        self.stats = {}
+
+    def run(self, files: List[str], store_dir: Union[str, Dict[str, str]], file_callback: Optional[Callable] = None,
+            step_callback: Optional[Callable] = None, cancelled: Optional[Callable] = None) -> Dict[str, Dict[str, float]]:
+        """
+        处理文件列表，返回各阶段的吞吐统计
+        store_dir 为输出目录，或者 {输入文件路径: 输出目录}（批量处理多个任务时每个任务写入自己的目录）
+        file_callback(path, error) 在每个文件写盘完成（或失败）后按完成顺序调用，error 为 None 表示成功
+        step_callback(step_index, path) 在每个文件完成一个步骤后调用
+        cancelled(path) 返回True的文件不再继续处理，也不会调用 file_callback
+        """
+        self.engine.load()
+        store_dirs = store_dir if isinstance(store_dir, dict) else {path: store_dir for path in files}
+        for directory in set(store_dirs.values()):
+            os.makedirs(directory, exist_ok=True)
+
+        total_steps = len(self.engine.steps)
+        stage_names = ["decode"] + [f"step_{index + 1}" for index in range(total_steps)] + ["encode"]
+        self.stats = {name: StageStats(name) for name in stage_names}
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(total_steps + 1)]
+        abort = threading.Event()
+        workers_per_step = [self.step_concurrency if self.engine.supports_concurrency(index) else 1 for index in range(total_steps)]
+        remaining = list(workers_per_step)
+        remaining_lock = threading.Lock()
+
+        def is_cancelled(item):
+            if cancelled is not None and not item.get("cancelled") and cancelled(item["path"]):
+                item["cancelled"] = True
+                item["audio"] = None
+                self.logger.info(f"Cancelled: {item['path']}")
+            return item.get("cancelled", False)
+
+        def put(q, item):
+            # 下游出错退出时不要永远阻塞在满队列上
+            while not abort.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def get(q):
+            while not abort.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _STOP
+
+        def decode_worker():
+            stats = self.stats["decode"]
+            try:
+                for path in files:
+                    if abort.is_set():
+                        break
+                    item = {"path": path, "name": os.path.splitext(os.path.basename(path))[0], "outputs": [], "error": None}
+                    if is_cancelled(item):
+                        continue
+                    start_time = time.time()
+                    try:
+                        item["audio"], item["sr"] = self.engine.load_audio(path)
+                    except Exception as e:
+                        item["error"] = e
+                        self.logger.error(f"Fail to decode: {path}, error: {e}\n{traceback.format_exc()}")
+                    stats.add(time.time() - start_time)
+                    put(queues[0], item)
+            finally:
+                put(queues[0], _STOP)
+
+        def step_worker(index):
+            stats = self.stats[f"step_{index + 1}"]
+            while True:
+                item = get(queues[index])
+                if item is _STOP:
+                    # 让同一步骤的其他线程也看到结束标记，最后一个退出的线程通知下一阶段
+                    with remaining_lock:
+                        remaining[index] -= 1
+                        last = remaining[index] == 0
+                    if last:
+                        put(queues[index + 1], _STOP)
+                    else:
+                        put(queues[index], _STOP)
+                    return
+                if item["error"] is None and not is_cancelled(item):
+                    start_time = time.time()
+                    try:
+                        outputs, item["audio"], item["sr"], item["name"] = self.engine.run_step(index, item["audio"], item["sr"], item["name"])
+                        item["outputs"].extend(outputs)
+                    except Exception as e:
+                        item["error"] = e
+                        item["audio"] = None
+                        self.logger.error(f"Fail to process: {item['path']} at step {index + 1}, error: {e}\n{traceback.format_exc()}")
+                    else:
+                        if step_callback:
+                            step_callback(index, item["path"])
+                    stats.add(time.time() - start_time)
+                    self.engine.separators[index].del_cache()
+                put(queues[index + 1], item)
+
+        threads = [threading.Thread(target=decode_worker, name="preset_decode", daemon=True)]
+        for index in range(total_steps):
+            threads += [threading.Thread(target=step_worker, args=(index,), name=f"preset_step_{index + 1}_{n}", daemon=True) for n in range(workers_per_step[index])]
+
+        wall_start = time.time()
+        for thread in threads:
+            thread.start()
+
+        # 编码在当前线程中进行
+        stats = self.stats["encode"]
+        try:
+            while True:
+                item = get(queues[total_steps])
+                if item is _STOP:
+                    break
+                if item.get("cancelled"):
+                    continue
+                if item["error"] is None:
+                    start_time = time.time()
+                    try:
+                        self.engine.save(item["outputs"], store_dirs[item["path"]])
+                    except Exception as e:
+                        item["error"] = e
+                        self.logger.error(f"Fail to save: {item['path']}, error: {e}\n{traceback.format_exc()}")
+                    stats.add(time.time() - start_time)
+                if file_callback:
+                    file_callback(item["path"], item["error"])
+        finally:
+            abort.set()
+            for thread in threads:
+                thread.join()
+
+        return self.report(time.time() - wall_start)
+
+    def report(self, wall_time: float) -> Dict[str, Dict[str, float]]:
+        """
+        记录并返回每个阶段的处理文件数、忙碌时间、吞吐（文件/秒）和利用率
+        利用率最高的阶段即为流水线瓶颈
+        """
+        report = {name: stage.to_dict(wall_time) for name, stage in self.stats.items()}
+        for name, values in report.items():
+            self.logger.info(f"[{name}] files: {values['files']}, busy: {values['busy']:.2f}s, "
+                             f"throughput: {values['files_per_second']:.3f} files/s, utilization: {values['utilization'] * 100:.1f}%")
+        if report:
+            bottleneck = max(report, key=lambda name: report[name]["utilization"])
+            self.logger.info(f"Pipeline wall time: {wall_time:.2f}s, bottleneck stage: {bottleneck}")
+        report["wall_time"] = round(wall_time, 3)
+        return report
@@ -0,0 +1,203 @@
+import os
+import json
+import uuid
+import zipfile
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# 结果缓存格式版本，分离逻辑发生不兼容变化时递增，旧的缓存条目自动失效
+CACHE_VERSION = 2
+
+# 只影响执行方式、不影响分离结果的推理参数，不参与缓存键的计算
+# batch_size、accumulate_on_device、use_pipeline、dynamic_batching 等会改变批次组成或累加的设备，结果只在浮点误差内相同，仍参与缓存键
+EXECUTION_ONLY_KEYS = [
+    "max_batch_wait", "decode_workers", "encode_workers", "prefetch_files", "check_finite",
+]
+
+def hash_audio(audio: np.ndarray) -> str:
+    """
+    解码后PCM数据的哈希（包含形状和数据类型）
+    """
+    audio = np.ascontiguousarray(audio)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{audio.dtype.str}{audio.shape}".encode())
+    h.update(memoryview(audio).cast("B"))
+    return h.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    模型文件内容的哈希，由模型索引按 (路径, 大小, 修改时间) 持久保存，同一个检查点只读取一次
+    """
+    from utils.model_registry import get_model_registry
+
+    return get_model_registry().get_file_hash(path)
+
+
+def config_to_dict(config) -> dict:
+    """
+    ConfigDict / OmegaConf 配置转换为普通字典，去掉只影响执行方式的推理参数
+    """
+    if hasattr(config, "to_dict"):
+        data = config.to_dict()
+    else:
+        from omegaconf import OmegaConf
+
+        data = OmegaConf.to_container(config, resolve=True)
+    inference = dict(data.get("inference", {}) or {})
+    for key in EXECUTION_ONLY_KEYS:
+        inference.pop(key, None)
+    data["inference"] = inference
+    return data
+
+
+class ResultCache:
+    """
+    以内容寻址的分离结果缓存：键由输入PCM哈希、模型检查点哈希、配置和推理参数组成
+    每个条目以一个 .npz 文件保存所有音轨（不经过音频编码），总大小超过上限时按最近使用顺序淘汰
+    多个进程可以共享同一个缓存目录，条目以原子重命名写入
+    """
+
+    def __init__(self, cache_dir: str, max_size: int, compress: bool = False, logger=logger):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.compress = compress
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = None  # key -> 文件字节数，按最近使用排序
+        self._total_size = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def make_key(self, audio: np.ndarray, fingerprint: dict) -> str:
+        """
+        fingerprint 描述模型和影响结果的参数，例如 {"checkpoint": ..., "config": ..., "use_tta": ...}
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps({"version": CACHE_VERSION, **fingerprint}, sort_keys=True, default=str).encode())
+        h.update(hash_audio(audio).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".npz"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total_size = sum(self._index.values())
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                results = {str(stem): data[f"stem_{i}"] for i, stem in enumerate(data["stems"])}
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._stats["hits"] += 1
+            if self._index is not None and key in self._index:
+                self._index.move_to_end(key)
+        self.logger.debug(f"Result cache hit: {key}")
+        return results
+
+    def put(self, key: str, results: Dict[str, np.ndarray]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        stems = list(results.keys())
+        arrays = {f"stem_{i}": np.asarray(results[stem]) for i, stem in enumerate(stems)}
+        try:
+            with open(tmp_path, "wb") as f:
+                (np.savez_compressed if self.compress else np.savez)(f, stems=np.array(stems), **arrays)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Cannot write result cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self._load_index()
+            self._total_size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._stats["stores"] += 1
+            self._evict()
+
+    def _evict(self):
+        while self._total_size > self.max_size and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total_size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._stats["evictions"] += 1
+            self.logger.debug(f"Result cache evicted: {key}, {size / 1024 / 1024:.1f}MB")
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._index.keys()):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total_size = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._load_index()
+            return {**self._stats, "entries": len(self._index), "size": self._total_size, "max_size": self.max_size}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    获取全局结果缓存，环境变量 MSST_RESULT_CACHE_SIZE（单位GB）大于0时启用，未设置时返回None
+    MSST_RESULT_CACHE_DIR 指定缓存目录（默认在缓存目录下的 results），MSST_RESULT_CACHE_COMPRESS=1 启用压缩
+    """
+    global _result_cache
+    max_size = float(os.environ.get("MSST_RESULT_CACHE_SIZE", 0) or 0)
+    if max_size <= 0:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            from utils.constant import get_cache_dir
+
+            cache_dir = os.environ.get("MSST_RESULT_CACHE_DIR") or os.path.join(get_cache_dir(), "results")
+            compress = os.environ.get("MSST_RESULT_CACHE_COMPRESS", "0") == "1"
+            _result_cache = ResultCache(cache_dir, int(max_size * 1024 ** 3), compress=compress)
+            logger.info(f"Result cache enabled: {cache_dir}, max size: {max_size}GB")
+        return _result_cache
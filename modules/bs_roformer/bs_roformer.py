@@ -412,7 +412,8 @@ class BSRoformer(Module):
 			use_torch_checkpoint=False,
 			skip_connection=False,
 			sage_attention=False,
-			use_shared_bias=False
+			use_shared_bias=False,
+			check_finite=True
 	):
 		super().__init__()
 
@@ -421,6 +422,8 @@ class BSRoformer(Module):
 		self.num_stems = num_stems
 		self.use_torch_checkpoint = use_torch_checkpoint
 		self.skip_connection = skip_connection
+		# NaN/Inf checks after the stft and band split, each one waits for the device; turned off for inference
+		self.check_finite = check_finite
 
 		self.layers = ModuleList([])
 
@@ -511,67 +514,18 @@ class BSRoformer(Module):
 			normalized=multi_stft_normalized
 		)
 
-	def forward(
-			self,
-			raw_audio,
-			target=None,
-			return_loss_breakdown=False
-	):
+	def separate_core(self, x):
 		"""
-		einops
-
-		b - batch
-		f - freq
-		t - time
-		s - audio channel (1 for mono, 2 for stereo)
-		n - number of 'stems'
-		c - complex (2)
-		d - feature dimension
+		the network between the stft and the mask application: (b, t, (f c)) -> mask (b, n, t, (f c))
+		kept separate so it can be exported without the complex stft ops (inference/onnx_backend.py)
 		"""
 
-		device = raw_audio.device
-
-		# defining whether model is loaded on MPS (MacOS GPU accelerator)
-		x_is_mps = True if device.type == "mps" else False
-
-		if raw_audio.ndim == 2:
-			raw_audio = rearrange(raw_audio, 'b t -> b 1 t')
-
-		channels = raw_audio.shape[1]
-		assert (not self.stereo and channels == 1) or (self.stereo and channels == 2), 'stereo needs to be set to True if passing in audio signal that is stereo (channel dimension of 2). also need to be False if mono (channel dimension of 1)'
-
-		# to stft
-
-		raw_audio, batch_audio_channel_packed_shape = pack_one(raw_audio, '* t')
-
-		stft_window = self.stft_window_fn(device=device)
-
-		# RuntimeError: FFT operations are only supported on MacOS 14+
-		# Since it's tedious to define whether we're on correct MacOS version - simple try-catch is used
-		try:
-			stft_repr = torch.stft(raw_audio, **self.stft_kwargs, window=stft_window, return_complex=True)
-		except:
-			stft_repr = torch.stft(raw_audio.cpu() if x_is_mps else raw_audio, **self.stft_kwargs,
-								   window=stft_window.cpu() if x_is_mps else stft_window, return_complex=True).to(
-				device)
-		stft_repr = torch.view_as_real(stft_repr)
-
-		stft_repr = unpack_one(stft_repr, batch_audio_channel_packed_shape, '* f t c')
-
-		# merge stereo / mono into the frequency, with frequency leading dimension, for band splitting
-		stft_repr = rearrange(stft_repr,'b s f t c -> b (f s) t c')
-
-		x = rearrange(stft_repr, 'b f t c -> b t (f c)')
-
-		if torch.isnan(x).any() or torch.isinf(x).any():
-			raise RuntimeError(f"NaN/Inf in x after stft: {x.isnan().sum()} NaNs, {x.isinf().sum()} Infs")
-
 		if self.use_torch_checkpoint:
 			x = checkpoint(self.band_split, x, use_reentrant=False)
 		else:
 			x = self.band_split(x)
 
-		if torch.isnan(x).any() or torch.isinf(x).any():
+		if self.check_finite and (torch.isnan(x).any() or torch.isinf(x).any()):
 			raise RuntimeError(f"NaN/Inf in x after band_split: {x.isnan().sum()} NaNs, {x.isinf().sum()} Infs")
 
 		# axial / hierarchical attention
@@ -620,12 +574,70 @@ class BSRoformer(Module):
 
 		x = self.final_norm(x)
 
-		num_stems = len(self.mask_estimators)
-
 		if self.use_torch_checkpoint:
 			mask = torch.stack([checkpoint(fn, x, use_reentrant=False) for fn in self.mask_estimators], dim=1)
 		else:
 			mask = torch.stack([fn(x) for fn in self.mask_estimators], dim=1)
+
+		return mask
+
+	def forward(
+			self,
+			raw_audio,
+			target=None,
+			return_loss_breakdown=False
+	):
+		"""
+		einops
+
+		b - batch
+		f - freq
+		t - time
+		s - audio channel (1 for mono, 2 for stereo)
+		n - number of 'stems'
+		c - complex (2)
+		d - feature dimension
+		"""
+
+		device = raw_audio.device
+
+		# defining whether model is loaded on MPS (MacOS GPU accelerator)
+		x_is_mps = True if device.type == "mps" else False
+
+		if raw_audio.ndim == 2:
+			raw_audio = rearrange(raw_audio, 'b t -> b 1 t')
+
+		channels = raw_audio.shape[1]
+		assert (not self.stereo and channels == 1) or (self.stereo and channels == 2), 'stereo needs to be set to True if passing in audio signal that is stereo (channel dimension of 2). also need to be False if mono (channel dimension of 1)'
+
+		# to stft
+
+		raw_audio, batch_audio_channel_packed_shape = pack_one(raw_audio, '* t')
+
+		stft_window = self.stft_window_fn(device=device)
+
+		# RuntimeError: FFT operations are only supported on MacOS 14+
+		# Since it's tedious to define whether we're on correct MacOS version - simple try-catch is used
+		try:
+			stft_repr = torch.stft(raw_audio, **self.stft_kwargs, window=stft_window, return_complex=True)
+		except:
+			stft_repr = torch.stft(raw_audio.cpu() if x_is_mps else raw_audio, **self.stft_kwargs,
+								   window=stft_window.cpu() if x_is_mps else stft_window, return_complex=True).to(
+				device)
+		stft_repr = torch.view_as_real(stft_repr)
+
+		stft_repr = unpack_one(stft_repr, batch_audio_channel_packed_shape, '* f t c')
+
+		# merge stereo / mono into the frequency, with frequency leading dimension, for band splitting
+		stft_repr = rearrange(stft_repr,'b s f t c -> b (f s) t c')
+
+		x = rearrange(stft_repr, 'b f t c -> b t (f c)')
+
+		if self.check_finite and (torch.isnan(x).any() or torch.isinf(x).any()):
+			raise RuntimeError(f"NaN/Inf in x after stft: {x.isnan().sum()} NaNs, {x.isinf().sum()} Infs")
+
+		mask = self.separate_core(x)
+		num_stems = len(self.mask_estimators)
 		mask = rearrange(mask, 'b n t (f c) -> b n f t c', c=2)
 
 		# modulate frequency representation
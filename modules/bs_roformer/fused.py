@@ -0,0 +1,176 @@
+import torch
+from torch import nn
+from torch.nn import Module, ModuleList
+import torch.nn.functional as F
+
+from modules.bs_roformer import bs_roformer, mel_band_roformer
+
+# 推理时的频带融合：BandSplit / MaskEstimator 对60多个频带逐个调用 RMSNorm + Linear / MLP，
+# 每个分块要启动几百个小算子。这里把各频带的权重打包成 (频带, 输入, 输出) 的张量，
+# 输入维度相近的频带补零到同一维度后用一次 baddbmm 计算，结果与逐频带计算一致（仅浮点求和顺序不同）
+
+BAND_SPLITS = (bs_roformer.BandSplit, mel_band_roformer.BandSplit)
+MASK_ESTIMATORS = (bs_roformer.MaskEstimator, mel_band_roformer.MaskEstimator)
+
+
+def group_bands(dims, max_padding=0.25):
+	"""
+	按维度把频带分组，返回 [[频带序号, ...], ...]，组内按维度从小到大排列
+	组内最大维度不超过最小维度的 (1 + max_padding) 倍，补零浪费的计算量有上限
+	"""
+	groups = []
+	for i in sorted(range(len(dims)), key=lambda i: dims[i]):
+		if groups and dims[i] <= dims[groups[-1][0]] * (1 + max_padding):
+			groups[-1].append(i)
+		else:
+			groups.append([i])
+	return groups
+
+
+class GroupedLinear(Module):
+	"""
+	n个独立的线性层：(n, batch, d_in) -> (n, batch, d_out)，一次 baddbmm 完成矩阵乘法和偏置
+	"""
+
+	def __init__(self, weight, bias):
+		super().__init__()
+		self.weight = nn.Parameter(weight.contiguous(), requires_grad=False)  # n, d_in, d_out
+		self.bias = nn.Parameter(bias.unsqueeze(1).contiguous(), requires_grad=False)  # n, 1, d_out
+
+	def forward(self, x):
+		return torch.baddbmm(self.bias, x, self.weight)
+
+
+class FusedBandSplit(Module):
+	"""
+	BandSplit 的推理版本，输入输出与原模块相同：(b, t, sum(dim_inputs)) -> (b, t, 频带数, dim)
+	RMSNorm 的 scale * gamma 合并到线性层权重中，补零的输入维度不影响 L2 范数
+	"""
+
+	def __init__(self, band_split, max_padding=0.25):
+		super().__init__()
+		dim_inputs = band_split.dim_inputs
+		offsets = [0]
+		for dim_in in dim_inputs:
+			offsets.append(offsets[-1] + dim_in)
+		total = offsets[-1]
+
+		self.dim_inputs = dim_inputs
+		self.groups = group_bands(dim_inputs, max_padding)
+		self.linears = ModuleList([])
+
+		for g, bands in enumerate(self.groups):
+			pad_dim = dim_inputs[bands[-1]]
+			first_linear = band_split.to_features[bands[0]][1]
+			dim, dtype = first_linear.out_features, first_linear.weight.dtype
+			# 补零的位置指向输入末尾额外补的一列0
+			index = torch.full((len(bands), pad_dim), total, dtype=torch.long)
+			weight = torch.zeros(len(bands), pad_dim, dim, dtype=dtype)
+			bias = torch.zeros(len(bands), dim, dtype=dtype)
+
+			for j, i in enumerate(bands):
+				norm, linear = band_split.to_features[i]
+				dim_in = dim_inputs[i]
+				index[j, :dim_in] = torch.arange(offsets[i], offsets[i] + dim_in)
+				weight[j, :dim_in] = (linear.weight * (norm.gamma * norm.scale)).t()
+				bias[j] = linear.bias
+
+			self.register_buffer(f"index_{g}", index, persistent=False)
+			self.linears.append(GroupedLinear(weight, bias))
+
+		order = torch.tensor([i for bands in self.groups for i in bands])
+		self.register_buffer("inverse_order", torch.argsort(order), persistent=False)
+
+	def forward(self, x):
+		batch_shape = x.shape[:-1]
+		x = F.pad(x.reshape(-1, x.shape[-1]), (0, 1))
+
+		outs = []
+		for g, linear in enumerate(self.linears):
+			bands = x[:, getattr(self, f"index_{g}")].transpose(0, 1)  # n, batch, pad_dim
+			outs.append(linear(F.normalize(bands, dim=-1)))
+
+		out = torch.cat(outs, dim=0).transpose(0, 1).index_select(1, self.inverse_order)
+		return out.reshape(*batch_shape, *out.shape[1:])
+
+
+class FusedMaskEstimator(Module):
+	"""
+	MaskEstimator 的推理版本，输入输出与原模块相同：(b, t, 频带数, dim) -> (b, t, sum(dim_inputs))
+	每组频带的MLP逐层用 baddbmm 计算，最后一层的两半（GLU的值和门）分别补零，GLU之后按原顺序取出有效输出
+	"""
+
+	def __init__(self, mask_estimator, max_padding=0.25):
+		super().__init__()
+		dim_inputs = mask_estimator.dim_inputs
+		self.dim_inputs = dim_inputs
+		self.groups = group_bands(dim_inputs, max_padding)
+		self.layers = ModuleList([])
+
+		mlp_layers = list(mask_estimator.to_freqs[0][0])
+		self.activation = mlp_layers[1] if len(mlp_layers) > 1 else nn.Identity()
+
+		output_index = [None] * len(dim_inputs)
+		group_offset = 0
+		for g, bands in enumerate(self.groups):
+			pad_dim = dim_inputs[bands[-1]]
+			linears = [[m for m in mask_estimator.to_freqs[i][0] if isinstance(m, nn.Linear)] for i in bands]
+
+			group_layers = ModuleList([])
+			for k in range(len(linears[0]) - 1):
+				weight = torch.stack([band[k].weight.t() for band in linears])
+				bias = torch.stack([band[k].bias for band in linears])
+				group_layers.append(GroupedLinear(weight, bias))
+
+			last = linears[0][-1]
+			weight = torch.zeros(len(bands), last.in_features, 2 * pad_dim, dtype=last.weight.dtype)
+			bias = torch.zeros(len(bands), 2 * pad_dim, dtype=last.weight.dtype)
+			for j, i in enumerate(bands):
+				dim_in = dim_inputs[i]
+				band = linears[j][-1]
+				# 原输出为 [值 (dim_in), 门 (dim_in)]，补零后为 [值 (pad_dim), 门 (pad_dim)]
+				weight[j, :, :dim_in] = band.weight[:dim_in].t()
+				weight[j, :, pad_dim:pad_dim + dim_in] = band.weight[dim_in:].t()
+				bias[j, :dim_in] = band.bias[:dim_in]
+				bias[j, pad_dim:pad_dim + dim_in] = band.bias[dim_in:]
+				output_index[i] = torch.arange(dim_in) + group_offset + j * pad_dim
+			group_layers.append(GroupedLinear(weight, bias))
+
+			self.register_buffer(f"bands_{g}", torch.tensor(bands), persistent=False)
+			self.layers.append(group_layers)
+			group_offset += len(bands) * pad_dim
+
+		self.register_buffer("output_index", torch.cat(output_index), persistent=False)
+
+	def forward(self, x):
+		batch_shape = x.shape[:-2]
+		x = x.reshape(-1, *x.shape[-2:]).transpose(0, 1)  # 频带数, batch, dim
+
+		outs = []
+		for g, group_layers in enumerate(self.layers):
+			h = x.index_select(0, getattr(self, f"bands_{g}"))
+			for layer in group_layers[:-1]:
+				h = self.activation(layer(h))
+			h = F.glu(group_layers[-1](h), dim=-1)  # n, batch, pad_dim
+			outs.append(h.transpose(0, 1).reshape(h.shape[1], -1))
+
+		out = torch.cat(outs, dim=-1).index_select(-1, self.output_index)
+		return out.reshape(*batch_shape, -1)
+
+
+@torch.no_grad()
+def fuse_bands(model, max_padding=0.25):
+	"""
+	把模型中所有 BandSplit / MaskEstimator 替换为融合版本，返回替换的模块数量
+	替换后原来逐频带的参数被释放，只用于推理，不能再加载原始的 state_dict 或继续训练
+	"""
+	count = 0
+	for module in list(model.modules()):
+		for name, child in list(module.named_children()):
+			if isinstance(child, BAND_SPLITS):
+				setattr(module, name, FusedBandSplit(child, max_padding))
+				count += 1
+			elif isinstance(child, MASK_ESTIMATORS):
+				setattr(module, name, FusedMaskEstimator(child, max_padding))
+				count += 1
+	return count
@@ -368,58 +368,11 @@ class MelBandRoformer(Module):
 
 		self.match_input_audio_length = match_input_audio_length
 
-	def forward(self, raw_audio, target=None, return_loss_breakdown=False):
+	def separate_core(self, x):
 		"""
-		einops
-
-		b - batch
-		f - freq
-		t - time
-		s - audio channel (1 for mono, 2 for stereo)
-		n - number of 'stems'
-		c - complex (2)
-		d - feature dimension
+		the network between the stft and the mask application: (b, t, (f c)) -> masks (b, n, t, (f c))
+		kept separate so it can be exported without the complex stft ops (inference/onnx_backend.py)
 		"""
-
-		device = raw_audio.device
-
-		if raw_audio.ndim == 2:
-			raw_audio = rearrange(raw_audio, "b t -> b 1 t")
-
-		batch, channels, raw_audio_length = raw_audio.shape
-
-		istft_length = raw_audio_length if self.match_input_audio_length else None
-
-		assert (not self.stereo and channels == 1) or (
-			self.stereo and channels == 2
-		), "stereo needs to be set to True if passing in audio signal that is stereo (channel dimension of 2). also need to be False if mono (channel dimension of 1)"
-
-		# to stft
-
-		raw_audio, batch_audio_channel_packed_shape = pack_one(raw_audio, "* t")
-
-		stft_window = self.stft_window_fn(device=device)
-
-		stft_repr = torch.stft(raw_audio, **self.stft_kwargs, window=stft_window, return_complex=True)
-		stft_repr = torch.view_as_real(stft_repr)
-
-		stft_repr = unpack_one(stft_repr, batch_audio_channel_packed_shape, "* f t c")
-
-		# merge stereo / mono into the frequency, with frequency leading dimension, for band splitting
-		stft_repr = rearrange(stft_repr, "b s f t c -> b (f s) t c")
-
-		# index out all frequencies for all frequency ranges across bands ascending in one go
-
-		batch_arange = torch.arange(batch, device=device)[..., None]
-
-		# account for stereo
-
-		x = stft_repr[batch_arange, self.freq_indices]
-
-		# fold the complex (real and imag) into the frequencies dimension
-
-		x = rearrange(x, "b f t c -> b t (f c)")
-
 		if self.use_torch_checkpoint:
 			x = checkpoint(self.band_split, x, use_reentrant=False)
 		else:
@@ -468,11 +421,67 @@ class MelBandRoformer(Module):
 			if self.skip_connection:
 				store[i] = x
 
-		num_stems = len(self.mask_estimators)
 		if self.use_torch_checkpoint:
 			masks = torch.stack([checkpoint(fn, x, use_reentrant=False) for fn in self.mask_estimators], dim=1)
 		else:
 			masks = torch.stack([fn(x) for fn in self.mask_estimators], dim=1)
+
+		return masks
+
+	def forward(self, raw_audio, target=None, return_loss_breakdown=False):
+		"""
+		einops
+
+		b - batch
+		f - freq
+		t - time
+		s - audio channel (1 for mono, 2 for stereo)
+		n - number of 'stems'
+		c - complex (2)
+		d - feature dimension
+		"""
+
+		device = raw_audio.device
+
+		if raw_audio.ndim == 2:
+			raw_audio = rearrange(raw_audio, "b t -> b 1 t")
+
+		batch, channels, raw_audio_length = raw_audio.shape
+
+		istft_length = raw_audio_length if self.match_input_audio_length else None
+
+		assert (not self.stereo and channels == 1) or (
+			self.stereo and channels == 2
+		), "stereo needs to be set to True if passing in audio signal that is stereo (channel dimension of 2). also need to be False if mono (channel dimension of 1)"
+
+		# to stft
+
+		raw_audio, batch_audio_channel_packed_shape = pack_one(raw_audio, "* t")
+
+		stft_window = self.stft_window_fn(device=device)
+
+		stft_repr = torch.stft(raw_audio, **self.stft_kwargs, window=stft_window, return_complex=True)
+		stft_repr = torch.view_as_real(stft_repr)
+
+		stft_repr = unpack_one(stft_repr, batch_audio_channel_packed_shape, "* f t c")
+
+		# merge stereo / mono into the frequency, with frequency leading dimension, for band splitting
+		stft_repr = rearrange(stft_repr, "b s f t c -> b (f s) t c")
+
+		# index out all frequencies for all frequency ranges across bands ascending in one go
+
+		batch_arange = torch.arange(batch, device=device)[..., None]
+
+		# account for stereo
+
+		x = stft_repr[batch_arange, self.freq_indices]
+
+		# fold the complex (real and imag) into the frequencies dimension
+
+		x = rearrange(x, "b f t c -> b t (f c)")
+
+		masks = self.separate_core(x)
+		num_stems = len(self.mask_estimators)
 		masks = rearrange(masks, "b n t (f c) -> b n f t c", c=2)
 
 		# modulate frequency representation
@@ -202,10 +202,11 @@ class TFC_TDF_net(nn.Module):
         x = x.reshape(b, c // k, f * k, t)
         return x
 
-    def forward(self, x):
-
-        x = self.stft(x)
-
+    def separate_core(self, x):
+        """
+        the network between the stft and the istft, kept separate so it can be exported
+        without the complex stft ops (inference/onnx_backend.py)
+        """
         mix = x = self.cac2cws(x)
 
         first_conv_out = x = self.first_conv(x)
@@ -237,6 +238,14 @@ class TFC_TDF_net(nn.Module):
             b, c, f, t = x.shape
             x = x.reshape(b, self.num_target_instruments, -1, f, t)
 
+        return x
+
+    def forward(self, x):
+
+        x = self.stft(x)
+
+        x = self.separate_core(x)
+
         x = self.stft.inverse(x)
 
         return x
@@ -322,6 +322,31 @@ class SCNet(nn.Module):
             num_layers=num_dplayer,
         )
 
+    def separate_core(self, x):
+        """
+        the network between the stft and the istft: (B, C, Fr, T) -> decoder output (B, C', Fr, T), kept separate so it can be
+        exported without the complex stft ops (inference/onnx_backend.py)
+        """
+        save_skip = deque()
+        save_lengths = deque()
+        save_original_lengths = deque()
+        # encoder
+        for sd_layer in self.encoder:
+            x, skip, lengths, original_lengths = sd_layer(x)
+            save_skip.append(skip)
+            save_lengths.append(lengths)
+            save_original_lengths.append(original_lengths)
+
+        # separation
+        x = self.separation_net(x)
+
+        # decoder
+        for fusion_layer, su_layer in self.decoder:
+            x = fusion_layer(x, save_skip.pop())
+            x = su_layer(x, save_lengths.pop(), save_original_lengths.pop())
+
+        return x
+
     def forward(self, x):
         # B, C, L = x.shape
         B = x.shape[0]
@@ -342,23 +367,7 @@ class SCNet(nn.Module):
 
         B, C, Fr, T = x.shape
 
-        save_skip = deque()
-        save_lengths = deque()
-        save_original_lengths = deque()
-        # encoder
-        for sd_layer in self.encoder:
-            x, skip, lengths, original_lengths = sd_layer(x)
-            save_skip.append(skip)
-            save_lengths.append(lengths)
-            save_original_lengths.append(original_lengths)
-
-        # separation
-        x = self.separation_net(x)
-
-        # decoder
-        for fusion_layer, su_layer in self.decoder:
-            x = fusion_layer(x, save_skip.pop())
-            x = su_layer(x, save_lengths.pop(), save_original_lengths.pop())
+        x = self.separate_core(x)
 
         # output
         n = self.dims[0]
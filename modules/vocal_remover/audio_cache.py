@@ -0,0 +1,77 @@
+"""Decode/resample cache shared by the bands of a VR model, so each input file is decoded only once."""
+
+import os
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+
+
+class AudioCache:
+    """
+    Caches decoded and resampled waveforms keyed by (path, mtime, sr, res_type).
+
+    A VR model needs the input at the sample rate of every band. The top band is decoded from the file
+    and the lower bands are resampled from the band above, all entries of a file share the same
+    (path, mtime) so a modified file is never served from the cache. Only the entries of the last
+    `max_files` files are kept, since a few full-length waveforms already take hundreds of MB.
+    """
+
+    def __init__(self, max_files=1):
+        self.max_files = max_files
+        self._entries = OrderedDict()  # (path, mtime) -> {(sr, res_type): waveform}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(path):
+        path = os.path.abspath(path)
+        return path, os.path.getmtime(path)
+
+    def _get(self, file_key, sr, res_type):
+        with self._lock:
+            entries = self._entries.get(file_key)
+            if entries is None:
+                return None
+            self._entries.move_to_end(file_key)
+            return entries.get((sr, res_type))
+
+    def _put(self, file_key, sr, res_type, wave):
+        with self._lock:
+            self._entries.setdefault(file_key, {})[(sr, res_type)] = wave
+            self._entries.move_to_end(file_key)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def load(self, path, sr, res_type="soxr_hq"):
+        """
+        Decode `path` at `sr`, returns a float32 waveform in (channels, samples) format (1-D for mono files, like librosa.load).
+        """
+        file_key = self._file_key(path)
+        wave = self._get(file_key, sr, res_type)
+        if wave is None:
+            wave, _ = librosa.load(path, sr=sr, mono=False, dtype=np.float32, res_type=res_type)
+            self._put(file_key, sr, res_type, wave)
+        return wave
+
+    def resample(self, path, wave, orig_sr, sr, res_type="soxr_hq"):
+        """
+        Resample `wave` (decoded from `path` at `orig_sr`) to `sr`. `path` may be None for in-memory input, which is never cached.
+        """
+        if path is None:
+            return librosa.resample(wave, orig_sr=orig_sr, target_sr=sr, res_type=res_type)
+
+        file_key = self._file_key(path)
+        key_res_type = (orig_sr, res_type)  # a resampled entry also depends on the rate it was derived from
+        resampled = self._get(file_key, sr, key_res_type)
+        if resampled is None:
+            resampled = librosa.resample(wave, orig_sr=orig_sr, target_sr=sr, res_type=res_type)
+            self._put(file_key, sr, key_res_type, resampled)
+        return resampled
+
+    def put(self, path, sr, res_type, wave):
+        self._put(self._file_key(path), sr, res_type, wave)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -7,14 +7,14 @@ import time
 import logging
 import json
 import torch
-import librosa
 import numpy as np
 import soundfile as sf
 from pydub import AudioSegment
 from tqdm import tqdm
 from modules.vocal_remover.vr_separator import VRSeparator
 from utils.logger import get_logger, set_log_level
-from utils.constant import TEMP_PATH, VR_MODEL, UNOFFICIAL_MODEL
+from utils.constant import VR_MODEL, UNOFFICIAL_MODEL
+from inference.result_cache import get_result_cache
 
 class Separator:
     def __init__(
@@ -26,6 +26,7 @@ class Separator:
         output_format="wav",
         invert_using_spec=False,
         use_cpu=False,
+        device=None,
         vr_params={"batch_size": 2, "window_size": 512, "aggression": 5, "enable_tta": False, "enable_post_process": False, "post_process_threshold": 0.2, "high_end_process": False},
         audio_params={"wav_bit_depth": "FLOAT", "flac_bit_depth": "PCM_24", "mp3_bit_rate": "320k"}
     ):
@@ -49,6 +50,8 @@ class Separator:
         self.vr_params_params = vr_params
         self.sample_rate = 44100 # do not change this value!
         self.use_cpu = use_cpu
+        # explicit torch device such as "cuda:1", chosen automatically when None
+        self.device = device
         self.torch_device = None
         self.torch_device_cpu = None
         self.torch_device_mps = None
@@ -57,6 +60,8 @@ class Separator:
 
         self.setup_accelerated_inferencing_device()
         self.load_model(self.model_file)
+        # Reuse the stems of inputs already separated with the same model and params, enabled by MSST_RESULT_CACHE_SIZE
+        self.result_cache = get_result_cache()
 
         if type(self.output_dir) == str:
             self.output_dir = {
@@ -81,6 +86,12 @@ class Separator:
             self.logger.info("CPU inference requested, ignoring GPU availability")
             self.torch_device_cpu = torch.device("cpu")
             self.torch_device = self.torch_device_cpu
+        elif self.device:
+            self.logger.info(f"Setting Torch device to {self.device}")
+            self.torch_device_cpu = torch.device("cpu")
+            self.torch_device = torch.device(self.device)
+            if self.torch_device.type == "mps":
+                self.torch_device_mps = self.torch_device
         else:
             self.setup_torch_device()
 
@@ -220,7 +231,9 @@ class Separator:
                     self.logger.debug(f"处理文件: {os.path.basename(file_path)} (缺少输出: {', '.join(missing_outputs)})")
 
             try:
-                mix, sr = librosa.load(file_path, sr=44100, mono=False)
+                # Decoded once through the model's audio cache, separate() reuses it for every band
+                mix = self.model_instance.load_audio(file_path)
+                sr = self.sample_rate
             except Exception as e:
                 self.logger.warning(f'Cannot process track: {file_path}, error: {str(e)}')
                 continue
@@ -244,6 +257,8 @@ class Separator:
             success_files.append(os.path.basename(file_path))
             del mix, results
             gc.collect()
+
+        self.model_instance.audio_cache.clear()
         
         # 输出处理统计信息
         if skip_existing_files and skipped_files:
@@ -253,23 +268,22 @@ class Separator:
         return success_files
 
     def separate(self, mix):
-        is_numpy = isinstance(mix, np.ndarray)
-        if is_numpy:
-            tempdir = os.path.join(TEMP_PATH, "tmp_audio")
-            os.makedirs(tempdir, exist_ok=True)
-            try:
-                sf.write(os.path.join(tempdir, "tmp_audio.wav"), mix.T, 44100, subtype="FLOAT")
-            except:
-                sf.write(os.path.join(tempdir, "tmp_audio.wav"), mix, 44100, subtype="FLOAT")
-
-            mix = os.path.join(tempdir, "tmp_audio.wav")
-            self.logger.debug(f"Temporary audio file created: {mix}")
+        # mix is either a file path or a waveform sampled at 44100Hz, waveforms are passed to the model in memory
+        cache_key = None
+        if self.result_cache is not None:
+            # a path is decoded once, separate() reuses the decoded waveform from the audio cache
+            wave = mix if isinstance(mix, np.ndarray) else self.model_instance.load_audio(mix)
+            cache_key = self.result_cache.make_key(wave, self.model_instance.cache_fingerprint())
+            results = self.result_cache.get(cache_key)
+            if results is not None:
+                self.logger.debug("Separation results loaded from the result cache.")
+                return results
 
         results = self.model_instance.separate(mix)
         self.model_instance.clear_file_specific_paths()
 
-        if is_numpy and os.path.exists(mix):
-            os.remove(mix)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, results)
 
         self.logger.debug("Separation process completed.")
 
@@ -302,9 +316,9 @@ class Separator:
     def del_cache(self):
         self.logger.debug("Running garbage collection...")
         gc.collect()
-        if self.torch_device == torch.device("mps"):
+        if self.torch_device.type == "mps":
             self.logger.debug("Clearing MPS cache...")
             torch.mps.empty_cache()
-        if self.torch_device == torch.device("cuda"):
+        if self.torch_device.type == "cuda":
             self.logger.debug("Clearing CUDA cache...")
             torch.cuda.empty_cache()
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+torch implementation of the multi-band spectrogram front-end and back-end of spec_utils
+(wave_to_spectrogram + combine_spectrograms, cmb_spectrogram_to_wave).
+
+Both channels of a band go through a single torch.stft/istft call on the inference device and the
+band cropping, channel conversion and filters are applied as tensor ops. The resampling between bands
+is left to librosa so the results match the librosa path within float32 tolerance.
+"""
+
+import math
+
+import librosa
+import numpy as np
+import torch
+
+from modules.vocal_remover.uvr_lib_v5 import spec_utils
+
+# librosa.stft pads with zeros since 0.10, it used reflect padding before
+LIBROSA_PAD_MODE = "constant" if tuple(int(v) for v in librosa.__version__.split(".")[:2]) >= (0, 10) else "reflect"
+
+
+def lp_filter_gain(n_bins, bin_start, bin_stop):
+    """Gains applied per bin by spec_utils.fft_lp_filter."""
+    gain = np.ones(n_bins, dtype=np.float32)
+    width = bin_stop - bin_start
+    g = 1.0
+    for b in range(bin_start, bin_stop):
+        g -= 1 / width
+        gain[b] = g
+    gain[bin_stop:] = 0
+    return gain
+
+
+def hp_filter_gain(n_bins, bin_start, bin_stop):
+    """Gains applied per bin by spec_utils.fft_hp_filter (bin_start > bin_stop)."""
+    gain = np.ones(n_bins, dtype=np.float32)
+    width = bin_start - bin_stop
+    g = 1.0
+    for b in range(bin_start, bin_stop, -1):
+        g -= 1 / width
+        gain[b] = g
+    gain[0 : bin_stop + 1] = 0
+    return gain
+
+
+def pre_filter_gain(n_bins, bin_start, bin_stop):
+    """Gains of the multi-band lowpass applied by spec_utils.combine_spectrograms."""
+    gain = np.ones(n_bins, dtype=np.float32)
+    gp = 1
+    for b in range(bin_start + 1, bin_stop):
+        g = math.pow(10, -(b - bin_start) * (3.5 - gp) / 20.0)
+        gp = g
+        gain[b] = g
+    return gain
+
+
+class TorchSpectrogram:
+    def __init__(self, mp, device, is_v51_model=False):
+        self.mp = mp
+        self.is_v51_model = is_v51_model
+        # complex FFTs are not reliable on every MPS build
+        self.device = torch.device("cpu") if device is None or torch.device(device).type == "mps" else torch.device(device)
+        self.bands_n = len(mp.param["band"])
+        self._windows = {}
+        self._gains = {}
+
+    def _window(self, n_fft):
+        if n_fft not in self._windows:
+            self._windows[n_fft] = torch.hann_window(n_fft, periodic=True, dtype=torch.float32, device=self.device)
+        return self._windows[n_fft]
+
+    def _gain(self, name, builder, *args):
+        key = (name,) + args
+        if key not in self._gains:
+            gain = np.asarray(builder(*args), dtype=np.float32).reshape(-1)
+            self._gains[key] = torch.from_numpy(gain).to(self.device)[:, None]
+        return self._gains[key]
+
+    def _band_channels(self, wave):
+        if self.is_v51_model:
+            return wave
+        if self.mp.param["reverse"]:
+            return torch.flip(wave, dims=[-1])
+        if self.mp.param["mid_side"]:
+            return torch.stack([(wave[0] + wave[1]) / 2, wave[0] - wave[1]])
+        if self.mp.param["mid_side_b2"]:
+            return torch.stack([wave[1] + wave[0] * 0.5, wave[0] - wave[1] * 0.5])
+        return wave
+
+    def _convert_channels(self, spec, band):
+        cc = self.mp.param["band"][band].get("convert_channels")
+        if "mid_side_c" == cc:
+            return torch.stack([spec[0] + spec[1] * 0.25, spec[1] - spec[0] * 0.25])
+        if "mid_side" == cc:
+            return torch.stack([(spec[0] + spec[1]) / 2, spec[0] - spec[1]])
+        if "stereo_n" == cc:
+            return torch.stack([(spec[0] + spec[1] * 0.25) / 0.9375, (spec[1] + spec[0] * 0.25) / 0.9375])
+        return spec
+
+    def _restore_channels(self, wave, band):
+        if self.is_v51_model:
+            cc = self.mp.param["band"][band].get("convert_channels")
+            if "mid_side_c" == cc:
+                return torch.stack([wave[0] / 1.0625 - wave[1] / 4.25, wave[1] / 1.0625 + wave[0] / 4.25])
+            if "mid_side" == cc:
+                return torch.stack([wave[0] + wave[1] / 2, wave[0] - wave[1] / 2])
+            if "stereo_n" == cc:
+                return torch.stack([wave[0] - wave[1] * 0.25, wave[1] - wave[0] * 0.25])
+        else:
+            if self.mp.param["reverse"]:
+                return torch.flip(wave, dims=[-1])
+            if self.mp.param["mid_side"]:
+                return torch.stack([wave[0] + wave[1] / 2, wave[0] - wave[1] / 2])
+            if self.mp.param["mid_side_b2"]:
+                return torch.stack([wave[1] / 1.25 + 0.4 * wave[0], wave[0] / 1.25 - 0.4 * wave[1]])
+        return wave
+
+    def wave_to_spectrogram(self, wave, band):
+        """Same as spec_utils.wave_to_spectrogram, returns a complex tensor (2, n_fft // 2 + 1, frames) on the device."""
+        bp = self.mp.param["band"][band]
+        wave = torch.as_tensor(np.ascontiguousarray(wave), dtype=torch.float32).to(self.device)
+        if wave.dim() == 1:
+            wave = torch.stack([wave, wave])
+        wave = self._band_channels(wave)
+
+        spec = torch.stft(wave, n_fft=bp["n_fft"], hop_length=bp["hl"], window=self._window(bp["n_fft"]), center=True, pad_mode=LIBROSA_PAD_MODE, return_complex=True)
+
+        if self.is_v51_model:
+            spec = self._convert_channels(spec, band)
+        return spec
+
+    def combine_spectrograms(self, specs):
+        """Same as spec_utils.combine_spectrograms for tensors returned by wave_to_spectrogram, returns a numpy array."""
+        mp = self.mp
+        l = min([specs[i].shape[2] for i in specs])
+        parts = [specs[d][:, mp.param["band"][d]["crop_start"] : mp.param["band"][d]["crop_stop"], :l] for d in range(1, self.bands_n + 1)]
+        offset = sum(part.shape[1] for part in parts)
+        if offset > mp.param["bins"]:
+            raise ValueError("Too much bins")
+
+        spec_c = torch.zeros((2, mp.param["bins"] + 1, l), dtype=torch.complex64, device=self.device)
+        spec_c[:, :offset, :] = torch.cat(parts, dim=1)
+
+        # lowpass fiter
+        if mp.param["pre_filter_start"] > 0:
+            if self.is_v51_model:
+                spec_c *= self._gain("lp_mask", spec_utils.get_lp_filter_mask, spec_c.shape[1], mp.param["pre_filter_start"], mp.param["pre_filter_stop"])
+            elif self.bands_n == 1:
+                spec_c *= self._gain("lp", lp_filter_gain, spec_c.shape[1], mp.param["pre_filter_start"], mp.param["pre_filter_stop"])
+            else:
+                spec_c *= self._gain("pre", pre_filter_gain, spec_c.shape[1], mp.param["pre_filter_start"], mp.param["pre_filter_stop"])
+
+        return np.asfortranarray(spec_c.cpu().numpy())
+
+    def spectrogram_to_wave(self, spec_m, extra_bins_h=None, extra_bins=None):
+        """Same as spec_utils.cmb_spectrogram_to_wave, returns a numpy array (2, samples)."""
+        mp = self.mp
+        spec_m = torch.from_numpy(np.nan_to_num(np.asarray(spec_m), nan=0.0)).to(self.device, dtype=torch.complex64)
+        if extra_bins is not None:
+            extra_bins = torch.from_numpy(np.nan_to_num(np.asarray(extra_bins), nan=0.0)).to(self.device, dtype=torch.complex64)
+
+        # The inverse STFTs do not depend on each other, only the resampling chain below is sequential
+        band_waves = {}
+        offset = 0
+        for d in range(1, self.bands_n + 1):
+            bp = mp.param["band"][d]
+            n_bins = bp["n_fft"] // 2 + 1
+            h = bp["crop_stop"] - bp["crop_start"]
+            spec_s = torch.zeros((2, n_bins, spec_m.shape[2]), dtype=torch.complex64, device=self.device)
+            spec_s[:, bp["crop_start"] : bp["crop_stop"], :] = spec_m[:, offset : offset + h, :]
+            offset += h
+
+            if d == self.bands_n:  # higher
+                if extra_bins_h:  # if --high_end_process bypass
+                    max_bin = bp["n_fft"] // 2
+                    spec_s[:, max_bin - extra_bins_h : max_bin, :] = extra_bins[:, :extra_bins_h, :]
+                if bp["hpf_start"] > 0:
+                    if self.is_v51_model:
+                        spec_s *= self._gain("hp_mask", spec_utils.get_hp_filter_mask, n_bins, bp["hpf_start"], bp["hpf_stop"] - 1)
+                    else:
+                        spec_s *= self._gain("hp", hp_filter_gain, n_bins, bp["hpf_start"], bp["hpf_stop"] - 1)
+            else:
+                if d > 1:  # mid
+                    if self.is_v51_model:
+                        spec_s *= self._gain("hp_mask", spec_utils.get_hp_filter_mask, n_bins, bp["hpf_start"], bp["hpf_stop"] - 1)
+                    else:
+                        spec_s *= self._gain("hp", hp_filter_gain, n_bins, bp["hpf_start"], bp["hpf_stop"] - 1)
+                if self.is_v51_model:
+                    spec_s *= self._gain("lp_mask", spec_utils.get_lp_filter_mask, n_bins, bp["lpf_start"], bp["lpf_stop"])
+                else:
+                    spec_s *= self._gain("lp", lp_filter_gain, n_bins, bp["lpf_start"], bp["lpf_stop"])
+
+            wave = torch.istft(spec_s, n_fft=bp["n_fft"], hop_length=bp["hl"], window=self._window(bp["n_fft"]), center=True)
+            band_waves[d] = self._restore_channels(wave, d).cpu().numpy()
+
+        if self.bands_n == 1:
+            return np.asfortranarray(band_waves[1])
+
+        wave = None
+        for d in range(1, self.bands_n + 1):
+            bp = mp.param["band"][d]
+            if d == self.bands_n:
+                wave = np.add(wave, band_waves[d])
+            else:
+                sr = mp.param["band"][d + 1]["sr"]
+                wave = band_waves[d] if d == 1 else np.add(wave, band_waves[d])
+                wave = librosa.resample(wave, orig_sr=bp["sr"], target_sr=sr, res_type=spec_utils.wav_resolution)
+
+        return np.asfortranarray(wave)
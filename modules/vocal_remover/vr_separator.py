@@ -12,10 +12,13 @@ from tqdm import tqdm
 import audioread
 
 from modules.vocal_remover.common_separator import CommonSeparator
+from modules.vocal_remover.audio_cache import AudioCache
 from modules.vocal_remover.uvr_lib_v5 import spec_utils
+from modules.vocal_remover.uvr_lib_v5.spec_utils_torch import TorchSpectrogram
 from modules.vocal_remover.uvr_lib_v5.vr_network import nets
 from modules.vocal_remover.uvr_lib_v5.vr_network import nets_new
 from modules.vocal_remover.uvr_lib_v5.vr_network.model_param_init import ModelParameters
+from inference.result_cache import hash_file
 from utils.constant import UNOFFICIAL_MODEL, VR_MODELPARAMS
 
 vr_params_json_dir = VR_MODELPARAMS
@@ -104,9 +107,16 @@ class VRSeparator(CommonSeparator):
 
         self.model_samplerate = self.model_params.param["sr"]
 
+        # Decoded and resampled inputs of the current file, shared by all bands
+        self.audio_cache = AudioCache()
+
+        # Compute the band STFTs/iSTFTs with torch on the inference device instead of librosa on the CPU
+        self.torch_spectrogram = arch_config.get("torch_spectrogram", True)
+        self.spectrogram = TorchSpectrogram(self.model_params, self.torch_device, is_v51_model=self.is_vr_51_model) if self.torch_spectrogram else None
+
         self.logger.debug(f"VR arch params: enable_tta={self.enable_tta}, enable_post_process={self.enable_post_process}, post_process_threshold={self.post_process_threshold}")
         self.logger.debug(f"VR arch params: batch_size={self.batch_size}, window_size={self.window_size}")
-        self.logger.debug(f"VR arch params: high_end_process={self.high_end_process}, aggression={self.aggression}")
+        self.logger.debug(f"VR arch params: high_end_process={self.high_end_process}, aggression={self.aggression}, torch_spectrogram={self.torch_spectrogram}")
         self.logger.debug(f"VR arch params: is_vr_51_model={self.is_vr_51_model}, model_samplerate={self.model_samplerate}, model_capacity={self.model_capacity}")
 
         self.model_run = lambda *args, **kwargs: self.logger.error("Model run method is not initialised yet.")
@@ -135,13 +145,31 @@ class VRSeparator(CommonSeparator):
         self.model_run.to(self.torch_device)
         self.logger.debug("Model loaded and moved to device.")
 
+    def cache_fingerprint(self):
+        """Everything besides the input that changes the separation results."""
+        return {
+            "arch": "vr",
+            "checkpoint": hash_file(self.model_path),
+            "model_data": self.model_data,
+            "model_params": self.model_params.param,
+            "is_vr_51_model": self.is_vr_51_model,
+            "window_size": self.window_size,
+            "aggression": self.aggression,
+            "enable_tta": self.enable_tta,
+            "enable_post_process": self.enable_post_process,
+            "post_process_threshold": self.post_process_threshold,
+            "high_end_process": self.high_end_process,
+            "invert_using_spec": self.invert_using_spec,
+            "torch_spectrogram": self.torch_spectrogram,
+        }
+
     def separate(self, audio_file):
         """
         Separates the audio file into primary and secondary sources based on the model's configuration.
         It processes the mix, demixes it into sources, normalizes the sources, and saves the output files.
 
         Args:
-            audio_file (str): The path to the audio file to be processed.
+            audio_file (str or np.ndarray): The path to the audio file to be processed, or a waveform sampled at 44100Hz.
 
         Returns:
             list: A list of paths to the output files generated by the separation process.
@@ -193,6 +221,7 @@ class VRSeparator(CommonSeparator):
 
         audio_file = self.audio_file_path
         is_mp3 = audio_file.endswith(".mp3") if isinstance(audio_file, str) else False
+        cache_path = audio_file if isinstance(audio_file, str) else None
 
         self.logger.debug(f"loading_mix iteraring through {bands_n} bands")
 
@@ -210,28 +239,62 @@ class VRSeparator(CommonSeparator):
                 wav_resolution = "polyphase"
 
             if d == bands_n:  # high-end band
-                X_wave[d], _ = librosa.load(audio_file, sr=bp["sr"], mono=False, dtype=np.float32, res_type=wav_resolution)
-                X_spec_s[d] = spec_utils.wave_to_spectrogram(X_wave[d], bp["hl"], bp["n_fft"], self.model_params, band=d, is_v51_model=self.is_vr_51_model)
+                X_wave[d] = self.load_audio(audio_file, wav_resolution)
+                X_spec_s[d] = self.wave_to_spectrogram(X_wave[d], d)
 
                 if not np.any(X_wave[d]) and is_mp3:
                     X_wave[d] = rerun_mp3(audio_file, bp["sr"])
+                    self.audio_cache.put(audio_file, bp["sr"], wav_resolution, X_wave[d])
 
                 if X_wave[d].ndim == 1:
                     X_wave[d] = np.asarray([X_wave[d], X_wave[d]])
             else:  # lower bands
-                X_wave[d] = librosa.resample(X_wave[d + 1], orig_sr=self.model_params.param["band"][d + 1]["sr"], target_sr=bp["sr"], res_type=wav_resolution)
-                X_spec_s[d] = spec_utils.wave_to_spectrogram(X_wave[d], bp["hl"], bp["n_fft"], self.model_params, band=d, is_v51_model=self.is_vr_51_model)
+                X_wave[d] = self.audio_cache.resample(cache_path, X_wave[d + 1], self.model_params.param["band"][d + 1]["sr"], bp["sr"], wav_resolution)
+                X_spec_s[d] = self.wave_to_spectrogram(X_wave[d], d)
 
             if d == bands_n and self.high_end_process:
                 self.input_high_end_h = (bp["n_fft"] // 2 - bp["crop_stop"]) + (self.model_params.param["pre_filter_stop"] - self.model_params.param["pre_filter_start"])
                 self.input_high_end = X_spec_s[d][:, bp["n_fft"] // 2 - self.input_high_end_h : bp["n_fft"] // 2, :]
+                if self.spectrogram is not None:
+                    self.input_high_end = self.input_high_end.cpu().numpy()
 
-        X_spec = spec_utils.combine_spectrograms(X_spec_s, self.model_params, is_v51_model=self.is_vr_51_model)
+        if self.spectrogram is not None:
+            X_spec = self.spectrogram.combine_spectrograms(X_spec_s)
+        else:
+            X_spec = spec_utils.combine_spectrograms(X_spec_s, self.model_params, is_v51_model=self.is_vr_51_model)
 
         del X_wave, X_spec_s, audio_file
 
         return X_spec
 
+    def wave_to_spectrogram(self, wave, band):
+        if self.spectrogram is not None:
+            return self.spectrogram.wave_to_spectrogram(wave, band)
+        bp = self.model_params.param["band"][band]
+        return spec_utils.wave_to_spectrogram(wave, bp["hl"], bp["n_fft"], self.model_params, band=band, is_v51_model=self.is_vr_51_model)
+
+    def load_audio(self, audio_file, res_type=None):
+        """
+        Returns the input at the sample rate of the high-end band.
+        Files are decoded through the audio cache, so a file loaded here is not decoded again by loading_mix.
+        Waveforms are expected at 44100Hz in (channels, samples) or (samples, channels) format.
+        """
+        bp = self.model_params.param["band"][len(self.model_params.param["band"])]
+        if res_type is None:
+            res_type = "polyphase" if self.torch_device_mps is not None else bp["res_type"]
+
+        if isinstance(audio_file, str):
+            return self.audio_cache.load(audio_file, bp["sr"], res_type)
+
+        wave = np.asarray(audio_file, dtype=np.float32)
+        if wave.ndim == 2 and wave.shape[0] > wave.shape[1]:
+            wave = wave.T
+        if wave.ndim == 1:
+            wave = np.asarray([wave, wave])
+        if bp["sr"] != 44100:
+            wave = librosa.resample(wave, orig_sr=44100, target_sr=bp["sr"], res_type=res_type)
+        return np.ascontiguousarray(wave)
+
     def inference_vr(self, X_spec, device, aggressiveness):
         def _execute(X_mag_pad, roi_size):
             X_dataset = []
@@ -319,7 +382,12 @@ class VRSeparator(CommonSeparator):
     def spec_to_wav(self, spec):
         if self.high_end_process and isinstance(self.input_high_end, np.ndarray) and self.input_high_end_h:
             input_high_end_ = spec_utils.mirroring("mirroring", spec, self.input_high_end, self.model_params)
-            wav = spec_utils.cmb_spectrogram_to_wave(spec, self.model_params, self.input_high_end_h, input_high_end_, is_v51_model=self.is_vr_51_model)
+            if self.spectrogram is not None:
+                wav = self.spectrogram.spectrogram_to_wave(spec, self.input_high_end_h, input_high_end_)
+            else:
+                wav = spec_utils.cmb_spectrogram_to_wave(spec, self.model_params, self.input_high_end_h, input_high_end_, is_v51_model=self.is_vr_51_model)
+        elif self.spectrogram is not None:
+            wav = self.spectrogram.spectrogram_to_wave(spec)
         else:
             wav = spec_utils.cmb_spectrogram_to_wave(spec, self.model_params, is_v51_model=self.is_vr_51_model)
 
@@ -5,15 +5,21 @@ import uuid
 import shutil
 import threading
 import subprocess
+import traceback
 from pathlib import Path
 from typing import Dict, Any
 import asyncio
 import mimetypes
+import queue
+from concurrent.futures import Future
 
-import gradio as gr
 from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse, RedirectResponse, JSONResponse
 
+from utils.logger import get_logger
+
+logger = get_logger()
+
 # -----------------------------
 # 路径：按你项目结构来（根目录）
 # -----------------------------
@@ -45,6 +51,10 @@ JOBS_LOCK = threading.Lock()
 # 建议先限制并发为 1（避免抢 GPU / 显存爆）
 GPU_SEM = threading.Semaphore(1)
 
+# 常驻推理线程数量，设置为 0 时回退到每个请求启动一个 preset_infer_cli.py 子进程
+# 推理仍由 GPU_SEM 限制为同一时间一个任务，多个线程只用于保持模型常驻和排队
+API_WORKERS = int(os.environ.get("MSST_API_WORKERS", "1"))
+
 
 def _set_job(job_id: str, **kwargs):
     with JOBS_LOCK:
@@ -131,6 +141,102 @@ def _run_infer(job_id: str, input_dir: Path, output_dir: Path):
             _set_job(job_id, status="failed", finished_at=time.time(), error=str(e))
 
 
+# -----------------------------
+# 常驻推理线程池：模型只加载一次，任务通过进程内队列分发
+# -----------------------------
+class InferenceWorkerPool:
+    def __init__(self, preset_path: Path, num_workers: int = 1, output_format: str = "wav"):
+        self.preset_path = preset_path
+        self.num_workers = max(1, num_workers)
+        self.output_format = output_format
+        self.jobs: "queue.Queue" = queue.Queue()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker, name=f"msst_api_worker_{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join(timeout=10)
+        self.threads = []
+
+    def submit(self, job_id: str, input_path: Path, output_dir: Path) -> Future:
+        future = Future()
+        self.jobs.put((job_id, input_path, output_dir, future))
+        return future
+
+    def _worker(self):
+        from webui.utils import load_configs
+        from inference.preset_engine import PresetEngine
+
+        engine = PresetEngine(load_configs(str(self.preset_path)), output_format=self.output_format)
+        try:
+            start = time.time()
+            engine.load()
+            logger.info(f"{threading.current_thread().name} 模型预加载完成，耗时 {time.time() - start:.2f}s")
+        except Exception as e:
+            # 预加载失败时在第一个任务中重试，错误会记录到任务状态
+            logger.warning(f"{threading.current_thread().name} 模型预加载失败: {e}")
+
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            job_id, input_path, output_dir, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            # 与子进程模式相同，每个任务有 run.log，可通过 /tasks/{job_id}/log 查看
+            log_path = WORKDIR / job_id / "run.log"
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with open(log_path, "w", encoding="utf-8") as log:
+                    log.write(f"[msst_api] {threading.current_thread().name} 等待GPU: {input_path}\n")
+                    log.flush()
+                    # 与子进程模式共用 GPU_SEM，MSST_API_WORKERS>1 时各线程的模型常驻，但同一时间只有一个任务在GPU上推理
+                    with GPU_SEM:
+                        _set_job(job_id, status="running", started_at=time.time(), log=str(log_path))
+                        start = time.time()
+                        try:
+                            timings = engine.process_file(str(input_path), str(output_dir))
+                            timings = {k: round(v, 3) for k, v in timings.items()}
+                            log.write(f"[msst_api] 完成，耗时 {time.time() - start:.2f}s, timings: {timings}\n")
+                            _set_job(job_id, status="completed", finished_at=time.time(), seconds=round(time.time() - start, 2), timings=timings)
+                            future.set_result(timings)
+                        except Exception as e:
+                            log.write(f"[msst_api] 推理失败: {e}\n{traceback.format_exc()}")
+                            _set_job(job_id, status="failed", finished_at=time.time(), error=str(e), log=str(log_path))
+                            future.set_exception(e)
+                        finally:
+                            engine.del_cache()
+            except Exception as e:
+                # 日志文件无法写入
+                if not future.done():
+                    _set_job(job_id, status="failed", finished_at=time.time(), error=str(e))
+                    future.set_exception(e)
+
+
+WORKER_POOL: InferenceWorkerPool = None
+
+
+@app.on_event("startup")
+def _start_worker_pool():
+    global WORKER_POOL
+    if API_WORKERS > 0 and PRESET.exists():
+        WORKER_POOL = InferenceWorkerPool(PRESET, API_WORKERS)
+        WORKER_POOL.start()
+
+
+@app.on_event("shutdown")
+def _stop_worker_pool():
+    if WORKER_POOL is not None:
+        WORKER_POOL.stop()
+
+
 # -----------------------------
 # API：单文件推理（返回 wav）
 # -----------------------------
@@ -140,9 +246,9 @@ async def infer(
     background_tasks: BackgroundTasks = None,
 ):
     # 基础校验
-    if not PYTHON.exists():
+    if WORKER_POOL is None and not PYTHON.exists():
         raise HTTPException(500, f"python.exe not found: {PYTHON}")
-    if not SCRIPT.exists():
+    if WORKER_POOL is None and not SCRIPT.exists():
         raise HTTPException(500, f"script not found: {SCRIPT}")
     if not PRESET.exists():
         raise HTTPException(500, f"preset not found: {PRESET}")
@@ -174,8 +280,15 @@ async def infer(
 
     _set_job(job_id, status="queued", created_at=time.time())
 
-    # 运行推理：subprocess 阻塞，丢到线程里执行（避免堵塞 FastAPI）
-    await asyncio.to_thread(_run_infer, job_id, in_dir, out_dir)
+    if WORKER_POOL is not None:
+        # 交给常驻推理线程，模型已预热
+        try:
+            await asyncio.wrap_future(WORKER_POOL.submit(job_id, in_path, out_dir))
+        except Exception:
+            pass  # 失败信息已记录在任务状态中
+    else:
+        # 运行推理：subprocess 阻塞，丢到线程里执行（避免堵塞 FastAPI）
+        await asyncio.to_thread(_run_infer, job_id, in_dir, out_dir)
 
     # 读取任务结果
     try:
@@ -187,7 +300,7 @@ async def infer(
     if job.get("status") != "completed":
         # 不立刻删目录，方便你排查；也可以选择仍清理
         # 这里返回 job_id 和 log 路径，用户可调用 /tasks/{job_id}/log 拉日志
-        raise HTTPException(500, f"infer failed. job_id={job_id}. status={job.get('status')}. log={job.get('log')}")
+        raise HTTPException(500, f"infer failed. job_id={job_id}. status={job.get('status')}. error={job.get('error')}. log={job.get('log')}")
 
     # 找到输出 wav
     try:
@@ -207,11 +320,15 @@ async def infer(
     if not mime:
         mime = "audio/wav"
 
+    headers = {"X-Job-Id": job_id}
+    for stage, seconds in job.get("timings", {}).items():
+        headers[f"X-{stage.capitalize()}-Seconds"] = str(seconds)
+
     return FileResponse(
         str(out_file),
         filename=out_name,
         media_type=mime,
-        headers={"X-Job-Id": job_id},
+        headers=headers,
     )
 
 
@@ -244,7 +361,8 @@ def task_log(job_id: str):
 # -----------------------------
 # 挂载 Gradio UI 到 /ui （同端口）
 # -----------------------------
-def build_gradio_ui() -> gr.Blocks:
+def build_gradio_ui() -> "gr.Blocks":
+    import gradio as gr
     from utils.constant import WEBUI_CONFIG, THEME_FOLDER
     from webui.utils import load_configs
     from clientui.ui import create_ui
@@ -263,9 +381,13 @@ def build_gradio_ui() -> gr.Blocks:
     return interface
 
 
-demo = build_gradio_ui()
+# 设置 MSST_API_UI=0 时只提供接口，不导入 gradio，无界面的推理节点启动更快
+if os.environ.get("MSST_API_UI", "1") != "0":
+    import gradio as gr
+
+    demo = build_gradio_ui()
 
-try:
-    app = gr.mount_gradio_app(app, demo, path="/ui", auth=getattr(demo, "_msst_auth", None))
-except TypeError:
-    app = gr.mount_gradio_app(app, demo, path="/ui", gradio_kwargs={"auth": getattr(demo, "_msst_auth", None)})
+    try:
+        app = gr.mount_gradio_app(app, demo, path="/ui", auth=getattr(demo, "_msst_auth", None))
+    except TypeError:
+        app = gr.mount_gradio_app(app, demo, path="/ui", gradio_kwargs={"auth": getattr(demo, "_msst_auth", None)})
@@ -0,0 +1,81 @@
+import os
+import sys
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import argparse
+import warnings
+import logging
+from utils.logger import get_logger
+from utils.constant import MODEL_TYPE
+
+def autotune_inference_params(args):
+    import yaml
+    import librosa
+    from inference.autotune import autotune
+
+    logger = get_logger(console_level=logging.DEBUG if args.debug else logging.INFO)
+
+    if not args.debug:
+        warnings.filterwarnings("ignore", category=UserWarning)
+
+    if type(args.device_ids) == int:
+        device_ids = [args.device_ids]
+    else:
+        device_ids = args.device_ids
+
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    sample_rate = (config.get("audio") or {}).get("sample_rate", 44100)
+    mix, sr = librosa.load(args.input_audio, sr=sample_rate, mono=False, offset=args.offset, duration=args.duration)
+
+    profile = autotune(
+        args.model_type,
+        args.config_path,
+        args.model_path,
+        mix,
+        sr,
+        device=args.device,
+        device_ids=device_ids,
+        batch_sizes=args.batch_sizes,
+        num_overlaps=args.num_overlaps,
+        chunk_sizes=args.chunk_sizes,
+        reference_overlap=args.reference_overlap,
+        min_sdr=args.min_sdr,
+        max_memory=args.max_memory,
+        cpu_precision=args.cpu_precision,
+    )
+
+    logger.info(f"{'batch_size':>10} {'num_overlap':>11} {'chunk_size':>10} {'realtime':>9} {'memory MB':>10} {'SDR dB':>8}  status")
+    for r in profile["results"]:
+        throughput = f"{r['throughput']:.2f}x" if r["throughput"] is not None else "-"
+        memory = f"{r['peak_memory']:.0f}" if r["peak_memory"] is not None else "-"
+        sdr = f"{r['sdr']:.2f}" if r["sdr"] is not None else "-"
+        logger.info(f"{r['batch_size']:>10} {r['num_overlap']:>11} {str(r['chunk_size']):>10} {throughput:>9} {memory:>10} {sdr:>8}  {r['status']}")
+    logger.info(f"Tuned params for {profile['device_name']}: {profile['params'] or 'none, the model config is used'}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep batch_size, num_overlap and chunk_size of a model on this device and save the fastest params as the autotune profile used by MSSeparator", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, max_help_position=60))
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug logging (default: %(default)s). Example: --debug")
+    parser.add_argument("--device", default='auto', choices=['auto', 'cpu', 'cuda', 'mps', 'onnx-cpu'], help="Device to tune for (default: %(default)s). Example: --device=cuda")
+    parser.add_argument("--device_ids", nargs='+', type=int, default=0, help='List of gpu ids, only used when device is cuda (default: %(default)s). Example: --device_ids 0 1')
+    parser.add_argument("--cpu_precision", choices=['fp32', 'bf16', 'int8', 'auto'], default=None, help="CPU precision to tune for (default: cpu_precision of the model config). Example: --cpu_precision=int8")
+
+    model_params = parser.add_argument_group("Model Params")
+    model_params.add_argument("--model_type", type=str, help=f"One of {MODEL_TYPE}.", required=True)
+    model_params.add_argument("--model_path", type=str, help="Path to model checkpoint.", required=True)
+    model_params.add_argument("--config_path", type=str, help="Path to config file.", required=True)
+
+    tune_params = parser.add_argument_group("Autotune Params")
+    tune_params.add_argument("-i", "--input_audio", type=str, help="Test audio, a typical track for this model. Example: --input_audio=input/test.wav", required=True)
+    tune_params.add_argument("--offset", type=float, default=0.0, help="Start of the test excerpt in seconds (default: %(default)s). Example: --offset=30")
+    tune_params.add_argument("--duration", type=float, default=30.0, help="Length of the test excerpt in seconds (default: %(default)s). Example: --duration=60")
+    tune_params.add_argument("--batch_sizes", nargs='+', type=int, default=None, help="Batch sizes to try (default: 1 2 4 8 16 and the config value). Example: --batch_sizes 1 2 4")
+    tune_params.add_argument("--num_overlaps", nargs='+', type=int, default=None, help="num_overlap values to try (default: 2 4 and the config value). Example: --num_overlaps 2 4")
+    tune_params.add_argument("--chunk_sizes", nargs='+', type=int, default=None, help="Chunk sizes to try (default: 1/2, 1 and 2 times the config value for roformer models, the config value otherwise). Example: --chunk_sizes 352800 485100")
+    tune_params.add_argument("--reference_overlap", type=int, default=8, help="num_overlap of the reference separation (default: %(default)s). Example: --reference_overlap=16")
+    tune_params.add_argument("--min_sdr", type=float, default=30.0, help="Lowest SDR in dB against the reference for params to be selected (default: %(default)s). Example: --min_sdr=40")
+    tune_params.add_argument("--max_memory", type=float, default=None, help="Highest peak memory in MB for params to be selected (default: 90%% of the device memory). Example: --max_memory=6000")
+    args = parser.parse_args()
+
+    autotune_inference_params(args)
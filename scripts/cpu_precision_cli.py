@@ -0,0 +1,44 @@
+import os
+import sys
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import argparse
+import logging
+from utils.logger import get_logger
+
+def cpu_precision_report(args):
+    from inference.cpu_precision import evaluate_precisions
+
+    logger = get_logger(console_level=logging.DEBUG if args.debug else logging.INFO)
+
+    report = evaluate_precisions(
+        args.model_type,
+        args.config_path,
+        args.model_path,
+        args.reference_dir,
+        precisions=args.precisions,
+        metrics=args.metrics,
+        max_sdr_drop=args.max_sdr_drop,
+        extension=args.extension,
+    )
+
+    for precision, result in report["precisions"].items():
+        sdr = ", ".join(f"{instr}: {value:.3f}" for instr, value in result["metrics"]["sdr"].items())
+        logger.info(f"{precision:>5}: time {result['time']:.2f}s, SDR delta {result['sdr_delta']:+.3f} dB ({sdr})")
+    logger.info(f"Recommended cpu_precision: {report['recommended']}, used by 'cpu_precision: auto' in the model config")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare fp32, bf16 and int8 CPU inference on a reference set and save a precision report for the checkpoint", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, max_help_position=60))
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug logging (default: %(default)s). Example: --debug")
+    parser.add_argument("--model_type", type=str, help="Model type.", required=True)
+    parser.add_argument("--model_path", type=str, help="Path to model checkpoint.", required=True)
+    parser.add_argument("--config_path", type=str, help="Path to config file.", required=True)
+    parser.add_argument("--reference_dir", type=str, help="Reference set, the same layout as the validation set: <track>/mixture.wav and <track>/<instrument>.wav", required=True)
+    parser.add_argument("--precisions", nargs='+', choices=['fp32', 'bf16', 'int8'], default=['fp32', 'bf16', 'int8'], help="Precisions to compare (default: %(default)s). Example: --precisions fp32 int8")
+    parser.add_argument("--metrics", nargs='+', default=['sdr'], help="Metrics of utils.utils.get_metrics to report, sdr is always included (default: %(default)s). Example: --metrics sdr si_sdr")
+    parser.add_argument("--max_sdr_drop", type=float, default=0.1, help="Largest mean SDR drop in dB against fp32 for a precision to be recommended (default: %(default)s). Example: --max_sdr_drop=0.05")
+    parser.add_argument("--extension", type=str, default="wav", help="Audio file extension of the reference set (default: %(default)s). Example: --extension=flac")
+    args = parser.parse_args()
+
+    cpu_precision_report(args)
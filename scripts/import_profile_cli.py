@@ -0,0 +1,31 @@
+import os
+import sys
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import argparse
+from utils.lazy_import import profile_imports
+
+DEFAULT_MODULES = ["clientui.preset_worker", "clientui.preset_infer_cli", "webui.preset", "webui.utils", "inference.msst_infer"]
+
+def main(args):
+    for module in args.modules or DEFAULT_MODULES:
+        try:
+            timings = profile_imports(module, python=args.python, cwd=parent_dir)
+        except RuntimeError as e:
+            print(e)
+            continue
+        total = timings[0][2] if timings else 0.0
+        print(f"\n{module}: {total:.3f}s")
+        print(f"{'cumulative':>12}{'self':>10}  module")
+        for name, self_time, cumulative in timings[:args.top]:
+            print(f"{cumulative:>11.3f}s{self_time:>9.3f}s  {name}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the slowest imports of the entry point modules", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, max_help_position=60))
+    parser.add_argument("modules", nargs="*", help=f"Modules to import (default: {' '.join(DEFAULT_MODULES)})")
+    parser.add_argument("-n", "--top", type=int, default=20, help="Number of slowest modules to show (default: %(default)s)")
+    parser.add_argument("--python", type=str, default=sys.executable, help="Python interpreter to profile with (default: current interpreter)")
+    args = parser.parse_args()
+
+    main(args)
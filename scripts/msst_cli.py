@@ -7,11 +7,12 @@ import argparse
 import warnings
 import logging
 from time import time
-from inference.msst_infer import MSSeparator
 from utils.logger import get_logger
 from utils.constant import MODEL_TYPE
 
 def msst_inference(args):
+    from inference.msst_infer import MSSeparator
+
     logger = get_logger(console_level=logging.INFO)
 
     if not args.debug:
@@ -49,7 +50,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Music Source Separation Command Line Interface", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, max_help_position=60))
 
     parser.add_argument("-d", "--debug", action='store_true', help="Enable debug logging (default: %(default)s). Example: --debug")
-    parser.add_argument("--device", default='auto', choices=['auto', 'cpu', 'cuda', 'mps'], help="Device to use for inference (default: %(default)s). Example: --device=cuda")
+    parser.add_argument("--device", default='auto', choices=['auto', 'cpu', 'cuda', 'mps', 'onnx-cpu'], help="Device to use for inference (default: %(default)s). 'onnx-cpu' runs the network in ONNX Runtime. Example: --device=cuda")
     parser.add_argument("--device_ids", nargs='+', type=int, default=0, help='List of gpu ids, only used when device is cuda (default: %(default)s). Example: --device_ids 0 1')
 
     io_params = parser.add_argument_group("Separation I/O Params")
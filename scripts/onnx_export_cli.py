@@ -0,0 +1,44 @@
+import os
+import sys
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+import argparse
+import logging
+from utils.logger import get_logger
+
+def onnx_export(args):
+    import torch
+    from inference.model_manager import get_cached_model
+    from inference.onnx_backend import ONNX_DEVICE, check_parity
+    from utils.utils import get_demix_params
+
+    logger = get_logger(console_level=logging.DEBUG if args.debug else logging.INFO)
+
+    model, config = get_cached_model(args.model_type, args.config_path, args.model_path, ONNX_DEVICE, [0])
+    chunk_size, _, batch_size, _, _, _ = get_demix_params(config, args.model_type)
+    batch_size = args.batch_size or batch_size
+    channels = config.audio.get("num_channels", 2)
+
+    # The same input shape as demix, exported graphs are reused by MSSeparator(device="onnx-cpu")
+    torch.manual_seed(0)
+    x = torch.randn(batch_size, channels, chunk_size) * 0.1
+    result = check_parity(model, x)
+
+    logger.info(f"Input shape: {tuple(x.shape)}, max abs diff: {result['max_abs_diff']:.3e}, SDR: {result['sdr']:.2f} dB")
+    logger.info(f"ONNX Runtime: {result['onnx_time']:.3f}s, PyTorch: {result['eager_time']:.3f}s per batch")
+    if result["sdr"] < args.min_sdr:
+        logger.error(f"ONNX output differs from PyTorch: SDR {result['sdr']:.2f} dB < {args.min_sdr} dB")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a model to ONNX for device='onnx-cpu' and compare it with PyTorch", formatter_class=lambda prog: argparse.RawTextHelpFormatter(prog, max_help_position=60))
+    parser.add_argument("-d", "--debug", action='store_true', help="Enable debug logging (default: %(default)s). Example: --debug")
+    parser.add_argument("--model_type", type=str, choices=['mdx23c', 'bs_roformer', 'mel_band_roformer', 'scnet'], help="Model type.", required=True)
+    parser.add_argument("--model_path", type=str, help="Path to model checkpoint.", required=True)
+    parser.add_argument("--config_path", type=str, help="Path to config file.", required=True)
+    parser.add_argument("--batch_size", type=int, default=None, help="Batch size of the parity check (default: batch_size of the config). Example: --batch_size=1")
+    parser.add_argument("--min_sdr", type=float, default=50.0, help="Fail when the SDR of the ONNX output against PyTorch is lower (default: %(default)s). Example: --min_sdr=60")
+    args = parser.parse_args()
+
+    onnx_export(args)
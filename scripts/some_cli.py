@@ -4,9 +4,10 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 import argparse
-from tools.SOME.infer import infer
 
 def main(args):
+    from tools.SOME.infer import infer
+
     os.makedirs(args.output_dir, exist_ok=True)
     midi_path = infer(args.model, args.config, args.input_audio, args.output_dir, args.tempo)
     print(f"Output MIDI file: {midi_path}")
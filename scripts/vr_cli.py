@@ -7,10 +7,11 @@ import argparse
 import warnings
 import logging
 from time import time
-from modules.vocal_remover.separator import Separator
 from utils.logger import get_logger
 
 def vr_inference(args):
+    from modules.vocal_remover.separator import Separator
+
     logger = get_logger(console_level=logging.INFO)
 
     if not args.debug:
@@ -0,0 +1,43 @@
+from concurrent.futures import Future
+
+import pytest
+
+torch = pytest.importorskip("torch")
+ConfigDict = pytest.importorskip("ml_collections").ConfigDict
+
+from inference.dynamic_batcher import DynamicBatcher
+
+
+class RecordingModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, x):
+        self.batch_sizes.append(x.shape[0])
+        return x * 2
+
+
+def run_requests(sizes, max_batch_size):
+    model = RecordingModel()
+    batcher = DynamicBatcher(model, ConfigDict({"training": {"use_amp": False}}), "cpu", max_batch_size=max_batch_size, max_wait=0.5)
+    requests = [(torch.full((n, 2, 8), float(i)), Future()) for i, n in enumerate(sizes)]
+    # queued before the batcher thread starts, so all of them are available for merging
+    for request in requests:
+        batcher._queue.put(request)
+    batcher.start()
+    try:
+        for chunks, future in requests:
+            torch.testing.assert_close(future.result(timeout=10), chunks * 2)
+    finally:
+        batcher.stop()
+    return model.batch_sizes
+
+
+def test_merged_batches_stay_within_max_batch_size():
+    # a request that does not fit is kept whole for the next batch
+    assert run_requests([3, 3, 1, 2, 4, 1], max_batch_size=4) == [3, 4, 2, 4, 1]
+
+
+def test_oversized_request_runs_alone():
+    assert run_requests([1, 6, 2], max_batch_size=4) == [1, 6, 2]
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+sf = pytest.importorskip("soundfile")
+
+from utils.ensemble import (
+    ArrayReader, EnsembleEngine, FFT_ALGORITHMS, WAVE_ALGORITHMS, absmax, average_waveforms, ensemble_audios,
+    istft, lambda_max, lambda_min, stft,
+)
+
+ALGORITHMS = WAVE_ALGORITHMS + FFT_ALGORITHMS
+WEIGHTS = [1.0, 2.0, 0.5]
+# float32 STFTs of the whole track vs of blocks, the difference is rounding only
+ATOL = 1e-4
+
+
+def reference_average_waveforms(pred_track, weights, algorithm, n_fft=2048, hop_length=1024):
+    """
+    The whole-track implementation the block engine replaced (librosa STFT of every input at once)
+    """
+    pred_track = np.array(pred_track)
+    final_length = pred_track.shape[-1]
+
+    mod_track = []
+    for i in range(pred_track.shape[0]):
+        if algorithm == 'avg_wave':
+            mod_track.append(pred_track[i] * weights[i])
+        elif algorithm in WAVE_ALGORITHMS:
+            mod_track.append(pred_track[i])
+        else:
+            spec = stft(pred_track[i], nfft=n_fft, hl=hop_length)
+            mod_track.append(spec * weights[i] if algorithm == 'avg_fft' else spec)
+    pred_track = np.array(mod_track)
+
+    if algorithm in ['avg_wave', 'avg_fft']:
+        pred_track = pred_track.sum(axis=0) / np.array(weights).sum()
+    elif algorithm in ['median_wave', 'median_fft']:
+        pred_track = np.median(pred_track, axis=0)
+    elif algorithm in ['min_wave', 'min_fft']:
+        pred_track = lambda_min(pred_track, axis=0, key=np.abs)
+    elif algorithm == 'max_wave':
+        pred_track = lambda_max(pred_track, axis=0, key=np.abs)
+    else:
+        pred_track = absmax(pred_track, axis=0)
+    if algorithm in FFT_ALGORITHMS:
+        pred_track = istft(pred_track, hop_length, final_length)
+    return pred_track
+
+
+def make_tracks(length, num=len(WEIGHTS), seed=0):
+    # scaled copies of one signal plus a little noise: the magnitudes compared by min/max/median are well apart,
+    # so rounding differences can not flip which input is picked for a bin
+    rng = np.random.default_rng(seed)
+    base = rng.uniform(-1, 1, size=(2, length))
+    scales = np.linspace(1.0, 0.3, num)[:, None, None]
+    return (base * scales + rng.uniform(-1e-3, 1e-3, size=(num, 2, length))).astype(np.float32)
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_average_waveforms_matches_reference(algorithm):
+    tracks = make_tracks(44100 * 2 + 333)
+    expected = reference_average_waveforms(tracks, WEIGHTS, algorithm)
+    actual = average_waveforms(tracks, WEIGHTS, algorithm)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=ATOL)
+
+
+@pytest.mark.parametrize("algorithm", FFT_ALGORITHMS)
+@pytest.mark.parametrize("n_fft, hop_length", [(2048, 1024), (4096, 1024), (1024, 128)])
+@pytest.mark.parametrize("length", [1024 * 10, 1024 * 10 + 333, 3000])
+def test_engine_block_boundaries(algorithm, n_fft, hop_length, length):
+    # blocks of a few hops, so most frames overlap a block boundary and the track edges fall inside the context
+    tracks = make_tracks(length)
+    expected = reference_average_waveforms(tracks, WEIGHTS, algorithm, n_fft, hop_length)
+    engine = EnsembleEngine([ArrayReader(t) for t in tracks], WEIGHTS, algorithm, block_size=hop_length * 3,
+                            n_fft=n_fft, hop_length=hop_length)
+    np.testing.assert_allclose(engine.run(), expected, atol=ATOL)
+
+
+@pytest.mark.parametrize("algorithm", WAVE_ALGORITHMS)
+def test_engine_wave_blocks(algorithm):
+    tracks = make_tracks(1024 * 5 + 17)
+    expected = reference_average_waveforms(tracks, WEIGHTS, algorithm)
+    engine = EnsembleEngine([ArrayReader(t) for t in tracks], WEIGHTS, algorithm, block_size=1024)
+    np.testing.assert_allclose(engine.run(), expected, atol=ATOL)
+
+
+@pytest.mark.parametrize("algorithm", ['avg_wave', 'median_fft', 'max_fft'])
+def test_ensemble_audios_matches_reference(tmp_path, algorithm):
+    # the path used by webui ensemble_files: files read block by block, truncated to the shortest input
+    tracks = make_tracks(44100 + 1000)
+    files = []
+    for i, track in enumerate(tracks):
+        path = str(tmp_path / f"{i}.wav")
+        sf.write(path, track[:, : track.shape[-1] - 100 * i].T, 44100, subtype='FLOAT')
+        files.append(path)
+    expected = reference_average_waveforms(tracks[..., : tracks.shape[-1] - 100 * (len(files) - 1)], WEIGHTS, algorithm)
+
+    res, sr = ensemble_audios(files, algorithm, WEIGHTS)
+    assert sr == 44100
+    np.testing.assert_allclose(res.T, expected, atol=ATOL)
+
+
+@pytest.mark.parametrize("algorithm", FFT_ALGORITHMS)
+def test_engine_torch_matches_numpy(algorithm):
+    torch = pytest.importorskip("torch")
+    tracks = make_tracks(1024 * 8 + 5)
+    expected = EnsembleEngine([ArrayReader(t) for t in tracks], WEIGHTS, algorithm, block_size=2048).run()
+    actual = EnsembleEngine([ArrayReader(t) for t in tracks], WEIGHTS, algorithm, block_size=2048,
+                            device=torch.device("cpu")).run()
+    np.testing.assert_allclose(actual, expected, atol=ATOL)
@@ -0,0 +1,70 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("beartype")
+
+from modules.bs_roformer import bs_roformer
+from modules.bs_roformer.fused import FusedBandSplit, FusedMaskEstimator, fuse_bands
+
+# the fused modules only change the floating point summation order, float32 results agree to ~1e-6
+ATOL = 1e-5
+RTOL = 1e-4
+
+DIM = 32
+# band widths as in the default BS-Roformer split (stereo, real and imaginary), several padding groups
+DIM_INPUTS = (8, 8, 8, 16, 16, 48, 48, 96, 100, 192, 516)
+FREQS_PER_BANDS = (2,) * 8 + (4,) * 4 + (12,) * 2 + (24,) * 2 + (25,)  # 129 bins for n_fft = 256
+
+
+def randomize(module):
+    # RMSNorm gamma starts at ones and linear biases are small, randomize everything so the test is not trivial
+    torch.manual_seed(0)
+    with torch.no_grad():
+        for p in module.parameters():
+            p.copy_(torch.randn_like(p) * 0.5)
+    return module.eval()
+
+
+@pytest.mark.parametrize("max_padding", [0.0, 0.25, 1.0])
+def test_fused_band_split_matches_eager(max_padding):
+    band_split = randomize(bs_roformer.BandSplit(DIM, DIM_INPUTS))
+    fused = FusedBandSplit(band_split, max_padding)
+    x = torch.randn(2, 5, sum(DIM_INPUTS))
+    with torch.no_grad():
+        torch.testing.assert_close(fused(x), band_split(x), atol=ATOL, rtol=RTOL)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+@pytest.mark.parametrize("max_padding", [0.0, 0.25, 1.0])
+def test_fused_mask_estimator_matches_eager(depth, max_padding):
+    mask_estimator = randomize(bs_roformer.MaskEstimator(DIM, DIM_INPUTS, depth=depth, mlp_expansion_factor=2))
+    fused = FusedMaskEstimator(mask_estimator, max_padding)
+    x = torch.randn(2, 5, len(DIM_INPUTS), DIM)
+    with torch.no_grad():
+        torch.testing.assert_close(fused(x), mask_estimator(x), atol=ATOL, rtol=RTOL)
+
+
+def test_fuse_bands_model_matches_eager():
+    model = randomize(bs_roformer.BSRoformer(
+        DIM,
+        depth=1,
+        stereo=True,
+        num_stems=2,
+        time_transformer_depth=1,
+        freq_transformer_depth=1,
+        freqs_per_bands=FREQS_PER_BANDS,
+        dim_head=16,
+        heads=2,
+        flash_attn=False,
+        stft_n_fft=256,
+        stft_hop_length=64,
+        stft_win_length=256,
+        mask_estimator_depth=2,
+        mlp_expansion_factor=2,
+    ))
+    x = torch.randn(1, 2, 64 * 31)
+    with torch.no_grad():
+        expected = model(x)
+        assert fuse_bands(model) == 3  # band split and one mask estimator per stem
+        actual = model(x)
+    torch.testing.assert_close(actual, expected, atol=1e-4, rtol=1e-3)
@@ -0,0 +1,95 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+yaml = pytest.importorskip("yaml")
+pytest.importorskip("ml_collections")
+
+from inference.onnx_backend import OnnxModel, check_parity
+from utils.utils import get_model_from_config
+
+# ONNX Runtime fuses and reorders float32 ops: outputs must agree to 1e-4 of the output peak
+# (the accuracy the cpu backend is documented with, far below audible differences)
+RTOL = 1e-3
+ATOL = 1e-4
+
+# small versions of the shipped configs, random weights
+CONFIGS = {
+    "bs_roformer": {
+        "audio": {"chunk_size": 64 * 63, "num_channels": 2, "sample_rate": 44100},
+        "model": {
+            "dim": 32,
+            "depth": 1,
+            "stereo": True,
+            "num_stems": 1,
+            "time_transformer_depth": 1,
+            "freq_transformer_depth": 1,
+            "freqs_per_bands": [2] * 8 + [4] * 4 + [12] * 2 + [24] * 2 + [25],
+            "dim_head": 16,
+            "heads": 2,
+            "flash_attn": False,
+            "stft_n_fft": 256,
+            "stft_hop_length": 64,
+            "stft_win_length": 256,
+            "mask_estimator_depth": 2,
+        },
+    },
+    "mdx23c": {
+        "audio": {"chunk_size": 128 * 31, "dim_f": 256, "dim_t": 32, "hop_length": 128, "n_fft": 512, "num_channels": 2, "sample_rate": 44100},
+        "model": {
+            "act": "gelu",
+            "bottleneck_factor": 2,
+            "growth": 8,
+            "norm": "InstanceNorm",
+            "num_blocks_per_scale": 1,
+            "num_channels": 8,
+            "num_scales": 2,
+            "num_subbands": 4,
+            "scale": [2, 2],
+        },
+        "training": {"instruments": ["vocals", "other"], "target_instrument": None},
+    },
+    "scnet": {
+        "audio": {"chunk_size": 256 * 40, "num_channels": 2, "sample_rate": 44100},
+        "model": {
+            "sources": ["vocals", "other"],
+            "audio_channels": 2,
+            "dims": [4, 8, 16, 32],
+            "nfft": 1024,
+            "hop_size": 256,
+            "win_size": 1024,
+            "normalized": True,
+            "num_dplayer": 1,
+        },
+    },
+}
+
+
+def build_model(model_type, tmp_path):
+    config_path = tmp_path / f"config_{model_type}.yaml"
+    config_path.write_text(yaml.safe_dump(CONFIGS[model_type]))
+    torch.manual_seed(0)
+    model, config = get_model_from_config(model_type, str(config_path))
+    # the exported graph is written next to the checkpoint, so inside tmp_path
+    return OnnxModel(model.eval(), model_type, str(tmp_path / f"{model_type}.ckpt"), cache_key=model_type), config
+
+
+@pytest.mark.parametrize("model_type", sorted(CONFIGS))
+def test_onnx_matches_eager(model_type, tmp_path):
+    model, config = build_model(model_type, tmp_path)
+    torch.manual_seed(1)
+    chunk = torch.randn(1, config.audio.num_channels, config.audio.chunk_size) * 0.1
+
+    with torch.inference_mode():
+        onnx_out = model(chunk)
+        eager_out = model.eager(chunk)
+
+    # OnnxModel falls back to PyTorch when the export fails, make sure ONNX Runtime was actually used
+    assert model._cores and all(core is not None for core in model._cores.values())
+    assert list(tmp_path.glob("*.onnx"))
+
+    assert onnx_out.shape == eager_out.shape
+    torch.testing.assert_close(onnx_out, eager_out, rtol=RTOL, atol=ATOL * eager_out.abs().max().item())
+    # the same comparison as reported by scripts/onnx_export_cli.py
+    assert check_parity(model, chunk)["sdr"] > 60
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+librosa = pytest.importorskip("librosa")
+
+from modules.vocal_remover.uvr_lib_v5 import spec_utils
+from modules.vocal_remover.uvr_lib_v5.spec_utils_torch import TorchSpectrogram
+from modules.vocal_remover.uvr_lib_v5.vr_network.model_param_init import ModelParameters
+
+MODEL_PARAMS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "vr_modelparams")
+
+# (model params, is_v51_model): single band, multi-band, mid/side and reverse channel modes, v5.1 channel conversions
+PARAMS = [
+    ("1band_sr44100_hl512.json", False),
+    ("4band_v3.json", False),
+    ("3band_44100_msb2.json", False),
+    ("4band_44100_mid.json", False),
+    ("4band_44100_reverse.json", False),
+    ("4band_v3_sn.json", True),
+    ("4band_v4_ms_fullband.json", True),
+]
+
+# float32 torch.stft/istft vs librosa: spectra are compared relative to their largest bin, waves absolutely
+SPEC_RTOL = 1e-5
+WAVE_ATOL = 1e-4
+
+
+def load_params(name):
+    return ModelParameters(os.path.join(MODEL_PARAMS_DIR, name))
+
+
+def band_waves(mp, seconds=1.5, seed=0):
+    """Input of every band, resampled from the high-end band down like VrSeparator.loading_mix"""
+    bands_n = len(mp.param["band"])
+    rng = np.random.default_rng(seed)
+    top = mp.param["band"][bands_n]
+    waves = {bands_n: rng.uniform(-0.5, 0.5, size=(2, int(top["sr"] * seconds))).astype(np.float32)}
+    for d in range(bands_n - 1, 0, -1):
+        bp = mp.param["band"][d]
+        waves[d] = librosa.resample(waves[d + 1], orig_sr=mp.param["band"][d + 1]["sr"], target_sr=bp["sr"], res_type=bp["res_type"])
+    return waves
+
+
+def assert_spec_close(actual, expected):
+    atol = SPEC_RTOL * np.abs(expected).max()
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=atol)
+
+
+def numpy_specs(mp, waves, is_v51_model):
+    return {
+        d: spec_utils.wave_to_spectrogram(waves[d], bp["hl"], bp["n_fft"], mp, band=d, is_v51_model=is_v51_model)
+        for d, bp in mp.param["band"].items()
+    }
+
+
+@pytest.mark.parametrize("name, is_v51_model", PARAMS)
+def test_wave_to_spectrogram_and_combine(name, is_v51_model):
+    mp = load_params(name)
+    waves = band_waves(mp)
+    spectrogram = TorchSpectrogram(mp, "cpu", is_v51_model=is_v51_model)
+
+    expected = numpy_specs(mp, waves, is_v51_model)
+    actual = {d: spectrogram.wave_to_spectrogram(waves[d], d) for d in waves}
+    for d in waves:
+        assert tuple(actual[d].shape) == expected[d].shape
+        assert_spec_close(actual[d].cpu().numpy(), expected[d])
+
+    assert_spec_close(spectrogram.combine_spectrograms(actual), spec_utils.combine_spectrograms(expected, mp, is_v51_model=is_v51_model))
+
+
+@pytest.mark.parametrize("name, is_v51_model", PARAMS)
+@pytest.mark.parametrize("high_end_process", [False, True])
+def test_spectrogram_to_wave(name, is_v51_model, high_end_process):
+    mp = load_params(name)
+    specs = numpy_specs(mp, band_waves(mp), is_v51_model)
+    spec_m = spec_utils.combine_spectrograms(specs, mp, is_v51_model=is_v51_model)
+
+    extra_bins_h, extra_bins = None, None
+    if high_end_process:
+        # the high end bypass as set up by VrSeparator.loading_mix
+        bands_n = len(mp.param["band"])
+        bp = mp.param["band"][bands_n]
+        extra_bins_h = (bp["n_fft"] // 2 - bp["crop_stop"]) + (mp.param["pre_filter_stop"] - mp.param["pre_filter_start"])
+        extra_bins = specs[bands_n][:, bp["n_fft"] // 2 - extra_bins_h : bp["n_fft"] // 2, :]
+
+    expected = spec_utils.cmb_spectrogram_to_wave(spec_m.copy(), mp, extra_bins_h, extra_bins, is_v51_model=is_v51_model)
+    actual = TorchSpectrogram(mp, "cpu", is_v51_model=is_v51_model).spectrogram_to_wave(spec_m, extra_bins_h, extra_bins)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=WAVE_ATOL)
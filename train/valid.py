@@ -15,6 +15,7 @@ import soundfile as sf
 import numpy as np
 
 from utils.utils import demix, get_metrics, get_model_from_config
+from utils.demix_pipeline import demix_pipelined
 from utils.logger import get_logger
 logger = get_logger()
 
@@ -93,7 +94,10 @@ def proc_list_of_files(
 
         full_result = []
         for mix in track_proc_list:
-            waveforms = demix(config, model, mix, device, model_type=args.model_type)
+            if config.inference.get('use_pipeline', False):
+                waveforms = demix_pipelined(config, model, mix, device, model_type=args.model_type)
+            else:
+                waveforms = demix(config, model, mix, device, model_type=args.model_type)
             full_result.append(waveforms)
 
         # Average all values in single dict
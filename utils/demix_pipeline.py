@@ -0,0 +1,231 @@
+# coding: utf-8
+import queue
+import threading
+import numpy as np
+import torch
+import torch.nn as nn
+from tqdm.auto import tqdm
+from numpy.typing import NDArray
+from typing import Dict
+
+from utils.utils import get_demix_params, get_demix_instruments, pack_demix_result, get_fade_windows, select_fade_window, get_overlap_add_envelope, check_finite_sources
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class ChunkProducer(threading.Thread):
+	"""
+	Background thread that slices and pads the overlap-add windows of a track and
+	stacks them into batches, so chunk preparation runs while the model is busy.
+	Batches are allocated in pinned memory when `pin_memory` is True.
+	"""
+
+	def __init__(self, mix: torch.Tensor, chunk_size: int, step: int, batch_size: int, use_fading: bool, pin_memory: bool = False, prefetch: int = 2):
+		super().__init__(daemon=True)
+		self.mix = mix
+		self.chunk_size = chunk_size
+		self.step = step
+		self.batch_size = batch_size
+		self.use_fading = use_fading
+		self.pin_memory = pin_memory
+		self.queue = queue.Queue(maxsize=max(1, prefetch))
+		self._stop_event = threading.Event()
+
+	def _make_batch(self, locations):
+		C = self.chunk_size
+		batch = torch.empty((len(locations), self.mix.shape[0], C), dtype=torch.float32, pin_memory=self.pin_memory)
+		for k, (start, length) in enumerate(locations):
+			part = self.mix[:, start : start + length]
+			# Pad the last chunk if needed
+			if length < C:
+				if self.use_fading and length > C // 2 + 1:
+					part = nn.functional.pad(input=part, pad=(0, C - length), mode="reflect")
+				else:
+					part = nn.functional.pad(input=part, pad=(0, C - length, 0, 0), mode="constant", value=0)
+			batch[k].copy_(part)
+		return batch
+
+	def _put(self, item):
+		while not self._stop_event.is_set():
+			try:
+				self.queue.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def run(self):
+		try:
+			total = self.mix.shape[1]
+			locations = []
+			for start in range(0, total, self.step):
+				locations.append((start, min(self.chunk_size, total - start)))
+				if len(locations) >= self.batch_size or start + self.step >= total:
+					if not self._put((self._make_batch(locations), locations)):
+						return
+					locations = []
+		except Exception as e:
+			self._put(e)
+		finally:
+			self._put(None)
+
+	def __iter__(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				return
+			if isinstance(item, Exception):
+				raise item
+			yield item
+
+	def stop(self):
+		self._stop_event.set()
+		self.join()
+
+
+def demix_pipelined(config, model, mix: NDArray, device, model_type: str = None, callback=None, accumulate_on_device: bool = False, prefetch: int = 2, check_finite: bool = False) -> Dict[str, NDArray]:
+	"""
+	Same inputs and outputs as `utils.utils.demix`, but the chunks are prepared by a
+	`ChunkProducer` thread and staged on the device with non-blocking copies while
+	the previous batch is running through the model.
+	"""
+	mix = torch.tensor(mix, dtype=torch.float32)
+
+	C, step, batch_size, use_fading, fade_size, border = get_demix_params(config, model_type)
+
+	length_init = mix.shape[-1]
+
+	# Apply padding for non-HTDemucs models
+	if use_fading and length_init > 2 * border and (border > 0):
+		if mix.ndim == 1:
+			mix = mix.unsqueeze(0)  # [1, length]
+		mix = nn.functional.pad(mix, (border, border), mode="reflect")
+
+	total = mix.shape[1]
+	use_cuda = str(device).startswith("cuda") and torch.cuda.is_available()
+	accumulate_device = device if accumulate_on_device else "cpu"
+	windows = get_fade_windows(C, fade_size, device=accumulate_device) if use_fading else None
+	envelope = get_overlap_add_envelope(total, C, step, windows, device=accumulate_device)
+
+	copy_stream = torch.cuda.Stream(device=device) if use_cuda else None
+
+	def stage(batch):
+		if copy_stream is None:
+			return batch.to(device)
+		with torch.cuda.stream(copy_stream):
+			return batch.to(device, non_blocking=True)
+
+	producer = ChunkProducer(mix, C, step, batch_size, use_fading, pin_memory=use_cuda, prefetch=prefetch)
+	producer.start()
+
+	with torch.amp.autocast("cuda", enabled=config.training.get("use_amp", True)):
+		with torch.inference_mode():
+			req_shape = (len(get_demix_instruments(config, model_type)),) + tuple(mix.shape)
+			result = torch.zeros(req_shape, dtype=torch.float32, device=accumulate_device)
+			progress_bar = tqdm(total=total, desc="Processing audio chunks", leave=False)
+
+			try:
+				batches = iter(producer)
+				current = next(batches, None)
+				staged = stage(current[0]) if current is not None else None
+
+				while current is not None:
+					locations = current[1]
+					if copy_stream is not None:
+						torch.cuda.current_stream(device).wait_stream(copy_stream)
+						staged.record_stream(torch.cuda.current_stream(device))
+					arr = staged
+
+					# Stage the next batch before running the model on the current one
+					current = next(batches, None)
+					staged = stage(current[0]) if current is not None else None
+
+					x = model(arr)
+					if not accumulate_on_device:
+						x = x.float().cpu()  # one host copy per batch
+
+					for j, (start, l) in enumerate(locations):
+						if use_fading:
+							result[..., start : start + l] += x[j][..., :l] * select_fade_window(start, step, total, windows)[:l]
+						else:
+							result[..., start : start + l] += x[j][..., :l]
+
+					end = locations[-1][0] + step
+					progress_bar.update(step * len(locations))
+					if callback:
+						callback["progress"] = min(0.99 * (end / total), 0.99)  # the rest 1% is for the postprocess
+			finally:
+				producer.stop()
+				progress_bar.close()
+
+			estimated_sources = result / envelope
+			if check_finite:
+				check_finite_sources(estimated_sources, envelope)
+			estimated_sources = estimated_sources.cpu().numpy()
+			np.nan_to_num(estimated_sources, copy=False, nan=0.0)
+
+			# Remove padding for non-HTDemucs models
+			if use_fading and length_init > 2 * border and (border > 0):
+				estimated_sources = estimated_sources[..., border:-border]
+
+	return pack_demix_result(config, model_type, estimated_sources)
+
+
+def demix_batched(config, model_type: str, mix: NDArray, batcher, callback=None, accumulate_on_device: bool = False, accumulate_device="cpu", check_finite: bool = False) -> Dict[str, NDArray]:
+	"""
+	Same inputs and outputs as `utils.utils.demix`, but the forward passes are delegated to a
+	shared `batcher` (see `inference.dynamic_batcher.DynamicBatcher`), which merges the windows
+	of several concurrent tracks into one batch and returns each track its own outputs.
+	"""
+	mix = torch.tensor(mix, dtype=torch.float32)
+
+	C, step, batch_size, use_fading, fade_size, border = get_demix_params(config, model_type)
+
+	length_init = mix.shape[-1]
+
+	# Apply padding for non-HTDemucs models
+	if use_fading and length_init > 2 * border and (border > 0):
+		if mix.ndim == 1:
+			mix = mix.unsqueeze(0)  # [1, length]
+		mix = nn.functional.pad(mix, (border, border), mode="reflect")
+
+	total = mix.shape[1]
+	accumulate_device = accumulate_device if accumulate_on_device else "cpu"
+	windows = get_fade_windows(C, fade_size, device=accumulate_device) if use_fading else None
+	envelope = get_overlap_add_envelope(total, C, step, windows, device=accumulate_device)
+
+	producer = ChunkProducer(mix, C, step, batch_size, use_fading)
+	producer.start()
+
+	with torch.inference_mode():
+		req_shape = (len(get_demix_instruments(config, model_type)),) + tuple(mix.shape)
+		result = torch.zeros(req_shape, dtype=torch.float32, device=accumulate_device)
+
+		try:
+			for batch, locations in producer:
+				x = batcher.submit(batch).result()
+				x = x.float().to(accumulate_device)
+
+				for j, (start, l) in enumerate(locations):
+					if use_fading:
+						result[..., start : start + l] += x[j][..., :l] * select_fade_window(start, step, total, windows)[:l]
+					else:
+						result[..., start : start + l] += x[j][..., :l]
+
+				if callback:
+					callback["progress"] = min(0.99 * ((locations[-1][0] + step) / total), 0.99)  # the rest 1% is for the postprocess
+		finally:
+			producer.stop()
+
+		estimated_sources = result / envelope
+		if check_finite:
+			check_finite_sources(estimated_sources, envelope)
+		estimated_sources = estimated_sources.cpu().numpy()
+		np.nan_to_num(estimated_sources, copy=False, nan=0.0)
+
+		# Remove padding for non-HTDemucs models
+		if use_fading and length_init > 2 * border and (border > 0):
+			estimated_sources = estimated_sources[..., border:-border]
+
+	return pack_demix_result(config, model_type, estimated_sources)
@@ -0,0 +1,241 @@
+# coding: utf-8
+import subprocess
+import numpy as np
+import soundfile as sf
+import torch
+import torch.nn as nn
+from typing import Dict
+
+from utils.utils import get_demix_params, get_demix_instruments, get_fade_windows, check_finite_sources
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class StreamingDemixer:
+	"""
+	Incremental overlap-add separation with the same chunking, padding and windows as
+	`utils.utils.demix(..., accumulate_on_device=True)`.
+
+	Feed the mixture (channels, n) block by block with `push`. Each call returns the part
+	of the stems that no later window can touch any more, `flush` returns the rest.
+	Only about `chunk_size * (batch_size + 1)` samples per stem are kept in memory,
+	whatever the length of the track.
+	"""
+
+	def __init__(self, config, model, device, model_type: str = None, use_tta: bool = False, check_finite: bool = False):
+		self.config = config
+		self.model = model
+		self.device = device
+		self.model_type = model_type
+		self.use_tta = use_tta
+		self.check_finite = check_finite  # raise on NaN/Inf in the emitted stems, before nan_to_num
+		self.instruments = get_demix_instruments(config, model_type)
+
+		self.C, self.step, self.batch_size, self.use_fading, fade_size, self.border = get_demix_params(config, model_type)
+		self.windows = get_fade_windows(self.C, fade_size) if self.use_fading else None
+
+		self._head = None  # input collected before we know whether the track is long enough to be padded
+		self._padded = None  # whether reflect padding is applied (decided once 2 * border + 1 samples are seen)
+		self._tail = None  # last border + 1 input samples, for the reflect padding at the end
+		self._input = None  # padded input from self._input_offset on
+		self._input_offset = 0
+		self._pos = 0  # start of the next chunk, in padded coordinates
+		self._batch = []
+		self._locations = []
+		self._result = None  # accumulated stems from self._out_offset on
+		self._envelope = None
+		self._out_offset = 0
+
+	def _append_input(self, block: torch.Tensor):
+		self._input = block if self._input is None else torch.cat([self._input, block], dim=-1)
+
+	def _update_tail(self, block: torch.Tensor):
+		tail = block if self._tail is None else torch.cat([self._tail, block], dim=-1)
+		self._tail = tail[..., -(self.border + 1) :]
+
+	def push(self, block: np.ndarray) -> Dict[str, np.ndarray]:
+		block = torch.as_tensor(np.ascontiguousarray(block), dtype=torch.float32)
+
+		if self._padded is None:
+			self._head = block if self._head is None else torch.cat([self._head, block], dim=-1)
+			if self._head.shape[-1] <= 2 * self.border:
+				return self._empty()
+			self._padded = self.border > 0
+			block, self._head = self._head, None
+			if self._padded:
+				self._append_input(nn.functional.pad(block[:, : self.border + 1].unsqueeze(0), (self.border, 0), mode="reflect")[0, :, : self.border])
+
+		self._update_tail(block)
+		self._append_input(block)
+		self._process(final=False)
+		return self._emit(final=False)
+
+	def flush(self) -> Dict[str, np.ndarray]:
+		if self._padded is None:
+			# Short track: no reflect padding, same as demix
+			if self._head is None:
+				return self._empty()
+			self._padded = False
+			self._append_input(self._head)
+			self._head = None
+		elif self._padded:
+			self._append_input(nn.functional.pad(self._tail.unsqueeze(0), (0, self.border), mode="reflect")[0, :, -self.border :])
+
+		self._process(final=True)
+		return self._emit(final=True)
+
+	def _empty(self):
+		return {k: np.zeros((0, 0), dtype=np.float32) for k in self.instruments}
+
+	def _process(self, final: bool):
+		input_end = self._input_offset + (self._input.shape[-1] if self._input is not None else 0)
+		while self._pos < input_end:
+			available = input_end - self._pos
+			# A chunk is only known not to be the last one once data past `pos + step` has arrived
+			if not final and (available < self.C or available <= self.step):
+				break
+			length = min(self.C, available)
+			is_last = final and self._pos + self.step >= input_end
+
+			local = self._pos - self._input_offset
+			part = self._input[:, local : local + length]
+			if length < self.C:
+				if self.use_fading and length > self.C // 2 + 1:
+					part = nn.functional.pad(input=part, pad=(0, self.C - length), mode="reflect")
+				else:
+					part = nn.functional.pad(input=part, pad=(0, self.C - length, 0, 0), mode="constant", value=0)
+
+			self._batch.append(part)
+			self._locations.append((self._pos, length, is_last))
+			self._pos += self.step
+
+			if len(self._batch) >= self.batch_size or is_last:
+				self._run_batch()
+
+		if final and self._batch:
+			self._run_batch()
+
+		# Drop the input that no pending chunk needs any more
+		drop = min(self._pos, input_end) - self._input_offset
+		if drop > 0 and self._input is not None:
+			self._input = self._input[:, drop:]
+			self._input_offset += drop
+
+	def _forward(self, arr):
+		x = self.model(arr)
+		if self.use_tta:
+			# orig, channel inverse, polarity inverse
+			x = x + self.model(arr.flip(1)).flip(-2) - self.model(-arr)
+			x = x / 3.0
+		return x.float().cpu()
+
+	def _run_batch(self):
+		with torch.amp.autocast("cuda", enabled=self.config.training.get("use_amp", True)):
+			with torch.inference_mode():
+				arr = torch.stack(self._batch, dim=0).to(self.device)
+				x = self._forward(arr)
+
+		for j, (start, l, is_last) in enumerate(self._locations):
+			end = start + l
+			self._grow_output(end, x.shape[1:-1] if x.dim() > 3 else (1,) + tuple(x.shape[1:-1]))
+			if self.use_fading:
+				if start == 0:
+					window = self.windows[0]
+				elif is_last:
+					window = self.windows[2]
+				else:
+					window = self.windows[1]
+				window = window[:l]
+			else:
+				window = torch.ones(l)
+			local = start - self._out_offset
+			self._result[..., local : local + l] += x[j][..., :l] * window
+			self._envelope[local : local + l] += window
+
+		self._batch = []
+		self._locations = []
+
+	def _grow_output(self, end: int, stem_shape):
+		if self._result is None:
+			self._result = torch.zeros(tuple(stem_shape) + (0,), dtype=torch.float32)
+			self._envelope = torch.zeros(0, dtype=torch.float32)
+		missing = end - (self._out_offset + self._result.shape[-1])
+		if missing > 0:
+			self._result = torch.cat([self._result, torch.zeros(self._result.shape[:-1] + (missing,))], dim=-1)
+			self._envelope = torch.cat([self._envelope, torch.zeros(missing)])
+
+	def _emit(self, final: bool) -> Dict[str, np.ndarray]:
+		if self._result is None:
+			return self._empty()
+
+		# Everything before the next pending chunk is final
+		finished = self._locations[0][0] if self._locations else self._pos
+		finished = min(finished, self._out_offset + self._result.shape[-1])
+		if final:
+			finished = self._out_offset + self._result.shape[-1]
+
+		count = finished - self._out_offset
+		if count <= 0:
+			return self._empty()
+
+		estimated_sources = self._result[..., :count] / self._envelope[:count]
+		if self.check_finite:
+			check_finite_sources(estimated_sources, self._envelope[:count])
+		estimated_sources = estimated_sources.numpy()
+		np.nan_to_num(estimated_sources, copy=False, nan=0.0)
+		self._result = self._result[..., count:]
+		self._envelope = self._envelope[count:]
+		start_padded = self._out_offset
+		self._out_offset = finished
+
+		# Remove padding
+		if self._padded:
+			lo = max(self.border - start_padded, 0)
+			if final:
+				hi = count - self.border
+			else:
+				hi = count
+			estimated_sources = estimated_sources[..., lo:max(hi, lo)]
+
+		return {k: v for k, v in zip(self.instruments, estimated_sources)}
+
+
+class StreamingAudioWriter:
+	"""
+	Write a stem to disk incrementally. WAV and FLAC are written with soundfile,
+	MP3 is encoded by piping float PCM into ffmpeg.
+	"""
+
+	def __init__(self, path: str, sr: int, channels: int, output_format: str, audio_params: dict):
+		self.path = path
+		self.output_format = output_format.lower()
+		self._file = None
+		self._process = None
+
+		if self.output_format == "mp3":
+			command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "f32le", "-ar", str(sr), "-ac", str(channels), "-i", "pipe:0", "-b:a", audio_params["mp3_bit_rate"], path]
+			self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+		elif self.output_format == "flac":
+			self._file = sf.SoundFile(path, "w", samplerate=sr, channels=channels, subtype=audio_params["flac_bit_depth"])
+		else:
+			self._file = sf.SoundFile(path, "w", samplerate=sr, channels=channels, subtype=audio_params["wav_bit_depth"])
+
+	def write(self, audio: np.ndarray):
+		"""audio: (num_samples, num_channels)"""
+		if audio.shape[0] == 0:
+			return
+		if self._process is not None:
+			self._process.stdin.write(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+		else:
+			self._file.write(audio)
+
+	def close(self):
+		if self._process is not None:
+			self._process.stdin.close()
+			if self._process.wait() != 0:
+				raise RuntimeError(f"ffmpeg failed to encode {self.path}")
+			self._process = None
+		if self._file is not None:
+			self._file.close()
+			self._file = None
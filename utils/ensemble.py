@@ -69,82 +69,229 @@ def lambda_min(arr, axis=None, key=None, keepdims=False):
         return arr.flatten()[idxs]
 
 
-def average_waveforms(pred_track, weights, algorithm):
+WAVE_ALGORITHMS = ['avg_wave', 'median_wave', 'min_wave', 'max_wave']
+FFT_ALGORITHMS = ['avg_fft', 'median_fft', 'min_fft', 'max_fft']
+# librosa.stft pads with zeros since 0.10, it used reflect padding before
+STFT_PAD_MODE = 'constant' if tuple(int(v) for v in librosa.__version__.split('.')[:2]) >= (0, 10) else 'reflect'
+
+
+class ArrayReader:
+    """
+    Block reader over an in-memory waveform (channels, length)
+    """
+    def __init__(self, wave):
+        wave = np.asarray(wave)
+        self.wave = wave[None] if wave.ndim == 1 else wave
+        self.channels, self.length = self.wave.shape
+
+    def read(self, start, stop):
+        return self.wave[:, start:stop]
+
+    def close(self):
+        pass
+
+
+class FileReader:
+    """
+    Block reader over an audio file. Formats supported by soundfile are read block by block,
+    other formats fall back to decoding the whole file with librosa.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._array = None
+        try:
+            self._file = sf.SoundFile(path)
+            self.sr = self._file.samplerate
+            self.channels = self._file.channels
+            self.length = self._file.frames
+        except Exception:
+            wav, self.sr = librosa.load(path, sr=None, mono=False)
+            self._array = ArrayReader(wav)
+            self.channels, self.length = self._array.channels, self._array.length
+
+    def read(self, start, stop):
+        if self._array is not None:
+            return self._array.read(start, stop)
+        self._file.seek(start)
+        return self._file.read(stop - start, dtype='float32', always_2d=True).T
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class EnsembleEngine:
+    """
+    Ensemble of several waveforms processed in time blocks, so memory does not grow with the track length.
+
+    Wave algorithms are point-wise and use disjoint blocks. FFT algorithms read each block with the context of
+    every frame overlapping it, compute the STFT of all inputs and channels with a single batched FFT and overlap-add
+    only these frames, which gives the same result as the STFT of the whole track (centered frames, hann window,
+    n_fft a multiple of hop_length, 2048 and 1024 by default). FFTs run on torch when `device` is given.
+    """
+    def __init__(self, readers, weights, algorithm, block_size=1024 * 256, n_fft=2048, hop_length=1024, device=None):
+        if algorithm not in WAVE_ALGORITHMS + FFT_ALGORITHMS:
+            raise ValueError(f'Unknown ensemble algorithm: {algorithm}')
+        if n_fft % hop_length != 0:
+            raise ValueError('n_fft must be a multiple of hop_length')
+        self.readers = readers
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.algorithm = algorithm
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.block_size = max(hop_length, block_size // hop_length * hop_length)
+        self.length = min(r.length for r in readers)
+        self.channels = max(r.channels for r in readers)
+        self.window = np.hanning(n_fft + 1)[:-1]  # periodic hann, same as librosa
+        self.device = device
+        if device is not None:
+            import torch
+            self._torch = torch
+            self._torch_window = torch.as_tensor(self.window, device=device)
+
+    def _read(self, start, stop):
+        """
+        Read [start, stop) of every input as (num, channels, stop - start), with the STFT centering padding outside the track
+        """
+        a, b = max(start, 0), min(stop, self.length)
+        blocks = []
+        for r in self.readers:
+            block = np.asarray(r.read(a, b), dtype=np.float32)
+            if block.shape[0] < self.channels:
+                block = np.repeat(block, self.channels // block.shape[0], axis=0)
+            blocks.append(block)
+        data = np.stack(blocks)
+        if start < a or stop > b:
+            pad_mode = STFT_PAD_MODE if self.algorithm in FFT_ALGORITHMS else 'constant'
+            if pad_mode == 'reflect':
+                # reflect around the first/last sample of the track, both are inside the block
+                if start < a:
+                    data = np.concatenate([data[..., 1 : a - start + 1][..., ::-1], data], axis=-1)
+                if stop > b:
+                    data = np.concatenate([data, data[..., -(stop - b) - 1 : -1][..., ::-1]], axis=-1)
+            else:
+                data = np.pad(data, ((0, 0), (0, 0), (a - start, stop - b)))
+        return data
+
+    def _stft(self, frames):
+        """frames: (..., n_frames, n_fft) -> complex spectrum (..., n_frames, n_fft // 2 + 1)"""
+        if self.device is not None:
+            x = self._torch.as_tensor(frames, device=self.device, dtype=self._torch.float64) * self._torch_window
+            return self._torch.fft.rfft(x, dim=-1).to(self._torch.complex64).cpu().numpy()
+        return np.fft.rfft(frames * self.window, axis=-1).astype(np.complex64)
+
+    def _istft_frames(self, spec):
+        """spec: (..., n_frames, n_fft // 2 + 1) -> windowed time frames (..., n_frames, n_fft)"""
+        if self.device is not None:
+            x = self._torch.fft.irfft(self._torch.as_tensor(spec, device=self.device), n=self.n_fft, dim=-1)
+            return (x * self._torch_window.to(x.dtype)).cpu().numpy()
+        return np.fft.irfft(spec, n=self.n_fft, axis=-1) * self.window
+
+    def _overlap_add(self, frames):
+        """frames: (..., n_frames, n_fft) -> (..., (n_frames - 1) * hop + n_fft)"""
+        hop = self.hop_length
+        parts = self.n_fft // hop
+        n_frames = frames.shape[-2]
+        out = np.zeros(frames.shape[:-2] + (n_frames + parts - 1, hop), dtype=frames.dtype)
+        for p in range(parts):
+            out[..., p : p + n_frames, :] += frames[..., p * hop : (p + 1) * hop]
+        return out.reshape(frames.shape[:-2] + (-1,))
+
+    def _combine(self, data):
+        """Reduce the model axis (0) of a block of waveforms or spectra"""
+        algorithm = self.algorithm
+        if algorithm in ['avg_wave', 'avg_fft']:
+            weights = self.weights.reshape((-1,) + (1,) * (data.ndim - 1))
+            return (data * weights).sum(axis=0) / self.weights.sum()
+        if algorithm in ['median_wave', 'median_fft']:
+            return np.median(data, axis=0)
+        if algorithm in ['min_wave', 'min_fft']:
+            return lambda_min(data, axis=0, key=np.abs)
+        return lambda_max(data, axis=0, key=np.abs)
+
+    def _fft_block(self, start, stop):
+        hop, n_fft = self.hop_length, self.n_fft
+        half = n_fft // 2
+        # frame k covers [k * hop - half, k * hop - half + n_fft) of the track. With n_fft = parts * hop, the samples
+        # of [start, stop) are also covered by up to (parts + 1) // 2 - 1 frames before and after the block
+        context = (n_fft // hop + 1) // 2 - 1
+        first = max(start // hop - context, 0)
+        last = min(stop // hop + context, self.length // hop)  # the last frame of the track is length // hop
+        data = self._read(first * hop - half, last * hop - half + n_fft)
+        n_frames = last - first + 1
+        idx = np.arange(n_frames)[:, None] * hop + np.arange(n_fft)[None, :]
+        spec = self._stft(data[..., idx])
+
+        combined = self._combine(spec)
+        wave = self._overlap_add(self._istft_frames(combined))
+        window_sum = self._overlap_add(np.broadcast_to(self.window ** 2, (n_frames, n_fft)))
+        nonzero = window_sum > np.finfo(np.float32).tiny
+        wave[..., nonzero] /= window_sum[nonzero]
+
+        offset = start - (first * hop - half)
+        return wave[..., offset : offset + stop - start].astype(np.float32)
+
+    def blocks(self):
+        """Yields the ensemble result block by block, each of shape (channels, block_length)"""
+        for start in range(0, self.length, self.block_size):
+            stop = min(start + self.block_size, self.length)
+            if self.algorithm in WAVE_ALGORITHMS:
+                yield self._combine(self._read(start, stop))
+            else:
+                yield self._fft_block(start, stop)
+
+    def run(self):
+        """Returns the whole result (channels, length), only one block of every input is held in memory at a time"""
+        result = np.zeros((self.channels, self.length), dtype=np.float32)
+        start = 0
+        for block in self.blocks():
+            result[:, start : start + block.shape[-1]] = block
+            start += block.shape[-1]
+        return result
+
+    def close(self):
+        for r in self.readers:
+            r.close()
+
+
+def average_waveforms(pred_track, weights, algorithm, device=None):
     """
     :param pred_track: shape = (num, channels, length)
     :param weights: shape = (num, )
     :param algorithm: One of avg_wave, median_wave, min_wave, max_wave, avg_fft, median_fft, min_fft, max_fft
+    :param device: torch device for the FFTs, numpy is used when None
     :return: averaged waveform in shape (channels, length)
     """
+    engine = EnsembleEngine([ArrayReader(track) for track in pred_track], weights, algorithm, device=device)
+    return engine.run()
 
-    pred_track = np.array(pred_track)
-    final_length = pred_track.shape[-1]
-
-    mod_track = []
-    for i in range(pred_track.shape[0]):
-        if algorithm == 'avg_wave':
-            mod_track.append(pred_track[i] * weights[i])
-        elif algorithm in ['median_wave', 'min_wave', 'max_wave']:
-            mod_track.append(pred_track[i])
-        elif algorithm in ['avg_fft', 'min_fft', 'max_fft', 'median_fft']:
-            spec = stft(pred_track[i], nfft=2048, hl=1024)
-            if algorithm in ['avg_fft']:
-                mod_track.append(spec * weights[i])
-            else:
-                mod_track.append(spec)
-    pred_track = np.array(mod_track)
-
-    if algorithm in ['avg_wave']:
-        pred_track = pred_track.sum(axis=0)
-        pred_track /= np.array(weights).sum().T
-    elif algorithm in ['median_wave']:
-        pred_track = np.median(pred_track, axis=0)
-    elif algorithm in ['min_wave']:
-        pred_track = np.array(pred_track)
-        pred_track = lambda_min(pred_track, axis=0, key=np.abs)
-    elif algorithm in ['max_wave']:
-        pred_track = np.array(pred_track)
-        pred_track = lambda_max(pred_track, axis=0, key=np.abs)
-    elif algorithm in ['avg_fft']:
-        pred_track = pred_track.sum(axis=0)
-        pred_track /= np.array(weights).sum()
-        pred_track = istft(pred_track, 1024, final_length)
-    elif algorithm in ['min_fft']:
-        pred_track = np.array(pred_track)
-        pred_track = lambda_min(pred_track, axis=0, key=np.abs)
-        pred_track = istft(pred_track, 1024, final_length)
-    elif algorithm in ['max_fft']:
-        pred_track = np.array(pred_track)
-        pred_track = absmax(pred_track, axis=0)
-        pred_track = istft(pred_track, 1024, final_length)
-    elif algorithm in ['median_fft']:
-        pred_track = np.array(pred_track)
-        pred_track = np.median(pred_track, axis=0)
-        pred_track = istft(pred_track, 1024, final_length)
-    return pred_track
-
-
-def ensemble_audios(files, type, weights):
+
+def ensemble_audios(files, type, weights, device=None):
     logger.info(f'Ensemble type: {type}, Number of input files: {len(files)}, Weights: {weights}')
     if weights is None:
         weights = np.ones(len(files))
-    data = []
+    readers = []
     sr = 44100
-    for f in files:
-        if not os.path.isfile(f):
-            logger.error(f"Can't find file: {f}. Check paths.")
-            return None
-        wav, sr = librosa.load(f, sr=None, mono=False)
-        logger.debug(f"Reading file: {f}, waveform shape: {wav.shape}, sample rate: {sr}")
-        data.append(wav)
-
-    lengths = [d.shape[-1] for d in data]
-    min_length = min(lengths)
-    if len(set(lengths)) > 1:
-        logger.warning("Input audio files have different lengths. Truncating all to the shortest length.")
-        data = [d[..., :min_length] for d in data]
-
-    data = np.array(data)
-    res = average_waveforms(data, weights, type)
+    try:
+        for f in files:
+            if not os.path.isfile(f):
+                logger.error(f"Can't find file: {f}. Check paths.")
+                return None
+            reader = FileReader(f)
+            readers.append(reader)
+            sr = reader.sr
+            logger.debug(f"Reading file: {f}, channels: {reader.channels}, length: {reader.length}, sample rate: {sr}")
+
+        lengths = [r.length for r in readers]
+        if len(set(lengths)) > 1:
+            logger.warning("Input audio files have different lengths. Truncating all to the shortest length.")
+
+        engine = EnsembleEngine(readers, weights, type, device=device)
+        res = engine.run()
+    finally:
+        for r in readers:
+            r.close()
     logger.debug('Result shape: {}'.format(res.shape))
     return res.T, sr
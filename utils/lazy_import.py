@@ -0,0 +1,63 @@
+import sys
+import types
+import importlib
+import subprocess
+from typing import List, Tuple
+
+
+class LazyModule(types.ModuleType):
+    """
+    模块代理，第一次访问属性时才真正导入模块，用于延迟导入 gradio、torch 等启动很慢的依赖
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str):
+    """
+    返回延迟导入的模块，模块已经导入时直接返回模块本身
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def profile_imports(module: str, python: str = sys.executable, cwd: str = None) -> List[Tuple[str, float, float]]:
+    """
+    在新的解释器中用 -X importtime 导入模块，返回 [(模块名, 自身耗时秒, 累计耗时秒)]，按累计耗时从大到小排序
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, cwd=cwd)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ''}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            timings.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+        except ValueError:
+            continue
+    timings.sort(key=lambda item: item[2], reverse=True)
+    return timings
@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from utils.constant import MSST_MODEL, VR_MODEL, MODELS_INFO, MODEL_FOLDER, UNOFFICIAL_MODEL, get_cache_dir
+from utils.logger import get_logger
+
+logger = get_logger()
+
+MSST_EXTENSIONS = ('.ckpt', '.th', '.chpt')
+VR_EXTENSIONS = ('.pth',)
+
+UNOFFICIAL_MSST_MODEL = os.path.join(UNOFFICIAL_MODEL, "unofficial_msst_model.json")
+UNOFFICIAL_VR_MODEL = os.path.join(UNOFFICIAL_MODEL, "unofficial_vr_model.json")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ModelRegistry:
+    """
+    模型元数据索引，代替每次调用都重新读取模型映射JSON并线性查找
+
+    - 官方和非官方的MSST/VR模型映射按模型名建立索引，映射文件的修改时间变化时自动重建
+    - 模型目录的位置和其中已下载的模型列表按目录修改时间缓存
+    - 模型文件的大小和sha256按 (路径, 大小, 修改时间) 保存到缓存目录的 model_index.json，多个进程共享，每个文件只计算一次
+    """
+
+    def __init__(self, index_file: Optional[str] = None):
+        self.index_file = index_file or os.path.join(get_cache_dir(), "model_index.json")
+        self._lock = threading.RLock()
+        self._signature = None
+        self._msst: Dict[str, List[dict]] = {}
+        self._msst_categories: List[str] = []
+        self._vr: Dict[str, dict] = {}
+        self._models_info: Dict[str, dict] = {}
+        self._dirs: Dict[str, tuple] = {}  # 目录 -> (修改时间, 文件列表)
+        self._file_index = None
+
+    def _sources(self):
+        return [MSST_MODEL, UNOFFICIAL_MSST_MODEL, VR_MODEL, UNOFFICIAL_VR_MODEL, MODELS_INFO]
+
+    def refresh(self, force=False):
+        """映射文件没有变化时什么都不做"""
+        signature = tuple(_mtime(path) for path in self._sources())
+        with self._lock:
+            if not force and signature == self._signature:
+                return
+            msst, categories = {}, []
+            for path, unofficial in [(MSST_MODEL, False), (UNOFFICIAL_MSST_MODEL, True)]:
+                for category, models in _load_json(path).items():
+                    if not unofficial:
+                        categories.append(category)
+                    for model in models:
+                        entry = dict(model, category=category, unofficial=unofficial)
+                        msst.setdefault(model["name"], []).append(entry)
+
+            vr = {}
+            for path, unofficial in [(UNOFFICIAL_VR_MODEL, True), (VR_MODEL, False)]:
+                # 官方映射后写入，同名时优先使用官方映射
+                for name, model in _load_json(path).items():
+                    vr[name] = dict(model, unofficial=unofficial)
+
+            self._msst, self._msst_categories, self._vr = msst, categories, vr
+            self._models_info = _load_json(MODELS_INFO)
+            self._signature = signature
+            logger.debug(f"Model registry rebuilt: {len(msst)} msst models, {len(vr)} vr models")
+
+    def get_msst(self, model_name: str, model_type: Optional[str] = None) -> Optional[dict]:
+        """
+        返回MSST模型的映射条目（附带 category 和 unofficial），官方映射优先；model_type 为模型分类（如 vocal_models）
+        """
+        self.refresh()
+        with self._lock:
+            entries = self._msst.get(model_name, [])
+        for entry in entries:
+            if model_type is None or entry["category"] == model_type:
+                return entry
+        return None
+
+    def get_vr(self, model_name: str) -> Optional[dict]:
+        self.refresh()
+        with self._lock:
+            return self._vr.get(model_name)
+
+    def get_model_info(self, model_name: str) -> Optional[dict]:
+        """models_info.json 中记录的模型大小和sha256"""
+        self.refresh()
+        with self._lock:
+            return self._models_info.get(model_name)
+
+    def msst_categories(self) -> List[str]:
+        self.refresh()
+        with self._lock:
+            return list(self._msst_categories)
+
+    def find_model_dir(self, category: str) -> Optional[str]:
+        """
+        在几个可能的位置中查找MSST模型分类目录，返回绝对路径
+        """
+        candidates = [
+            os.path.join(MODEL_FOLDER, category),
+            os.path.join(os.getcwd(), MODEL_FOLDER, category),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", MODEL_FOLDER, category),
+        ]
+        for path in candidates:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                return path
+        return None
+
+    def list_files(self, directory: str, extensions) -> List[str]:
+        """目录中指定扩展名的文件，按目录修改时间缓存"""
+        mtime = _mtime(directory)
+        if mtime is None:
+            return []
+        with self._lock:
+            cached = self._dirs.get(directory)
+        if cached is None or cached[0] != mtime:
+            try:
+                files = sorted(os.listdir(directory))
+            except OSError as e:
+                logger.error(f"Error accessing model directory {directory}: {e}")
+                return []
+            cached = (mtime, files)
+            with self._lock:
+                self._dirs[directory] = cached
+        return [f for f in cached[1] if f.endswith(extensions)]
+
+    def downloaded_msst(self, category: Optional[str] = None) -> List[str]:
+        """已下载的MSST模型文件名；指定分类时只返回该分类下在映射中存在的模型"""
+        models = []
+        for name in [category] if category else self.msst_categories():
+            model_dir = self.find_model_dir(name)
+            if not model_dir:
+                continue
+            files = self.list_files(model_dir, MSST_EXTENSIONS)
+            if category:
+                files = [f for f in files if self.get_msst(f, category) is not None]
+            models.extend(files)
+        return models
+
+    def downloaded_vr(self, vr_model_dir: str) -> List[str]:
+        """VR模型目录中在映射中存在的模型文件名"""
+        return [f for f in self.list_files(vr_model_dir, VR_EXTENSIONS) if self.get_vr(f) is not None]
+
+    def _load_file_index(self):
+        if self._file_index is None:
+            self._file_index = _load_json(self.index_file)
+        return self._file_index
+
+    def get_file_info(self, path: str, compute_hash: bool = True) -> Optional[dict]:
+        """
+        模型文件的大小和sha256：{"size": ..., "mtime": ..., "sha256": ...}，文件不存在时返回None
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._load_file_index().get(key)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime and (entry.get("sha256") or not compute_hash):
+            return entry
+
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": None}
+        if compute_hash:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(16 * 1024 * 1024), b""):
+                    h.update(block)
+            entry["sha256"] = h.hexdigest()
+            self._save_file_entry(key, entry)
+        return entry
+
+    def _save_file_entry(self, key, entry):
+        with self._lock:
+            # 其他进程可能已经写入了别的条目，先合并再原子写入
+            index = _load_json(self.index_file)
+            index[key] = entry
+            self._file_index = index
+            try:
+                os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+                tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(index, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_file, self.index_file)
+            except OSError as e:
+                logger.warning(f"Cannot write model index {self.index_file}: {e}")
+
+    def get_file_hash(self, path: str) -> str:
+        return self.get_file_info(path)["sha256"]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """获取全局模型索引，webui、客户端和命令行共用"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -84,9 +84,8 @@ def get_model_from_config(model_type, config_path):
 	return model, config
 
 
-def demix(config, model, mix: NDArray, device, model_type: str = None, callback=None) -> Dict[str, NDArray]:
-	mix = torch.tensor(mix, dtype=torch.float32)
-
+def get_demix_params(config, model_type: str = None):
+	"""Return (chunk_size, step, batch_size, use_fading, fade_size, border) used by the demix engines."""
 	C = config.audio.chunk_size if model_type != "htdemucs" else config.training.samplerate * config.training.segment
 	N = config.inference.num_overlap
 	batch_size = config.inference.batch_size
@@ -99,8 +98,96 @@ def demix(config, model, mix: NDArray, device, model_type: str = None, callback=
 		fade_size = C // 10
 		border = C - step
 	else:
+		fade_size = 0
 		border = 0
 
+	return C, step, batch_size, use_fading, fade_size, border
+
+
+def get_demix_instruments(config, model_type: str = None):
+	"""Return the stems produced by the model, in the order of its output channels."""
+	if model_type != "htdemucs" and config.training.target_instrument is not None:
+		return [config.training.target_instrument]
+	return list(config.training.instruments)
+
+
+def pack_demix_result(config, model_type: str, estimated_sources):
+	# Return the results based on configuration
+	if model_type == "htdemucs":
+		if len(config.training.instruments) > 1:
+			return {k: v for k, v in zip(config.training.instruments, estimated_sources)}
+		else:
+			return estimated_sources
+	else:  # Regular model
+		return {k: v for k, v in zip(get_demix_instruments(config, model_type), estimated_sources)}
+
+
+def get_fade_windows(chunk_size: int, fade_size: int, device="cpu"):
+	"""Return the (start, middle, finish) fade windows used for overlap-add."""
+	fadein = torch.linspace(0, 1, fade_size, device=device)
+	fadeout = torch.linspace(1, 0, fade_size, device=device)
+	window_start = torch.ones(chunk_size, device=device)
+	window_middle = torch.ones(chunk_size, device=device)
+	window_finish = torch.ones(chunk_size, device=device)
+	window_start[-fade_size:] *= fadeout  # First audio chunk, no fadein
+	window_finish[:fade_size] *= fadein  # Last audio chunk, no fadeout
+	window_middle[-fade_size:] *= fadeout
+	window_middle[:fade_size] *= fadein
+	return window_start, window_middle, window_finish
+
+
+def select_fade_window(start: int, step: int, length: int, windows):
+	"""Pick the fade window for the chunk beginning at `start` of a `length` samples track."""
+	window_start, window_middle, window_finish = windows
+	if start == 0:
+		return window_start
+	if start + step >= length:
+		return window_finish
+	return window_middle
+
+
+def get_overlap_add_envelope(length: int, chunk_size: int, step: int, windows=None, device="cpu") -> torch.Tensor:
+	"""
+	Precompute the sum of all windows applied by the overlap-add, so the result
+	can be normalised with a single division instead of an accumulated counter.
+	If `windows` is None, every chunk is weighted with 1 (HTDemucs).
+	"""
+	envelope = torch.zeros(length, dtype=torch.float32)
+	if windows is not None:
+		windows = tuple(w.cpu() for w in windows)
+	for start in range(0, length, step):
+		l = min(chunk_size, length - start)
+		if windows is None:
+			envelope[start : start + l] += 1.0
+		else:
+			envelope[start : start + l] += select_fade_window(start, step, length, windows)[:l]
+	return envelope.to(device)
+
+
+def check_finite_sources(estimated_sources: torch.Tensor, envelope: torch.Tensor):
+	"""
+	Raise if the overlap-added stems contain NaN/Inf. Called before `np.nan_to_num`, which would hide a diverging model,
+	with one device to host sync per track instead of the per-chunk checks inside the model.
+	Samples where the window sum `envelope` is 0 (the zero edges of the fade windows with `num_overlap=1`) are 0/0
+	by construction and left to `np.nan_to_num`, as before.
+	"""
+	covered = estimated_sources[(envelope > 0).expand_as(estimated_sources)]
+	if not torch.isfinite(covered).all():
+		raise RuntimeError(f"NaN/Inf in the separated track: {torch.isnan(covered).sum().item()} NaNs, {torch.isinf(covered).sum().item()} Infs")
+
+
+def demix(config, model, mix: NDArray, device, model_type: str = None, callback=None, accumulate_on_device: bool = False, check_finite: bool = False) -> Dict[str, NDArray]:
+	"""
+	Separate `mix` (channels, length) with chunked overlap-add inference.
+	If `accumulate_on_device` is True, the overlap-add buffer and the fade windows live on `device`,
+	every chunk is weighted with its own fade window and normalised with the precomputed envelope,
+	and the separated stems are copied back to the host only once per track.
+	If `check_finite` is True, a RuntimeError is raised when the separated track contains NaN/Inf.
+	"""
+	mix = torch.tensor(mix, dtype=torch.float32)
+
+	C, step, batch_size, use_fading, fade_size, border = get_demix_params(config, model_type)
+
 	length_init = mix.shape[-1]
 
 	# Apply padding for non-HTDemucs models
@@ -109,33 +196,22 @@ def demix(config, model, mix: NDArray, device, model_type: str = None, callback=
 			mix = mix.unsqueeze(0)  # [1, length]
 		mix = nn.functional.pad(mix, (border, border), mode="reflect")
 
+	accumulate_device = device if accumulate_on_device else "cpu"
+
 	# Prepare windows arrays for non-HTDemucs models
-	if use_fading:
-		window_size = C
-		fadein = torch.linspace(0, 1, fade_size)
-		fadeout = torch.linspace(1, 0, fade_size)
-		window_start = torch.ones(window_size)
-		window_middle = torch.ones(window_size)
-		window_finish = torch.ones(window_size)
-		window_start[-fade_size:] *= fadeout  # First audio chunk, no fadein
-		window_finish[:fade_size] *= fadein  # Last audio chunk, no fadeout
-		window_middle[-fade_size:] *= fadeout
-		window_middle[:fade_size] *= fadein
+	windows = get_fade_windows(C, fade_size, device=accumulate_device) if use_fading else None
 
 	with torch.amp.autocast("cuda", enabled=config.training.get("use_amp", True)):
 		with torch.inference_mode():
 			# Determine the shape of the result based on model type and configuration
-			if model_type == "htdemucs":
-				S = len(config.training.instruments)
-				req_shape = (S,) + tuple(mix.shape)
-			else:
-				if config.training.target_instrument is not None:
-					req_shape = (1,) + tuple(mix.shape)
-				else:
-					req_shape = (len(config.training.instruments),) + tuple(mix.shape)
+			req_shape = (len(get_demix_instruments(config, model_type)),) + tuple(mix.shape)
 
-			result = torch.zeros(req_shape, dtype=torch.float32)
-			counter = torch.zeros(req_shape, dtype=torch.float32)
+			result = torch.zeros(req_shape, dtype=torch.float32, device=accumulate_device)
+			if accumulate_on_device:
+				# Every chunk picks its own fade window, the same as the pipelined, batched and streaming paths
+				counter = get_overlap_add_envelope(mix.shape[1], C, step, windows, device=accumulate_device)
+			else:
+				counter = torch.zeros(req_shape, dtype=torch.float32)
 			i = 0
 			batch_data = []
 			batch_locations = []
@@ -163,8 +239,15 @@ def demix(config, model, mix: NDArray, device, model_type: str = None, callback=
 					for j in range(len(batch_locations)):
 						start, l = batch_locations[j]
 
-						if use_fading:
+						if accumulate_on_device:
+							chunk = x[j][..., :l]
+							if use_fading:
+								chunk = chunk * select_fade_window(start, step, mix.shape[1], windows)[:l]
+							# Normalisation is done once with the precomputed envelope
+							result[..., start : start + l] += chunk
+						elif use_fading:
 							# Apply windowing for regular model
+							window_start, window_middle, window_finish = windows
 							window = window_middle
 							if i - step == 0:  # First audio chunk
 								window = window_start
@@ -189,6 +272,8 @@ def demix(config, model, mix: NDArray, device, model_type: str = None, callback=
 			progress_bar.close()
 
 			estimated_sources = result / counter
+			if check_finite:
+				check_finite_sources(estimated_sources, counter)
 			estimated_sources = estimated_sources.cpu().numpy()
 			np.nan_to_num(estimated_sources, copy=False, nan=0.0)
 
@@ -196,17 +281,7 @@ def demix(config, model, mix: NDArray, device, model_type: str = None, callback=
 			if use_fading and length_init > 2 * border and (border > 0):
 				estimated_sources = estimated_sources[..., border:-border]
 
-	# Return the results based on configuration
-	if model_type == "htdemucs":
-		if len(config.training.instruments) > 1:
-			return {k: v for k, v in zip(config.training.instruments, estimated_sources)}
-		else:
-			return estimated_sources
-	else:  # Regular model
-		if config.training.target_instrument is None:
-			return {k: v for k, v in zip(config.training.instruments, estimated_sources)}
-		else:
-			return {k: v for k, v in zip([config.training.target_instrument], estimated_sources)}
+	return pack_demix_result(config, model_type, estimated_sources)
 
 
 def sdr(references, estimates):
@@ -1,8 +1,6 @@
 __license__= "AGPL-3.0"
 __author__ = "Sucial https://github.com/SUC-DriverOld"
 
-import gradio as gr
-import pandas as pd
 import traceback
 import soundfile as sf
 import numpy as np
@@ -15,6 +13,7 @@ from pydub import AudioSegment
 from utils.constant import *
 from utils.logger import get_logger
 from utils.ensemble import ensemble_audios
+from utils.lazy_import import lazy_import
 from webui.preset import Presets
 from webui.utils import (
     i18n, 
@@ -25,6 +24,9 @@ from webui.utils import (
     logger
 )
 
+gr = lazy_import("gradio")
+pd = lazy_import("pandas")
+
 class EnsembleFlow(Presets):
     def __init__(self, presets={}, force_cpu=False, use_tta=False, logger=get_logger()):
         super().__init__(presets, force_cpu, use_tta, logger)
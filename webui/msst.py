@@ -3,14 +3,15 @@ __author__ = "Sucial https://github.com/SUC-DriverOld"
 
 import shutil
 import time
-import gradio as gr
 import multiprocessing
 import traceback
 
 from utils.constant import *
 from webui.utils import i18n, load_configs, save_configs, load_selected_model, logger, detailed_error
 from webui.init import get_msst_model
-from inference.msst_infer import MSSeparator
+from utils.lazy_import import lazy_import
+
+gr = lazy_import("gradio")
 
 def save_model_config(selected_model, batch_size, num_overlap, chunk_size, normalize):
     _, config_path, _, _ = get_msst_model(selected_model)
@@ -179,6 +180,8 @@ def start_inference(selected_model, input_folder, store_dir, extract_instrumenta
 def run_inference(model_type, config_path, model_path, device, gpu_ids, output_format, use_tta, store_dict, debug, wav_bit_depth, flac_bit_depth, mp3_bit_rate, input_folder, result_queue, skip_existing_files=False):
     logger.debug(f"Start MSST inference process with parameters: model_type={model_type}, config_path={config_path}, model_path={model_path}, device={device}, gpu_ids={gpu_ids}, output_format={output_format}, use_tta={use_tta}, store_dict={store_dict}, debug={debug}, wav_bit_depth={wav_bit_depth}, flac_bit_depth={flac_bit_depth}, mp3_bit_rate={mp3_bit_rate}, input_folder={input_folder}, skip_existing_files={skip_existing_files}")
 
+    from inference.msst_infer import MSSeparator
+
     try:
         separator = MSSeparator(
             model_type=model_type,
@@ -214,6 +217,8 @@ def run_inference_batch(model_type, config_path, model_path, device, gpu_ids, ou
     """
     logger.debug(f"Start MSST batch inference process with parameters: model_type={model_type}, config_path={config_path}, model_path={model_path}, device={device}, gpu_ids={gpu_ids}, output_format={output_format}, use_tta={use_tta}, store_dict={store_dict}, debug={debug}, wav_bit_depth={wav_bit_depth}, flac_bit_depth={flac_bit_depth}, mp3_bit_rate={mp3_bit_rate}, input_folders={input_folders}, skip_existing_files={skip_existing_files}")
 
+    from inference.msst_infer import MSSeparator
+
     try:
         # 创建分离器实例，模型会被缓存
         separator = MSSeparator(
@@ -1,8 +1,6 @@
 __license__= "AGPL-3.0"
 __author__ = "Sucial https://github.com/SUC-DriverOld"
 
-import gradio as gr
-import pandas as pd
 import shutil
 import time
 import multiprocessing
@@ -10,6 +8,7 @@ import multiprocessing
 from utils.constant import *
 from utils.constant import get_cache_dir
 from utils.logger import get_logger
+from utils.lazy_import import lazy_import
 from webui.utils import (
     i18n, 
     load_configs, 
@@ -22,6 +21,9 @@ from webui.utils import (
     detailed_error
 )
 
+gr = lazy_import("gradio")
+pd = lazy_import("pandas")
+
 def get_presets_list() -> list:
     if os.path.exists(PRESETS):
         presets = [file for file in os.listdir(PRESETS) if file.endswith(".json")]
@@ -231,9 +233,16 @@ class Presets:
         return self.presets[step]
 
     def is_exist_models(self):
+        # 已下载的模型列表只获取一次，不再为每一步重新扫描
+        msst_models = set(load_msst_model())
+        vr_models = None
         for step in self.presets:
             model_name = step["model_name"]
-            if model_name not in load_msst_model() and model_name not in load_vr_model():
+            if model_name in msst_models:
+                continue
+            if vr_models is None:
+                vr_models = set(load_vr_model())
+            if model_name not in vr_models:
                 return False, model_name
         return True, None
 
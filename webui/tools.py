@@ -3,14 +3,14 @@ __author__ = "Sucial https://github.com/SUC-DriverOld"
 
 import subprocess
 import numpy as np
-import librosa
 import traceback
-from pydub import AudioSegment
 from tqdm import tqdm
 
 from utils.constant import *
 from webui.utils import i18n, load_configs, save_configs, logger
-from tools.SOME.infer import infer
+from utils.lazy_import import lazy_import
+
+librosa = lazy_import("librosa")
 
 def convert_audio(uploaded_files, output_format, output_folder, sample_rate, channels, wav_bit_depth, flac_bit_depth, mp3_bit_rate, ogg_bit_rate):
     if not uploaded_files:
@@ -88,6 +88,8 @@ def merge_audios(input_folder, output_folder):
     config['tools']['store_dir'] = output_folder
     save_configs(config, WEBUI_CONFIG)
 
+    from pydub import AudioSegment
+
     combined_audio = AudioSegment.empty()
     os.makedirs(output_folder, exist_ok=True)
     output_file = os.path.join(output_folder, f"merged_audio_{os.path.basename(input_folder)}.wav")
@@ -155,6 +157,8 @@ def some_inference(audio_file, bpm, output_dir):
     config['tools']['store_dir'] = output_dir
     save_configs(config, WEBUI_CONFIG)
 
+    from tools.SOME.infer import infer
+
     tempo = float(bpm)
     try:
         logger.info(f"Running SOME inference with audio file: {audio_file}, output dir: {output_dir}, tempo: {tempo}")
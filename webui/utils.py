@@ -5,15 +5,19 @@ import json
 import locale
 import platform
 import yaml
-import tkinter as tk
-import gradio as gr
 import logging
-from tkinter import filedialog
 from ml_collections import ConfigDict
 
 from utils.constant import *
 from utils.logger import get_logger, set_log_level
 from tools.i18n import I18nAuto
+from utils.lazy_import import lazy_import
+from utils.model_registry import get_model_registry
+
+# gradio 和 tkinter 只在界面中使用，延迟导入以加快命令行和推理进程的启动
+gr = lazy_import("gradio")
+tk = lazy_import("tkinter")
+filedialog = lazy_import("tkinter.filedialog")
 
 
 # load and save config files
@@ -207,130 +211,34 @@ def load_selected_model(model_type=None):
         webui_config = load_configs(WEBUI_CONFIG)
         model_type = webui_config["inference"]["model_type"]
     if model_type:
-        downloaded_model = []
-        
-        # 智能路径处理：尝试多种可能的模型目录位置
-        possible_model_dirs = [
-            os.path.join(MODEL_FOLDER, model_type),  # 相对路径
-            os.path.join(os.getcwd(), MODEL_FOLDER, model_type),  # 当前工作目录
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", MODEL_FOLDER, model_type),  # 脚本相对路径
-            os.path.join(os.path.abspath(MODEL_FOLDER), model_type) if os.path.exists(MODEL_FOLDER) else None  # 绝对路径
-        ]
-        
-        # 过滤掉None值
-        possible_model_dirs = [d for d in possible_model_dirs if d is not None]
-        
-        # 尝试各种可能的路径
-        model_dir = None
-        for dir_path in possible_model_dirs:
-            try:
-                normalized_path = os.path.abspath(dir_path)
-                if os.path.exists(normalized_path):
-                    model_dir = normalized_path
-                    logger.debug(f"Found model directory for {model_type}: {model_dir}")
-                    break
-            except Exception as e:
-                logger.debug(f"Failed to check model directory {dir_path}: {e}")
-                continue
-        
-        # Check if model directory exists
-        if not model_dir:
+        if not get_model_registry().find_model_dir(model_type):
             logger.warning(f"Model directory does not exist for type: {model_type}")
-            logger.warning(f"Tried paths: {possible_model_dirs}")
             return []
-        
-        try:
-            for files in os.listdir(model_dir):
-                if files.endswith(('.ckpt', '.th', '.chpt')):
-                    try: 
-                        get_msst_model(files, model_type)
-                        downloaded_model.append(files)
-                    except: 
-                        continue
-        except OSError as e:
-            logger.error(f"Error accessing model directory {model_dir}: {e}")
-            return []
-        
-        return downloaded_model
+        return get_model_registry().downloaded_msst(model_type)
     return []
 
 def load_msst_model():
-    config = load_configs(MSST_MODEL)
-    model_list = []
-    
-    # 为每个模型类型尝试多种可能的路径
-    for keys in config.keys():
-        possible_model_dirs = [
-            os.path.join(MODEL_FOLDER, keys),  # 相对路径
-            os.path.join(os.getcwd(), MODEL_FOLDER, keys),  # 当前工作目录
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", MODEL_FOLDER, keys),  # 脚本相对路径
-            os.path.join(os.path.abspath(MODEL_FOLDER), keys) if os.path.exists(MODEL_FOLDER) else None  # 绝对路径
-        ]
-        
-        # 过滤掉None值
-        possible_model_dirs = [d for d in possible_model_dirs if d is not None]
-        
-        # 尝试各种可能的路径
-        model_dir = None
-        for dir_path in possible_model_dirs:
-            try:
-                normalized_path = os.path.abspath(dir_path)
-                if os.path.exists(normalized_path):
-                    model_dir = normalized_path
-                    logger.debug(f"Found MSST model directory for {keys}: {model_dir}")
-                    break
-            except Exception as e:
-                logger.debug(f"Failed to check MSST model directory {dir_path}: {e}")
-                continue
-        
-        # Check if model directory exists
-        if not model_dir:
+    registry = get_model_registry()
+    for keys in registry.msst_categories():
+        if not registry.find_model_dir(keys):
             logger.warning(f"Model directory does not exist: {keys}")
-            logger.debug(f"Tried paths for {keys}: {possible_model_dirs}")
-            continue
-        
-        try:
-            for files in os.listdir(model_dir):
-                if files.endswith(('.ckpt', '.th', '.chpt')):
-                    model_list.append(files)
-        except OSError as e:
-            logger.error(f"Error accessing model directory {model_dir}: {e}")
-            continue
-    
-    return model_list
+    return registry.downloaded_msst()
 
 def get_msst_model(model_name, model_type=None):
-    config = load_configs(MSST_MODEL)
-    main_link = get_main_link()
-    model_type = [model_type] if model_type else config.keys()
-
-    for keys in model_type:
-        for model in config[keys]:
-            if model["name"] == model_name:
-                model_type = model["model_type"]
-                model_path = os.path.join(MODEL_FOLDER, keys, model_name)
-                config_path = model["config_path"]
-                download_link = model["link"]
-                try:
-                    download_link = download_link.replace("huggingface.co", main_link)
-                except:
-                    pass
-                return model_path, config_path, model_type, download_link
-
-    if os.path.isfile(os.path.join(UNOFFICIAL_MODEL, "unofficial_msst_model.json")):
-        unofficial_config = load_configs(os.path.join(UNOFFICIAL_MODEL, "unofficial_msst_model.json"))
-        for keys in model_type:
-            for model in unofficial_config[keys]:
-                if model["name"] == model_name:
-                    model_type = model["model_type"]
-                    model_path = os.path.join(MODEL_FOLDER, keys, model_name)
-                    config_path = model["config_path"]
-                    download_link = model["link"]
-                    return model_path, config_path, model_type, download_link
-    raise gr.Error(i18n("模型不存在!"))
+    model = get_model_registry().get_msst(model_name, model_type)
+    if model is None:
+        raise gr.Error(i18n("模型不存在!"))
+
+    model_path = os.path.join(MODEL_FOLDER, model["category"], model_name)
+    download_link = model["link"]
+    if not model["unofficial"]:
+        try:
+            download_link = download_link.replace("huggingface.co", get_main_link())
+        except:
+            pass
+    return model_path, model["config_path"], model["model_type"], download_link
 
 def load_vr_model():
-    downloaded_model = []
     config = load_configs(WEBUI_CONFIG)
     vr_model_path = config['settings']['uvr_model_dir']
     
@@ -388,47 +296,26 @@ def load_vr_model():
         logger.warning(f"Failed to update config with new VR model path: {e}")
     
     # 扫描模型文件
-    try:
-        for files in os.listdir(final_vr_model_path):
-            if files.endswith('.pth'):
-                try: 
-                    get_vr_model(files)
-                    downloaded_model.append(files)
-                except: 
-                    continue
-    except OSError as e:
-        logger.error(f"Error accessing VR model directory {final_vr_model_path}: {e}")
-        raise gr.Error(i18n(f"无法访问VR模型目录: {final_vr_model_path}. 错误: {e}"))
-    
-    return downloaded_model
+    if not os.access(final_vr_model_path, os.R_OK):
+        logger.error(f"Error accessing VR model directory {final_vr_model_path}")
+        raise gr.Error(i18n(f"无法访问VR模型目录: {final_vr_model_path}"))
+    return get_model_registry().downloaded_vr(final_vr_model_path)
 
 def get_vr_model(model):
-    config = load_configs(VR_MODEL)
+    vr_model = get_model_registry().get_vr(model)
+    if vr_model is None:
+        raise gr.Error(i18n("模型不存在!"))
+
     model_path = load_configs(WEBUI_CONFIG)['settings']['uvr_model_dir']
     if isinstance(model_path, str):
         model_path = model_path.replace('\\\\', '/').replace('\\', '/')
-    main_link = get_main_link()
-
-    for keys in config.keys():
-        if keys == model:
-            primary_stem = config[keys]["primary_stem"]
-            secondary_stem = config[keys]["secondary_stem"]
-            model_url = config[keys]["download_link"]
-            try:
-                model_url = model_url.replace("huggingface.co", main_link)
-            except: 
-                pass
-            return primary_stem, secondary_stem, model_url, model_path
-
-    if os.path.isfile(os.path.join(UNOFFICIAL_MODEL, "unofficial_vr_model.json")):
-        unofficial_config = load_configs(os.path.join(UNOFFICIAL_MODEL, "unofficial_vr_model.json"))
-        for keys in unofficial_config.keys():
-            if keys == model:
-                primary_stem = unofficial_config[keys]["primary_stem"]
-                secondary_stem = unofficial_config[keys]["secondary_stem"]
-                model_url = unofficial_config[keys]["download_link"]
-                return primary_stem, secondary_stem, model_url, model_path
-    raise gr.Error(i18n("模型不存在!"))
+    model_url = vr_model["download_link"]
+    if not vr_model["unofficial"]:
+        try:
+            model_url = model_url.replace("huggingface.co", get_main_link())
+        except:
+            pass
+    return vr_model["primary_stem"], vr_model["secondary_stem"], model_url, model_path
 
 
 # get model size and sha256 according to model name and model_info.json
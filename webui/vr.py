@@ -3,13 +3,14 @@ __author__ = "Sucial https://github.com/SUC-DriverOld"
 
 import shutil
 import time
-import gradio as gr
 import multiprocessing
 import traceback
 
 from utils.constant import *
 from webui.utils import i18n, get_vr_model, load_configs, save_configs, logger, detailed_error
-from modules.vocal_remover.separator import Separator
+from utils.lazy_import import lazy_import
+
+gr = lazy_import("gradio")
 
 def load_vr_model_stem(model):
     primary_stem, secondary_stem, _, _= get_vr_model(model)
@@ -112,6 +113,8 @@ def start_inference(vr_select_model, vr_window_size, vr_aggression, vr_output_fo
 def run_inference(debug, model_file, output_dir, output_format, invert_using_spec, use_cpu, batch_size, window_size, aggression, enable_tta, enable_post_process, post_process_threshold, high_end_process, wav_bit_depth, flac_bit_depth, mp3_bit_rate, input_folder, result_queue, skip_existing_files=False):
     logger.debug(f"Start VR inference process with parameters: debug={debug}, model_file={model_file}, output_dir={output_dir}, output_format={output_format}, invert_using_spec={invert_using_spec}, use_cpu={use_cpu}, batch_size={batch_size}, window_size={window_size}, aggression={aggression}, enable_tta={enable_tta}, enable_post_process={enable_post_process}, post_process_threshold={post_process_threshold}, high_end_process={high_end_process}, wav_bit_depth={wav_bit_depth}, flac_bit_depth={flac_bit_depth}, mp3_bit_rate={mp3_bit_rate}, input_folder={input_folder}, skip_existing_files={skip_existing_files}")
 
+    from modules.vocal_remover.separator import Separator
+
     try:
         separator = Separator(
             logger=logger,